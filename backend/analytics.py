@@ -0,0 +1,190 @@
+# backend/analytics.py
+"""
+Quiz analytics computed with SQL aggregates.
+
+Everything here groups and counts in the database; attempts and answers are
+never loaded into Python, so the cost of a report grows with the number of
+questions and choices, not with the number of students who took the quiz.
+Only submitted attempts are counted.
+"""
+import math
+import logging
+
+from sqlalchemy import func, case
+
+from database import db, Question, Choice, StudentQuizAttempt, StudentAnswer
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BUCKETS = 10 # 0-10, 10-20, ..., 90-100
+PERCENTILES = (10, 25, 50, 75, 90)
+DISCRIMINATION_GROUP_SHARE = 0.27 # Upper/lower group size for the discrimination index (Kelley's 27%)
+
+
+def _submitted_attempts(quiz_id):
+    return db.select(StudentQuizAttempt).filter(
+        StudentQuizAttempt.quiz_id == quiz_id, StudentQuizAttempt.submitted_at != None
+    )
+
+def _ranked_attempts(quiz_id):
+    """Submitted attempts with their 1-based rank by ascending score (ties broken by id for a stable order)."""
+    return (
+        db.select(
+            StudentQuizAttempt.id.label("attempt_id"),
+            func.coalesce(StudentQuizAttempt.score, 0.0).label("score"),
+            func.row_number().over(order_by=(func.coalesce(StudentQuizAttempt.score, 0.0), StudentQuizAttempt.id)).label("rank"),
+        )
+        .filter(StudentQuizAttempt.quiz_id == quiz_id, StudentQuizAttempt.submitted_at != None)
+        .subquery()
+    )
+
+def score_summary(quiz_id):
+    attempts = _submitted_attempts(quiz_id).subquery()
+    row = db.session.execute(
+        db.select(
+            func.count(attempts.c.id).label("count"), func.avg(attempts.c.score).label("average"),
+            func.min(attempts.c.score).label("minimum"), func.max(attempts.c.score).label("maximum"),
+            func.avg(attempts.c.score * attempts.c.score).label("mean_square"),
+        )
+    ).one()
+    stddev = None
+    if row.count:
+        stddev = math.sqrt(max(0.0, (row.mean_square or 0.0) - (row.average or 0.0) ** 2))
+    return {
+        "attempt_count": row.count, "average": row.average, "min": row.minimum, "max": row.maximum, "stddev": stddev,
+    }
+
+def score_histogram(quiz_id):
+    """Attempt counts per 10-point score bucket; the last bucket includes 100."""
+    width = 100 / HISTOGRAM_BUCKETS
+    score = func.coalesce(StudentQuizAttempt.score, 0.0)
+    # CASE ladder instead of FLOOR(): portable across SQLite and PostgreSQL
+    bucket = case(*[(score >= width * b, b) for b in range(HISTOGRAM_BUCKETS - 1, 0, -1)], else_=0)
+    rows = db.session.execute(
+        db.select(bucket.label("bucket"), func.count().label("count"))
+        .filter(StudentQuizAttempt.quiz_id == quiz_id, StudentQuizAttempt.submitted_at != None)
+        .group_by(bucket)
+    ).all()
+    counts = {row.bucket: row.count for row in rows}
+    return [
+        {"from": round(width * b, 2), "to": round(width * (b + 1), 2), "count": counts.get(b, 0)}
+        for b in range(HISTOGRAM_BUCKETS)
+    ]
+
+def score_percentiles(quiz_id, attempt_count):
+    """Linear-interpolated percentiles. Fetches only the (at most two) ranked scores each percentile needs."""
+    if not attempt_count:
+        return {f"p{p}": None for p in PERCENTILES}
+    positions = {p: (p / 100) * (attempt_count - 1) for p in PERCENTILES} # 0-based fractional rank
+    needed = set()
+    for pos in positions.values():
+        needed.update({math.floor(pos) + 1, math.ceil(pos) + 1})
+    ranked = _ranked_attempts(quiz_id)
+    scores = dict(db.session.execute(
+        db.select(ranked.c.rank, ranked.c.score).filter(ranked.c.rank.in_(needed))
+    ).all())
+    result = {}
+    for p, pos in positions.items():
+        low, high = scores[math.floor(pos) + 1], scores[math.ceil(pos) + 1]
+        result[f"p{p}"] = low + (high - low) * (pos - math.floor(pos))
+    return result
+
+def question_statistics(quiz_id, attempt_count):
+    """
+    Per-question correctness rate and discrimination index.
+    The discrimination index is the difference in correctness rate between the top and bottom
+    27% of attempts by total score (-1..1; higher means the question separates strong from weak students).
+    """
+    group_size = max(1, round(attempt_count * DISCRIMINATION_GROUP_SHARE)) if attempt_count >= 2 else 0
+    ranked = _ranked_attempts(quiz_id)
+    correct = case((StudentAnswer.is_correct == True, 1), else_=0)
+    in_lower = ranked.c.rank <= group_size
+    in_upper = ranked.c.rank > attempt_count - group_size
+    rows = db.session.execute(
+        db.select(
+            StudentAnswer.question_id,
+            func.count(StudentAnswer.id).label("answered"),
+            func.sum(correct).label("correct"),
+            func.sum(case((in_upper, correct), else_=0)).label("upper_correct"),
+            func.sum(case((in_lower, correct), else_=0)).label("lower_correct"),
+        )
+        .join(ranked, ranked.c.attempt_id == StudentAnswer.attempt_id)
+        .group_by(StudentAnswer.question_id)
+    ).all()
+    stats = {}
+    for row in rows:
+        stats[row.question_id] = {
+            "answered": row.answered,
+            "correct": row.correct or 0,
+            "correct_rate": (row.correct or 0) / row.answered if row.answered else None,
+            "discrimination_index": ((row.upper_correct or 0) - (row.lower_correct or 0)) / group_size if group_size else None,
+        }
+    return stats
+
+def answer_distribution(quiz_id):
+    """
+    {question_id: {choice_id or answer_text: count}} over submitted attempts, grouped in SQL.
+    Answers with a choice_id are counted under the id; older text-only answers under their text.
+    """
+    answer = func.coalesce(StudentAnswer.choice_id, StudentAnswer.answer_text)
+    rows = db.session.execute(
+        db.select(StudentAnswer.question_id, answer.label("answer"), func.count(StudentAnswer.id).label("count"))
+        .join(StudentQuizAttempt, StudentQuizAttempt.id == StudentAnswer.attempt_id)
+        .filter(StudentQuizAttempt.quiz_id == quiz_id, StudentQuizAttempt.submitted_at != None)
+        .group_by(StudentAnswer.question_id, answer)
+    ).all()
+    distribution = {}
+    for row in rows:
+        distribution.setdefault(row.question_id, {})[row.answer] = row.count
+    return distribution
+
+def compute_quiz_analytics(quiz):
+    """Full analytics report for a quiz. A fixed number of queries regardless of attempt count."""
+    summary = score_summary(quiz.id)
+    attempt_count = summary["attempt_count"]
+
+    questions = db.session.execute(
+        db.select(Question.id, Question.question_text, Question.question_type, Question.order_index)
+        .filter(Question.quiz_id == quiz.id).order_by(Question.order_index)
+    ).all()
+    choices = {}
+    for choice in db.session.execute(
+        db.select(Choice.id, Choice.question_id, Choice.choice_text, Choice.is_correct)
+        .join(Question, Question.id == Choice.question_id).filter(Question.quiz_id == quiz.id)
+    ).all():
+        choices.setdefault(choice.question_id, []).append(choice)
+
+    item_stats = question_statistics(quiz.id, attempt_count) if attempt_count else {}
+    distribution = answer_distribution(quiz.id) if attempt_count else {}
+
+    question_reports = []
+    for question in questions:
+        stats = item_stats.get(question.id, {"answered": 0, "correct": 0, "correct_rate": None, "discrimination_index": None})
+        answers = dict(distribution.get(question.id, {}))
+        answered = stats["answered"]
+        choice_reports = []
+        for choice in choices.get(question.id, []):
+            count = answers.pop(choice.id, 0) + answers.pop(choice.choice_text, 0)
+            choice_reports.append({
+                "id": choice.id, "choice_text": choice.choice_text, "is_correct": choice.is_correct,
+                "count": count, "share": count / answered if answered else None,
+            })
+        unanswered = answers.pop(None, 0) + answers.pop("", 0)
+        question_reports.append({
+            "id": question.id, "question_text": question.question_text, "question_type": question.question_type,
+            "order_index": question.order_index, **stats,
+            "choices": choice_reports,
+            "unanswered": unanswered,
+            "other_answers": sum(answers.values()), # Free text or answers to choices that were later edited
+        })
+
+    logger.info(f"Computed analytics for quiz {quiz.id}: {attempt_count} attempts, {len(questions)} questions")
+    return {
+        "quiz_id": quiz.id,
+        "title": quiz.title,
+        "question_count": len(questions),
+        "summary": summary,
+        "percentiles": score_percentiles(quiz.id, attempt_count),
+        "score_histogram": score_histogram(quiz.id),
+        "questions": question_reports,
+    }
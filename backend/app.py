@@ -1,13 +1,13 @@
 # backend/app.py
 import os
-import uuid
 import traceback
 import json
+import uuid
 import random
 # --- Ensure timedelta is imported ---
 from datetime import datetime, timezone, timedelta
 # --- End Ensure ---
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_jwt_extended import (
     JWTManager, create_access_token, jwt_required, get_jwt_identity,
     create_refresh_token, get_jwt, verify_jwt_in_request
@@ -24,8 +24,27 @@ load_dotenv()
 
 # --- Database and Utils Imports ---
 try:
-    from database import db, init_db, User, Material, Prompt, Quiz, Question, Choice, StudentQuizAttempt, StudentAnswer
-    from utils import extract_text, summarize_text, generate_ai_response, construct_final_prompt, MAX_CHARS_FOR_QUIZ_CONTEXT
+    from database import db, init_db, User, Material, Prompt, Quiz, Question, StudentQuizAttempt, StudentAnswer
+    from utils import (
+        generate_ai_response, stream_ai_response, construct_final_prompt, CHAT_MAX_TOKENS,
+        get_compiled_prompt, render_compiled_prompt, invalidate_compiled_prompt, invalidate_compiled_prompts_for_material
+    )
+    from jobs import JobRunner
+    from ingestion import enqueue_material_ingestion
+    from feedback import (
+        generate_feedback_cached, get_cached_feedback, store_feedback_in_cache,
+        enqueue_attempt_feedback, FEEDBACK_MODE, FEEDBACK_MODES
+    )
+    from storage import save_upload, discard_upload, find_processed_duplicate, release_material_file
+    from retrieval import index_material, invalidate_material_index, sample_context
+    from queries import list_published_quizzes_for_student, get_student_quiz_payload
+    from analytics import compute_quiz_analytics
+    from quiz_writer import prepare_question_rows, insert_question_rows, sync_questions
+    from rollups import record_attempt as record_attempt_rollups, rebuild_rollups, teacher_overview
+    from grading import get_answer_key, grade_answer, correct_answer_text
+    from instrumentation import init_instrumentation
+    from prompt_budget import prompt_token_budget, trim_to_tokens
+    from llm_gateway import PRIORITY_INTERACTIVE, PRIORITY_NORMAL
 except ImportError as e:
     logging.critical(f"CRITICAL ERROR - Failed to import database or utils: {e}", exc_info=True)
     raise e
@@ -59,6 +78,8 @@ app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
 logger.info(f"Upload folder configured: {UPLOAD_FOLDER}")
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'ppt', 'pptx'}
+QUIZ_GENERATION_CACHE_TTL = int(os.getenv("QUIZ_GENERATION_CACHE_TTL", str(24 * 3600))) # Seconds a generated question set is reused
+QUIZ_CONTEXT_MAX_TOKENS = int(os.getenv("QUIZ_CONTEXT_MAX_TOKENS", "7500")) # Material text sent for quiz generation (cost cap)
 
 # --- Initialize Extensions ---
 try:
@@ -74,10 +95,22 @@ try:
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True); logger.info(f"Upload directory exists/created: {app.config['UPLOAD_FOLDER']}")
 except OSError as e: logger.exception(f"CRITICAL ERROR - Could not create upload directory {app.config['UPLOAD_FOLDER']}")
 
+# Background job workers (material ingestion etc.). Started lazily on the first request so
+# CLI commands like `flask db upgrade` don't spin up workers against an unmigrated schema.
+job_runner = JobRunner(app)
+
 # --- Helper Functions ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _has_question_array(ai_response_text):
+    """True if the text contains a non-empty JSON array (what quiz generation expects from the AI)."""
+    start, end = ai_response_text.find('['), ai_response_text.rfind(']') + 1
+    if start < 0 or end <= start: return False
+    try: parsed = json.loads(ai_response_text[start:end])
+    except json.JSONDecodeError: return False
+    return isinstance(parsed, list) and len(parsed) > 0
+
 # --- JWT Loaders ---
 @jwt.additional_claims_loader
 def add_claims_to_access_token(identity):
@@ -87,10 +120,16 @@ def add_claims_to_access_token(identity):
      logger.warning(f"JWT Claims Loader: User not found for ID {identity}"); return {}
 
 # --- Before Request Hook ---
+init_instrumentation(app) # Per-request SQL/AI timing: Server-Timing headers and /metrics
+
 @app.before_request
 def log_request_info():
     logger.debug(f"Request Received: {request.method} {request.path} from {request.remote_addr}")
 
+@app.before_request
+def start_background_workers():
+    job_runner.ensure_started()
+
 # --- Demo routes: health, index, favicon ---
 import os
 from datetime import datetime, timezone
@@ -177,6 +216,26 @@ def require_role(role_name):
         return wrapper
     return decorator
 
+# --- Server-Sent Events ---
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def sse_ai_response(system_prompt, user_prompt, log_label):
+    """
+    Streams an AI answer as text/event-stream: 'token' events with {"text": ...} as deltas arrive,
+    then a final 'done' event with {"usage": ...} or an 'error' event with {"error": ...}.
+    """
+    def generate():
+        yield ": stream open\n\n" # Comment line: flushes headers so the client sees the first byte at once
+        for kind, value in stream_ai_response(system_prompt, user_prompt, priority=PRIORITY_INTERACTIVE):
+            if kind == "token": yield _sse_event("token", {"text": value})
+            elif kind == "usage": logger.info(f"{log_label}: streamed response complete. Usage: {value}"); yield _sse_event("done", {"usage": value})
+            else: logger.error(f"{log_label}: streamed generation failed: {value}"); yield _sse_event("error", {"error": value or "AI generation failed."})
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Stop reverse proxies from buffering the stream
+    # The prompt is resolved: release the read transaction and pooled connection now, not at teardown after the stream
+    db.session.close()
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
 # --- Authentication Routes ---
 @app.route("/api/register", methods=["POST"])
 def register():
@@ -286,38 +345,55 @@ def upload_material():
     logger.info(f"Upload '{original_filename}' from {user_id}")
 
     if file and allowed_file(original_filename):
-        unique_filename = f"{uuid.uuid4()}.{original_filename.rsplit('.', 1)[1].lower()}"
+        extension = original_filename.rsplit('.', 1)[1].lower()
         relative_folder = os.getenv("UPLOAD_FOLDER", "storage/uploads")
-        relative_filepath = os.path.join(relative_folder, unique_filename)
-        full_filepath = os.path.join(BASE_DIR, relative_filepath)
+        relative_filepath = None
         try:
-            os.makedirs(os.path.dirname(full_filepath), exist_ok=True)
-            file.save(full_filepath)
-            logger.info(f"Saved to: {full_filepath}")
-
-            extracted_text = extract_text(full_filepath, unique_filename)
-            summary = summarize_text(extracted_text) if extracted_text else ""
+            # Hashes while saving; identical content reuses the already stored file (see storage.py)
+            content_hash, relative_filepath = save_upload(file, BASE_DIR, relative_folder, extension)
+            logger.info(f"Saved to: {relative_filepath}")
 
-            new_material = Material(user_id=user_id, filename=original_filename, filepath=relative_filepath, extracted_text=extracted_text, summary=summary)
+            new_material = Material(user_id=user_id, filename=original_filename, filepath=relative_filepath, content_hash=content_hash)
             db.session.add(new_material)
+            db.session.flush()
+            duplicate = find_processed_duplicate(content_hash, exclude_id=new_material.id)
+            if duplicate:
+                # Same content was already extracted and summarized: reuse instead of recomputing
+                new_material.extracted_text = duplicate.extracted_text
+                new_material.summary = duplicate.summary
+                new_material.status = 'ready'
+                index_material(new_material)
+                db.session.commit()
+                logger.info(f"Material record created for {original_filename}, reused results of material {duplicate.id}")
+                return jsonify(new_material.to_dict()), 201
+
+            # Extraction and summarization run in the background job queue (see ingestion.py)
+            enqueue_material_ingestion(new_material)
             db.session.commit()
-            logger.info(f"Material record created for {original_filename}")
+            job_runner.notify()
+            logger.info(f"Material record created for {original_filename}, ingestion queued")
             
-            return jsonify(new_material.to_dict()), 201
+            return jsonify(new_material.to_dict()), 202
         except Exception as e:
             db.session.rollback()
             logger.exception(f"Error upload processing {original_filename}: {e}")
-            if os.path.exists(full_filepath):
-                 try:
-                     os.remove(full_filepath)
-                     logger.info(f"Cleaned up: {full_filepath}")
-                 except OSError as rm_err:
-                     logger.error(f"Cleanup failed {full_filepath}: {rm_err}")
+            if relative_filepath:
+                discard_upload(BASE_DIR, relative_filepath)
             return jsonify({"error": "Αποτυχία επεξεργασίας του αρχείου."}), 500
     else:
         logger.warning(f"File type not allowed: {original_filename}")
         return jsonify({"error": "Ο τύπος αρχείου δεν επιτρέπεται"}), 400
 
+@app.route("/api/materials/<string:material_id>/status", methods=["GET"])
+@jwt_required()
+@require_role("teacher")
+def get_material_status(material_id):
+    user_id = get_jwt_identity()
+    material = db.session.execute(db.select(Material).filter_by(id=material_id, user_id=user_id)).scalar_one_or_none()
+    if not material:
+        return jsonify({"error": "Το υλικό δεν βρέθηκε ή δεν έχετε δικαίωμα πρόσβασης"}), 404
+    return jsonify(material.status_dict()), 200
+
 @app.route("/api/materials/<string:material_id>", methods=["DELETE"])
 @jwt_required()
 @require_role("teacher")
@@ -330,15 +406,18 @@ def delete_material(material_id):
         if not material:
             return jsonify({"error": "Το υλικό δεν βρέθηκε ή δεν έχετε δικαίωμα πρόσβασης"}), 404
         
-        full_filepath = os.path.join(BASE_DIR, material.filepath)
         material_name = material.filename
-        
-        if os.path.exists(full_filepath):
-            os.remove(full_filepath)
-            logger.info(f"Deleted file: {full_filepath}")
+        # The file on disk may be shared with identical uploads; only the last reference removes it
+        full_filepath = release_material_file(material, BASE_DIR)
 
         db.session.delete(material)
         db.session.commit()
+        invalidate_material_index(material_id)
+        invalidate_compiled_prompts_for_material(material_id)
+
+        if full_filepath and os.path.exists(full_filepath):
+            os.remove(full_filepath)
+            logger.info(f"Deleted file: {full_filepath}")
         logger.info(f"Deleted material record {material_name} ({material_id})")
         
         return jsonify({"message": "Το υλικό διαγράφηκε"}), 200
@@ -422,6 +501,7 @@ def update_prompt(prompt_id):
 
     try:
         db.session.commit()
+        invalidate_compiled_prompt(prompt_id)
         return jsonify(prompt.to_dict(include_structure=False)),200
     except Exception as e:
         db.session.rollback()
@@ -463,29 +543,15 @@ def delete_prompt(prompt_id):
         return jsonify({"error":"Not found/auth"}),404
     db.session.delete(prompt)
     db.session.commit()
+    invalidate_compiled_prompt(prompt_id)
     return jsonify({"message":"Prompt deleted"}),200
 
-# --- MODIFIED Teacher Sandbox Route ---
-@app.route("/api/generate", methods=["POST"])
-@jwt_required()
-@require_role("teacher") # Ensure only teachers can use this
-def generate_test_response():
-    logger.info("--- /api/generate [POST] Teacher Sandbox ---")
-    user_id = get_jwt_identity() # Correct way to get teacher's ID
-    
-    if not request.is_json:
-        logger.warning("Sandbox: Request is not JSON")
-        return jsonify({"error": "Request must be JSON"}), 415
-    
-    data = request.get_json()
-    if data is None:
-        logger.warning("Sandbox: No JSON data received")
-        return jsonify({"error": "Invalid JSON data received."}), 400
-
+def _resolve_sandbox_prompt(user_id, data):
+    """Resolves the sandbox payload into (system_prompt, user_prompt, None) or (None, None, error_response)."""
     user_test_prompt = data.get("user_prompt")
     if not user_test_prompt:
         logger.warning("Sandbox: Missing user_prompt from payload")
-        return jsonify({"error": "User test prompt is required"}), 400
+        return None, None, (jsonify({"error": "User test prompt is required"}), 400)
 
     prompt_structure = data.get("prompt_structure") # Structure directly from canvas
     prompt_id_for_test = data.get("prompt_id")       # ID of a loaded (and possibly saved) prompt
@@ -494,10 +560,12 @@ def generate_test_response():
 
     if prompt_structure and isinstance(prompt_structure, list) and len(prompt_structure) > 0:
         logger.info("Sandbox: Constructing system prompt from provided LIVE structure.")
-        system_prompt_to_use, _ = construct_final_prompt(prompt_structure, "") # construct_final_prompt resolves material placeholders
+        # construct_final_prompt resolves material placeholders; passing the test prompt retrieves the
+        # same material passages a student asking this question would get
+        system_prompt_to_use, _ = construct_final_prompt(prompt_structure, user_test_prompt)
         if system_prompt_to_use.startswith("Error:"):
             logger.error(f"Sandbox: Error constructing system prompt from live structure: {system_prompt_to_use}")
-            return jsonify({"error": "Failed to process prompt structure for testing."}), 400
+            return None, None, (jsonify({"error": "Failed to process prompt structure for testing."}), 400)
     elif prompt_id_for_test:
         logger.info(f"Sandbox: Using saved Prompt ID: {prompt_id_for_test} as structure might be empty/not primary.")
         # Ensure the prompt belongs to the current teacher for security
@@ -515,22 +583,44 @@ def generate_test_response():
                  system_prompt_to_use, _ = construct_final_prompt(prompt_obj.structure, "")
                  if system_prompt_to_use.startswith("Error:"):
                     logger.error(f"Sandbox: Error reconstructing system prompt from saved structure {prompt_id_for_test}: {system_prompt_to_use}")
-                    return jsonify({"error": "Failed to process saved prompt structure for testing."}), 400
+                    return None, None, (jsonify({"error": "Failed to process saved prompt structure for testing."}), 400)
             else:
                  logger.warning(f"Sandbox: Saved prompt {prompt_id_for_test} has no system_prompt or structure.")
-                 return jsonify({"error": "Loaded prompt has no content to test."}), 400
+                 return None, None, (jsonify({"error": "Loaded prompt has no content to test."}), 400)
         else:
             logger.warning(f"Sandbox: Prompt ID {prompt_id_for_test} not found or not owned by user {user_id}.")
-            return jsonify({"error": "Prompt not found for testing."}), 404
+            return None, None, (jsonify({"error": "Prompt not found for testing."}), 404)
     else:
         # This case should ideally not be reached if frontend ensures either structure or ID is sent
         # if blocks are present or a prompt is "loaded".
         logger.warning("Sandbox: No prompt_structure or valid prompt_id provided for testing.")
-        return jsonify({"error": "No prompt instructions available to test."}), 400
+        return None, None, (jsonify({"error": "No prompt instructions available to test."}), 400)
+
+    return system_prompt_to_use, user_test_prompt, None
+
+# --- MODIFIED Teacher Sandbox Route ---
+@app.route("/api/generate", methods=["POST"])
+@jwt_required()
+@require_role("teacher") # Ensure only teachers can use this
+def generate_test_response():
+    logger.info("--- /api/generate [POST] Teacher Sandbox ---")
+    user_id = get_jwt_identity() # Correct way to get teacher's ID
+    
+    if not request.is_json:
+        logger.warning("Sandbox: Request is not JSON")
+        return jsonify({"error": "Request must be JSON"}), 415
     
+    data = request.get_json()
+    if data is None:
+        logger.warning("Sandbox: No JSON data received")
+        return jsonify({"error": "Invalid JSON data received."}), 400
+
+    system_prompt_to_use, user_test_prompt, error_response = _resolve_sandbox_prompt(user_id, data)
+    if error_response: return error_response
+
     logger.debug(f"Sandbox System Prompt for AI (len {len(system_prompt_to_use)}): {system_prompt_to_use[:300]}...")
     try:
-        ai_response, usage = generate_ai_response(system_prompt_to_use, user_test_prompt)
+        ai_response, usage = generate_ai_response(system_prompt_to_use, user_test_prompt, priority=PRIORITY_INTERACTIVE)
         if usage is not None:
             logger.info("Sandbox: AI response generated successfully.")
             return jsonify({"response": ai_response, "usage": usage}), 200
@@ -542,6 +632,24 @@ def generate_test_response():
          return jsonify({"error": "Server error occurred during AI generation."}), 500
 
 
+@app.route("/api/generate/stream", methods=["POST"])
+@jwt_required()
+@require_role("teacher")
+def generate_test_response_stream():
+    """Streaming variant of /api/generate (Server-Sent Events)."""
+    logger.info("--- /api/generate/stream [POST] Teacher Sandbox ---")
+    user_id = get_jwt_identity()
+    if not request.is_json: logger.warning("Sandbox stream: Request is not JSON"); return jsonify({"error": "Request must be JSON"}), 415
+    data = request.get_json()
+    if data is None: logger.warning("Sandbox stream: No JSON data received"); return jsonify({"error": "Invalid JSON data received."}), 400
+    try:
+        system_prompt_to_use, user_test_prompt, error_response = _resolve_sandbox_prompt(user_id, data)
+    except Exception as e:
+        logger.exception(f"Sandbox stream: Unexpected error preparing prompt: {e}"); return jsonify({"error": "Server error occurred during AI generation."}), 500
+    if error_response: return error_response
+    return sse_ai_response(system_prompt_to_use, user_test_prompt, "Sandbox")
+
+
 # --- Quiz Generation Route (Teacher) ---
 @app.route("/api/generate/quiz", methods=["POST"])
 @jwt_required()
@@ -571,8 +679,11 @@ def generate_quiz_questions():
     num_questions = data.get("num_questions", 5)
     # question_types = data.get("question_types", ["mcq"]) # Currently only actively supporting mcq for AI gen
     difficulty = data.get("difficulty", "medium")
+    fresh = bool(data.get("fresh", False)) # True: skip the response cache and sample a new set of questions
 
     context_for_ai = ""
+    # The instructions around the context fit in the budget's reserve; the reply gets CHAT_MAX_TOKENS
+    context_budget = min(QUIZ_CONTEXT_MAX_TOKENS, prompt_token_budget("", CHAT_MAX_TOKENS))
     if material_id:
         logger.info(f"Quiz Gen: Attempting to use Material ID: {material_id} for teacher {user_id}")
         # Ensure the material belongs to the teacher making the request
@@ -582,10 +693,9 @@ def generate_quiz_questions():
 
         if material_obj:
             if material_obj.extracted_text and material_obj.extracted_text.strip():
-                context_for_ai = material_obj.extracted_text[:MAX_CHARS_FOR_QUIZ_CONTEXT]
-                logger.info(f"Using extracted text (len {len(context_for_ai)}) from material '{material_obj.filename}' for quiz generation.")
-                if len(material_obj.extracted_text) > MAX_CHARS_FOR_QUIZ_CONTEXT:
-                    logger.warning(f"Material '{material_obj.filename}' text (original len {len(material_obj.extracted_text)}) was truncated for quiz generation context.")
+                # Chunks sampled across the whole material rather than only its first characters
+                context_for_ai = sample_context(material_obj.id, context_budget)
+                logger.info(f"Using {len(context_for_ai)} chars sampled from material '{material_obj.filename}' (original len {len(material_obj.extracted_text)}) for quiz generation.")
             else:
                 logger.warning(f"Material {material_id} (owned by {user_id}) has no extracted text.");
                 return jsonify({"error": "Selected material has no text content to process."}), 400
@@ -594,9 +704,9 @@ def generate_quiz_questions():
             return jsonify({"error": "Material not found or you do not have permission to use it."}), 404 # Or 403 if preferred
     elif context_text_from_frontend:
         logger.info("Quiz Gen: Using custom text context provided by frontend.")
-        context_for_ai = context_text_from_frontend[:MAX_CHARS_FOR_QUIZ_CONTEXT]
-        if len(context_text_from_frontend) > MAX_CHARS_FOR_QUIZ_CONTEXT:
-             logger.warning(f"Custom text context (original len {len(context_text_from_frontend)}) truncated for quiz generation.")
+        context_for_ai = trim_to_tokens(context_text_from_frontend, context_budget)
+        if len(context_for_ai) < len(context_text_from_frontend):
+             logger.warning(f"Custom text context (original len {len(context_text_from_frontend)}) truncated to {context_budget} tokens for quiz generation.")
     else:
         logger.warning("Quiz Gen: Missing material_id or context_text for quiz generation.")
         return jsonify({"error": "Either select a material or provide custom text for context."}), 400
@@ -636,7 +746,10 @@ JSON Output:
     try:
         ai_response_text, usage = generate_ai_response(
             system_prompt="You are an AI assistant specialized in creating educational quiz questions in JSON format. Adhere strictly to the requested JSON structure and ensure the output is ONLY the JSON array.",
-            user_prompt=generation_prompt
+            user_prompt=generation_prompt,
+            priority=PRIORITY_NORMAL,
+            cache_ttl=QUIZ_GENERATION_CACHE_TTL, fresh=fresh, # Pressing generate again with the same inputs costs nothing
+            cache_if=_has_question_array # Never cache output that cannot be parsed, so a retry gets a new sample
         )
 
         if usage is None or not ai_response_text: # AI call itself might have failed or returned empty
@@ -756,29 +869,11 @@ def create_quiz():
     if not title: logger.warning("Missing quiz title"); return jsonify({"error": "Quiz title required."}), 400
     if not questions_data or not isinstance(questions_data, list): logger.warning("Missing/invalid questions"); return jsonify({"error": "Questions list required."}), 400
     try:
-        new_quiz = Quiz(teacher_id=user_id, title=title, description=description)
+        quiz_id = str(uuid.uuid4())
+        question_rows, choice_rows = prepare_question_rows(quiz_id, questions_data) # Validates everything before any write
+        new_quiz = Quiz(id=quiz_id, teacher_id=user_id, title=title, description=description, question_count=len(question_rows))
         db.session.add(new_quiz); db.session.flush()
-        for idx, q_data in enumerate(questions_data):
-            question_text = q_data.get("question_text"); question_type = q_data.get("question_type", "mcq")
-            choices_data = q_data.get("choices", []); correct_answer_text = q_data.get("correct_answer")
-            if not question_text: logger.warning(f"Skip Q {idx+1} no text"); continue
-            new_question = Question(quiz_id=new_quiz.id, question_text=question_text, question_type=question_type, order_index=idx)
-            db.session.add(new_question); db.session.flush()
-            if question_type == 'mcq':
-                if not choices_data or not isinstance(choices_data, list): logger.warning(f"Skip MCQ '{question_text}' no/bad choices"); continue
-                correct_found = False
-                for choice_data in choices_data:
-                    choice_text = None; is_correct = False
-                    if isinstance(choice_data, str): choice_text = choice_data; is_correct = (correct_answer_text and choice_text == correct_answer_text)
-                    elif isinstance(choice_data, dict):
-                        choice_text = choice_data.get("choice_text")
-                        if 'is_correct' in choice_data: is_correct = bool(choice_data.get("is_correct"))
-                        elif correct_answer_text and choice_text == correct_answer_text: is_correct = True
-                    if not choice_text: logger.warning(f"Skip choice Q '{question_text}' no text"); continue
-                    if is_correct: correct_found = True
-                    new_choice = Choice(question_id=new_question.id, choice_text=choice_text, is_correct=is_correct)
-                    db.session.add(new_choice)
-                if not correct_found: raise ValueError(f"MCQ '{question_text[:50]}...' needs 1 correct answer.")
+        insert_question_rows(question_rows, choice_rows)
         db.session.commit(); logger.info(f"Quiz '{title}' created (ID: {new_quiz.id})")
         return jsonify(new_quiz.to_dict()), 201
     except ValueError as ve: db.session.rollback(); logger.error(f"Validation error quiz '{title}': {ve}"); return jsonify({"error": str(ve)}), 400
@@ -805,15 +900,14 @@ def get_teacher_quiz_details(quiz_id):
     user_id = get_jwt_identity(); user = db.session.get(User, user_id)
     if not user or not user.is_teacher: return jsonify({"error": "Access forbidden."}), 403
     try:
-        quiz = db.session.execute(db.select(Quiz).filter_by(id=quiz_id, teacher_id=user_id)).scalar_one_or_none()
+        # Three queries whatever the quiz size: quiz, its questions, all their choices
+        stmt = db.select(Quiz).options(
+            db.selectinload(Quiz.questions).selectinload(Question.choices)
+        ).filter_by(id=quiz_id, teacher_id=user_id)
+        quiz = db.session.execute(stmt).scalar_one_or_none()
         if not quiz: logger.warning(f"Quiz not found/auth {quiz_id}"); return jsonify({"error": "Not found/auth"}), 404
         logger.info(f"Returning details for quiz '{quiz.title}'")
-        quiz_dict = quiz.to_dict(include_questions=True)
-        for q_dict in quiz_dict.get('questions', []):
-            question_obj = db.session.get(Question, q_dict['id'])
-            if question_obj and q_dict.get('question_type') == 'mcq':
-                 q_dict['choices'] = [c.to_dict() | {'is_correct': c.is_correct} for c in question_obj.choices] # Include is_correct
-        return jsonify(quiz_dict), 200
+        return jsonify(quiz.to_dict(include_questions=True, include_correct=True)), 200 # Teacher view includes is_correct
     except Exception as e: logger.exception(f"Error get quiz details {quiz_id}"); return jsonify({"error": "Failed."}), 500
 
 @app.route("/api/quizzes/<string:quiz_id>", methods=["PUT"])
@@ -836,56 +930,14 @@ def update_quiz(quiz_id):
         if not quiz:
             logger.warning(f"Quiz not found/auth {quiz_id}"); return jsonify({"error": "Not found/auth"}), 404
 
-        if "title" in data: quiz.title = data["title"]
-        if "description" in data: quiz.description = data["description"]
+        if "title" in data and data["title"] != quiz.title: quiz.title = data["title"]; quiz.version = Quiz.version + 1
+        if "description" in data and data["description"] != quiz.description: quiz.description = data["description"]; quiz.version = Quiz.version + 1
         if "is_published" in data: quiz.is_published = bool(data["is_published"])
 
         if "questions" in data and isinstance(data["questions"], list):
-            logger.info(f"Replacing questions for quiz {quiz_id}")
-            for old_q in list(quiz.questions): # Επίπεδο 2
-                db.session.delete(old_q)
-            db.session.flush()
-            questions_data = data["questions"]
-            for idx, q_data in enumerate(questions_data): # Επίπεδο 2
-                # Επίπεδο 3
-                question_text = q_data.get("question_text"); question_type = q_data.get("question_type", "mcq")
-                choices_data = q_data.get("choices", []); correct_answer_text = q_data.get("correct_answer")
-                if not question_text: continue
-                new_question = Question(quiz_id=quiz.id, question_text=question_text, question_type=question_type, order_index=idx)
-                db.session.add(new_question); db.session.flush()
-
-                if question_type == 'mcq':
-                    # Επίπεδο 4
-                    correct_found = False
-                    for choice_data in choices_data: # Επίπεδο 4
-                        # Επίπεδο 5
-                        choice_text = None; is_correct = False
-                        if isinstance(choice_data, dict): # Επίπεδο 5
-                            # Επίπεδο 6
-                            choice_text = choice_data.get("choice_text")
-                            is_correct = bool(choice_data.get("is_correct", False))
-                        elif isinstance(choice_data, str): # Επίπεδο 5 (στο ίδιο επίπεδο με το if από πάνω)
-                            # Επίπεδο 6
-                            choice_text = choice_data
-
-                        # Επίπεδο 5 (στο ίδιο επίπεδο με τα if/elif από πάνω)
-                        if choice_text:
-                            # Επίπεδο 6
-                            if is_correct or (correct_answer_text and choice_text == correct_answer_text): # Επίπεδο 6
-                                # Επίπεδο 7
-                                is_correct = True
-                                correct_found = True
-
-                            new_choice = Choice(question_id=new_question.id, choice_text=choice_text, is_correct=is_correct)
-                            db.session.add(new_choice)
-                        # --- Εδώ βεβαιώσου ότι το else είναι στο Επίπεδο 5 ---
-                        else:
-                            # Επίπεδο 6
-                            logger.warning(f"Skipping empty choice for Q: {question_text[:50]}")
-                    # --- Βεβαιώσου ότι αυτό το if είναι στο Επίπεδο 4 ---
-                    if not correct_found:
-                         # Επίπεδο 5
-                        raise ValueError(f"MCQ '{question_text[:50]}...' needs 1 correct answer.")
+            logger.info(f"Updating questions for quiz {quiz_id}")
+            # Matches the payload to existing question/choice ids and writes only what changed
+            sync_questions(quiz, data["questions"])
 
         # --- Βεβαιώσου ότι αυτό είναι στο Επίπεδο 1 ---
         db.session.commit(); logger.info(f"Quiz '{quiz.title}' ({quiz_id}) updated")
@@ -920,9 +972,9 @@ def list_available_student_quizzes():
     if not student: return jsonify({"error": "User not found."}), 404
     try:
         logger.info(f"User {user_id} requesting available quizzes")
-        published_quizzes = db.session.execute(db.select(Quiz).filter_by(is_published=True).order_by(Quiz.title)).scalars().all()
-        result_list = [q.to_dict(include_questions=False, student_id=user_id) for q in published_quizzes] # Add attempt status
-        logger.info(f"Found {len(published_quizzes)} published quizzes")
+        # Question counts and the student's latest attempt come from one grouped query, not per-quiz lazy loads
+        result_list = list_published_quizzes_for_student(user_id)
+        logger.info(f"Found {len(result_list)} published quizzes")
         return jsonify(result_list), 200
     except Exception as e: logger.exception(f"Error list student quizzes {user_id}: {e}"); return jsonify({"error": "Failed."}), 500
 @app.route("/api/student/quizzes/<string:quiz_id>/take", methods=["GET"])
@@ -931,34 +983,20 @@ def get_quiz_for_student(quiz_id):
     logger.info(f"--- /api/student/quizzes/{quiz_id}/take [GET] ---")
     user_id = get_jwt_identity() # Get the ID of the logged-in student
     try:
-        # Construct the SELECT statement
-        stmt = db.select(Quiz).options(
-            db.selectinload(Quiz.questions).selectinload(Question.choices) # Eager load questions and their choices
-        ).filter_by(id=quiz_id, is_published=True) # Apply filter for quiz ID and ensure it's published
-
-        # Execute the statement and get a single result (or None if not found)
-        quiz = db.session.execute(stmt).scalar_one_or_none()
+        # Only the version is read per request; the payload is encoded once per version and served from cache
+        version = db.session.execute(db.select(Quiz.version).filter_by(id=quiz_id, is_published=True)).scalar_one_or_none()
+        etag, body = get_student_quiz_payload(quiz_id, version) if version is not None else (None, None)
 
-        if not quiz:
+        if body is None:
             logger.warning(f"Student {user_id} requested non-existent or unpublished quiz ID: {quiz_id}")
             return jsonify({"error": "Quiz not found or not currently available."}), 404
 
-        logger.info(f"Student {user_id} starting quiz '{quiz.title}' (ID: {quiz_id})")
-
-        # Prepare the quiz data to send to the frontend
-        quiz_dict = quiz.to_dict(include_questions=True) # Get questions
-
-        # Remove 'is_correct' flag from choices before sending to student
-        if quiz_dict.get('questions'):
-            for q_data in quiz_dict['questions']:
-                if q_data.get('question_type') == 'mcq' and 'choices' in q_data:
-                    # Create new list of choices without is_correct
-                    q_data['choices'] = [
-                        {'id': choice['id'], 'choice_text': choice['choice_text']}
-                        for choice in q_data['choices']
-                    ]
-        
-        return jsonify(quiz_dict), 200
+        logger.info(f"Student {user_id} starting quiz {quiz_id} (v{version})")
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True # Revalidate every time, so edits and unpublishing are seen at once
+        return response.make_conditional(request) # 304 without a body when If-None-Match matches
 
     except Exception as e:
         logger.exception(f"Error fetching quiz {quiz_id} for student {user_id} to take: {e}")
@@ -992,18 +1030,19 @@ def submit_quiz_answers(quiz_id):
         logger.warning("No JSON data in quiz submit")
         return jsonify({"error": "Invalid JSON data received."}), 400
 
-    answers_payload = data.get("answers") # Expecting dict like: { "question_id_str": "answer_text_or_choice_id_str", ... }
+    answers_payload = data.get("answers") # Expecting dict like: { "question_id_str": "choice_id_str" | ["choice_id_str", ...] | "answer_text", ... }
     if not answers_payload or not isinstance(answers_payload, dict):
         logger.warning("Missing or invalid answers payload format")
         return jsonify({"error": "Invalid answers format."}), 400
 
-    try:
-        # Correct SQLAlchemy 2.0+ way to select, filter, and eager load
-        stmt = db.select(Quiz).options(
-            db.selectinload(Quiz.questions).selectinload(Question.choices) # Eager load questions and their choices
-        ).filter_by(id=quiz_id, is_published=True) # Apply filter for quiz ID and ensure it's published
+    # 'deferred' grades and commits right away; AI feedback is filled in by a background job
+    feedback_mode = data.get("feedback_mode", FEEDBACK_MODE)
+    if feedback_mode not in FEEDBACK_MODES:
+        return jsonify({"error": f"feedback_mode must be one of {', '.join(FEEDBACK_MODES)}."}), 400
 
-        quiz = db.session.execute(stmt).scalar_one_or_none() # Execute and get single result or None
+    try:
+        # Only the version is needed: questions and choices come from the cached answer key
+        quiz = db.session.execute(db.select(Quiz.id, Quiz.version).filter_by(id=quiz_id, is_published=True)).one_or_none()
 
         if not quiz:
             logger.warning(f"Quiz {quiz_id} not found or not published for submission by student {user_id}")
@@ -1021,102 +1060,88 @@ def submit_quiz_answers(quiz_id):
             logger.warning(f"Student {user_id} attempting to resubmit quiz {quiz_id} (Attempt ID: {existing_attempt.id})")
             return jsonify({"error": "You have already submitted this quiz."}), 409 # Conflict
 
-        # Create a new attempt record
-        new_attempt = StudentQuizAttempt(student_id=user_id, quiz_id=quiz_id)
-        db.session.add(new_attempt)
-        db.session.flush() # Get new_attempt.id before adding answers
-
-        logger.info(f"Created new quiz attempt {new_attempt.id} for student {user_id}, quiz {quiz_id}")
-
-        all_questions_map = {q.id: q for q in quiz.questions} # Map questions by ID for quick lookup
+        answer_key = get_answer_key(quiz_id, quiz.version) # {question_id: QuestionKey}
+        graded_answers = [] # (question_id, GradedAnswer) rows to store
         ai_feedback_tasks = [] # Collect data needed for AI feedback generation
 
-        # Process submitted answers
-        for q_id_str, provided_answer_text in answers_payload.items():
-            if q_id_str not in all_questions_map:
-                logger.warning(f"Received answer for unknown question ID '{q_id_str}' in quiz {quiz_id} attempt {new_attempt.id}")
+        # Process submitted answers: MCQs send the chosen choice id (or a list of ids); choice text is still accepted
+        for q_id_str, provided_answer in answers_payload.items():
+            question_key = answer_key.get(q_id_str)
+            if question_key is None:
+                logger.warning(f"Received answer for unknown question ID '{q_id_str}' in quiz {quiz_id} from student {user_id}")
                 continue # Skip this answer
 
-            question_obj = all_questions_map[q_id_str]
-            is_correct_answer = False # Default to false
-
-            # --- Simple Grading (MCQ only for now) ---
-            if question_obj.question_type == 'mcq':
-                correct_choice_text = question_obj.get_correct_answer_value() # This should be the text of the correct choice
-                # provided_answer_text from frontend is the *text* of the chosen choice for MCQs
-                is_correct_answer = (correct_choice_text is not None and provided_answer_text == correct_choice_text)
-                logger.debug(f"Grading QID:{q_id_str} - Provided: '{provided_answer_text}', Correct Choice Text: '{correct_choice_text}', Result: {is_correct_answer}")
-
+            graded = grade_answer(question_key, provided_answer)
+            if question_key.question_type == 'mcq':
+                logger.debug(f"Grading QID:{q_id_str} - Provided: '{provided_answer}', Choice: {graded.choice_id}, Result: {graded.is_correct}")
                 # If incorrect, prepare data for AI feedback
-                if not is_correct_answer:
+                if not graded.is_correct:
                     ai_feedback_tasks.append({
                         "question_id": q_id_str,
-                        "question_text": question_obj.question_text,
-                        "student_answer": provided_answer_text or "N/A",
-                        "correct_answer": correct_choice_text or "N/A"
+                        "question_text": question_key.question_text,
+                        "student_answer": graded.answer_text or "N/A",
+                        "correct_answer": correct_answer_text(question_key) or "N/A"
                     })
             else:
-                 logger.warning(f"Grading not implemented for question type '{question_obj.question_type}' (QID: {q_id_str})")
-                 is_correct_answer = None # Mark as ungraded for now, or handle as incorrect
+                 logger.warning(f"Grading not implemented for question type '{question_key.question_type}' (QID: {q_id_str})")
 
+            graded_answers.append((q_id_str, graded))
+
+        # --- Generate AI Feedback (if any incorrect answers were recorded) ---
+        # Runs concurrently and before anything is written; the read transaction is committed first,
+        # so no transaction (or pooled connection) is held open during the AI calls
+        # Answers other students already got feedback for are served from the feedback cache
+        ai_feedback_results = {}; generated_feedback_tasks = []
+        if ai_feedback_tasks and feedback_mode == 'inline':
+            db.session.commit() # Nothing written yet: just ends the read transaction, as generate_attempt_feedback does
+            logger.info(f"Student {user_id}, quiz {quiz_id}: Generating AI feedback for {len(ai_feedback_tasks)} incorrect answers...")
+            ai_feedback_results, generated_feedback_tasks = generate_feedback_cached(ai_feedback_tasks)
+        elif ai_feedback_tasks:
+            ai_feedback_results = get_cached_feedback(ai_feedback_tasks)
+        deferred_feedback = [t for t in ai_feedback_tasks if t["question_id"] not in ai_feedback_results]
+
+        # Create a new attempt record with its answers
+        new_attempt = StudentQuizAttempt(student_id=user_id, quiz_id=quiz_id)
+        db.session.add(new_attempt)
+        db.session.flush() # Get new_attempt.id before adding answers
+        logger.info(f"Created new quiz attempt {new_attempt.id} for student {user_id}, quiz {quiz_id}")
+
+        needs_feedback = {task["question_id"] for task in ai_feedback_tasks}
+        for q_id_str, graded in graded_answers:
+            if q_id_str not in needs_feedback: feedback_status = 'not_needed'
+            elif q_id_str in ai_feedback_results: feedback_status = 'ready'
+            else: feedback_status = 'pending' # Deferred mode, not cached
             # Store the student's answer
             student_answer_record = StudentAnswer(
                 attempt_id=new_attempt.id,
                 question_id=q_id_str,
-                answer_text=provided_answer_text,
-                is_correct=is_correct_answer
+                answer_text=graded.answer_text,
+                choice_id=graded.choice_id,
+                is_correct=graded.is_correct,
+                ai_feedback=ai_feedback_results.get(q_id_str),
+                feedback_status=feedback_status
             )
-            db.session.add(student_answer_record)
-
-        # --- Generate AI Feedback (if any incorrect answers were recorded) ---
-        if ai_feedback_tasks:
-            logger.info(f"Attempt {new_attempt.id}: Generating AI feedback for {len(ai_feedback_tasks)} incorrect answers...")
-            ai_feedback_results = {} # Store feedback indexed by question_id
-
-            for task_data in ai_feedback_tasks:
-                try:
-                    feedback_gen_prompt = f"""
-                    A student answered a quiz question incorrectly.
-                    Question: {task_data['question_text']}
-                    Student's Answer: {task_data['student_answer']}
-                    Correct Answer: {task_data['correct_answer']}
-
-                    Provide short (1-2 sentences), constructive feedback explaining why the student's answer is incorrect
-                    and gently guiding them towards the correct concept without giving away the answer directly.
-                    Maintain an encouraging and supportive tone suitable for a student.
-                    Focus on the conceptual mistake if possible.
-
-                    Feedback:
-                    """
-                    feedback_response_text, fb_usage_info = generate_ai_response(
-                         system_prompt="You are a helpful AI teaching assistant providing quiz feedback.",
-                         user_prompt=feedback_gen_prompt
-                    )
-                    if fb_usage_info:
-                        ai_feedback_results[task_data["question_id"]] = feedback_response_text.strip()
-                        logger.debug(f"Generated feedback for QID:{task_data['question_id']}")
-                    else:
-                         logger.error(f"AI call failed for feedback generation on QID:{task_data['question_id']}: {feedback_response_text}")
-                         ai_feedback_results[task_data["question_id"]] = "Sorry, an error occurred while generating feedback."
-                except Exception as ai_fb_ex:
-                     logger.exception(f"Error during AI feedback generation for QID:{task_data['question_id']}: {ai_fb_ex}")
-                     ai_feedback_results[task_data["question_id"]] = "An unexpected error occurred generating feedback."
-
-            # Update StudentAnswer records with generated feedback
-            db.session.flush() # Ensure answers exist before querying them for update
-            for answer_record in new_attempt.answers:
-                if answer_record.question_id in ai_feedback_results:
-                    answer_record.ai_feedback = ai_feedback_results[answer_record.question_id]
+            new_attempt.answers.append(student_answer_record)
 
         # --- Finalize Attempt ---
         new_attempt.submitted_at = datetime.now(timezone.utc)
         new_attempt.calculate_score() # Calculate final score based on graded answers
         logger.info(f"Attempt {new_attempt.id} finalized. Score: {new_attempt.score}% ({new_attempt.correct_answers}/{new_attempt.total_questions})")
+        # Same transaction as the attempt: stats and rollups never drift from the stored attempts
+        Quiz.record_attempt(quiz_id, new_attempt.score, new_attempt.submitted_at)
+        record_attempt_rollups(new_attempt)
 
+        if deferred_feedback:
+            enqueue_attempt_feedback(new_attempt)
         db.session.commit()
-
+        if deferred_feedback:
+            job_runner.notify()
+            logger.info(f"Attempt {new_attempt.id}: feedback for {len(deferred_feedback)} answers deferred to background job")
         # Return the full attempt details including score and feedback
-        return jsonify(new_attempt.to_dict(include_answers=True)), 200
+        attempt_data = new_attempt.to_dict(include_answers=True)
+        if generated_feedback_tasks:
+            store_feedback_in_cache(generated_feedback_tasks, ai_feedback_results)
+        return jsonify(attempt_data), 200
 
     except Exception as e:
         db.session.rollback()
@@ -1157,6 +1182,28 @@ def get_quiz_attempts_for_teacher(quiz_id):
         return jsonify(results), 200
     except Exception as e: logger.exception(f"Error fetching attempts quiz {quiz_id} for teacher {user_id}: {e}"); return jsonify({"error": "Failed."}), 500
 
+@app.route("/api/teachers/analytics/overview", methods=["GET"])
+@jwt_required()
+def get_teacher_analytics_overview():
+    logger.info("--- /api/teachers/analytics/overview [GET] ---")
+    user_id = get_jwt_identity(); teacher = db.session.get(User, user_id)
+    if not teacher or not teacher.is_teacher: return jsonify({"error": "Access forbidden."}), 403
+    try:
+        return jsonify(teacher_overview(user_id)), 200
+    except Exception as e: logger.exception(f"Error building analytics overview for teacher {user_id}: {e}"); return jsonify({"error": "Failed."}), 500
+
+@app.route("/api/teachers/quizzes/<string:quiz_id>/analytics", methods=["GET"])
+@jwt_required()
+def get_quiz_analytics_for_teacher(quiz_id):
+    logger.info(f"--- /api/teachers/quizzes/{quiz_id}/analytics [GET] ---")
+    user_id = get_jwt_identity(); teacher = db.session.get(User, user_id)
+    if not teacher or not teacher.is_teacher: return jsonify({"error": "Access forbidden."}), 403
+    try:
+        quiz = db.session.execute(db.select(Quiz).filter_by(id=quiz_id, teacher_id=user_id)).scalar_one_or_none()
+        if not quiz: logger.warning(f"Quiz not found/auth {quiz_id} for teacher {user_id}"); return jsonify({"error": "Not found/auth"}), 404
+        return jsonify(compute_quiz_analytics(quiz)), 200
+    except Exception as e: logger.exception(f"Error computing analytics quiz {quiz_id} for teacher {user_id}: {e}"); return jsonify({"error": "Failed."}), 500
+
 # --- Student Prompt Routes ---
 # Added this route back - CHECK IF IT WAS ACCIDENTALLY DELETED BEFORE
 @app.route("/api/student/prompts", methods=["GET"])
@@ -1176,31 +1223,51 @@ def list_available_student_prompts():
         return jsonify({"error": "Failed to retrieve available assistants."}), 500
 
 # --- /api/student/ask (POST) ---
+def _resolve_student_prompt(user_id):
+    """Validates an ask request and builds its system prompt: (system_prompt, question, None) or (None, None, error_response)."""
+    student = db.session.get(User, user_id)
+    if not student: logger.error(f"User not found {user_id}"); return None, None, (jsonify({"error": "Auth error"}), 401)
+    if not request.is_json: logger.warning("Not JSON"); return None, None, (jsonify({"error": "Request must be JSON"}), 415)
+    data = request.get_json(); logger.info(f"Student ask from {user_id}")
+    if data is None: logger.warning("No JSON data"); return None, None, (jsonify({"error": "Invalid JSON"}), 400)
+    prompt_id = data.get("prompt_id"); student_question = data.get("question")
+    if not prompt_id or not student_question: logger.warning("Missing prompt/question"); return None, None, (jsonify({"error": "Prompt/question required"}), 400)
+    logger.info(f"Fetching public prompt {prompt_id}")
+    prompt = db.session.execute(db.select(Prompt).filter_by(id=prompt_id, is_public=True)).scalar_one_or_none()
+    if not prompt: logger.warning(f"Prompt not found/private {prompt_id}"); return None, None, (jsonify({"error": "Assistant not found."}), 404)
+    if not isinstance(prompt.structure, list): logger.error(f"Prompt construct failed {prompt_id}: invalid structure"); return None, None, (jsonify({"error": "Config error."}), 500)
+    logger.info(f"Constructing prompt '{prompt.name}'")
+    # Compiled once per prompt version and cached; only the question-specific retrieval runs per request
+    system_prompt = render_compiled_prompt(get_compiled_prompt(prompt), student_question)
+    logger.info(f"Sending to OpenAI for student {user_id}, prompt {prompt_id}")
+    return system_prompt, student_question, None
+
 @app.route("/api/student/ask", methods=["POST"])
 @jwt_required() # Require login
 def ask_assistant():
     logger.info("--- /api/student/ask [POST] ---")
-    # ... (rest of ask_assistant implementation remains the same) ...
-    user_id = get_jwt_identity(); student = db.session.get(User, user_id)
-    if not student: logger.error(f"User not found {user_id}"); return jsonify({"error": "Auth error"}), 401
-    if not request.is_json: logger.warning("Not JSON"); return jsonify({"error": "Request must be JSON"}), 415
-    data = request.get_json(); logger.info(f"Student ask from {user_id}")
-    if data is None: logger.warning("No JSON data"); return jsonify({"error": "Invalid JSON"}), 400
-    prompt_id = data.get("prompt_id"); student_question = data.get("question")
-    if not prompt_id or not student_question: logger.warning("Missing prompt/question"); return jsonify({"error": "Prompt/question required"}), 400
+    user_id = get_jwt_identity()
     try:
-        logger.info(f"Fetching public prompt {prompt_id}")
-        prompt = db.session.execute(db.select(Prompt).filter_by(id=prompt_id, is_public=True)).scalar_one_or_none()
-        if not prompt: logger.warning(f"Prompt not found/private {prompt_id}"); return jsonify({"error": "Assistant not found."}), 404
-        logger.info(f"Constructing prompt '{prompt.name}'")
-        system_prompt, user_question = construct_final_prompt(prompt.structure, student_question)
-        if system_prompt.startswith("Error:"): logger.error(f"Prompt construct failed {prompt_id}: {system_prompt}"); return jsonify({"error": "Config error."}), 500
-        logger.info(f"Sending to OpenAI for student {user_id}, prompt {prompt_id}")
-        ai_response, usage = generate_ai_response(system_prompt, user_question)
+        system_prompt, user_question, error_response = _resolve_student_prompt(user_id)
+        if error_response: return error_response
+        ai_response, usage = generate_ai_response(system_prompt, user_question, priority=PRIORITY_INTERACTIVE)
         if usage is not None: logger.info(f"OpenAI OK. Usage: {usage}"); return jsonify({"response": ai_response, "usage": usage}), 200
         else: logger.error(f"OpenAI failed: {ai_response}"); return jsonify({"error": ai_response or "Failed."}), 500
     except Exception as e:
-         logger.exception(f"Error during student ask {prompt_id}, user {user_id}: {e}"); return jsonify({"error": "Server error."}), 500
+         logger.exception(f"Error during student ask, user {user_id}: {e}"); return jsonify({"error": "Server error."}), 500
+
+@app.route("/api/student/ask/stream", methods=["POST"])
+@jwt_required()
+def ask_assistant_stream():
+    """Streaming variant of /api/student/ask (Server-Sent Events)."""
+    logger.info("--- /api/student/ask/stream [POST] ---")
+    user_id = get_jwt_identity()
+    try:
+        system_prompt, user_question, error_response = _resolve_student_prompt(user_id)
+    except Exception as e:
+         logger.exception(f"Error preparing streamed student ask, user {user_id}: {e}"); return jsonify({"error": "Server error."}), 500
+    if error_response: return error_response
+    return sse_ai_response(system_prompt, user_question, f"Student ask {user_id}")
 
 
 @app.route('/', defaults={'path': ''})
@@ -1215,6 +1282,40 @@ def serve(path):
         return send_from_directory(build_folder, 'index.html')
 
 
+# --- CLI Commands ---
+@app.cli.command("run-jobs")
+def run_jobs_command():
+    """Runs a dedicated background job worker in the foreground."""
+    logger.info("Starting dedicated background job worker...")
+    job_runner.run_forever()
+
+
+@app.cli.command("backfill-quiz-stats")
+def backfill_quiz_stats_command():
+    """Recomputes Quiz.question_count, attempt_count, avg_score and last_attempt_at from the source tables."""
+    updated = Quiz.backfill_stats()
+    db.session.commit()
+    logger.info(f"Backfilled statistics for {updated} quiz(zes)")
+
+
+@app.cli.command("rebuild-analytics-rollups")
+def rebuild_analytics_rollups_command():
+    """Recomputes the quiz, question and student analytics rollups from all submitted attempts."""
+    counts = rebuild_rollups()
+    db.session.commit()
+    logger.info(f"Analytics rollups rebuilt: {counts}")
+
+
+@app.cli.command("index-materials")
+def index_materials_command():
+    """(Re)builds retrieval chunks for every material that has extracted text."""
+    materials = db.session.execute(db.select(Material).filter(Material.extracted_text != None)).scalars().all()
+    for material in materials:
+        index_material(material)
+    db.session.commit()
+    logger.info(f"Indexed {len(materials)} material(s)")
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
     logger.info("Entering main execution block (__name__ == '__main__')")
@@ -0,0 +1,2 @@
+# backend/benchmarks
+# Performance benchmarks; run from backend/, e.g. `python -m benchmarks.quiz_write`.
@@ -0,0 +1,499 @@
+# backend/benchmarks/api_load.py
+"""
+Benchmark: end-to-end load test of the student and teacher API.
+
+Seeds a synthetic dataset into a scratch database: teachers, materials with large
+extracted texts, published quizzes, students and submitted attempts. It then
+drives the real endpoints over HTTP from concurrent clients. For each endpoint it
+reports p50/p95/p99 latency, throughput, errors, and SQL statements and AI calls
+per request. The last two are read from the Server-Timing header (see
+instrumentation.py). The report is saved as JSON, and --compare checks it against
+a report from another commit.
+
+    cd backend && python -m benchmarks.api_load --students 200 --attempts 2000 --concurrency 16 --requests 3000 --output bench.json
+    cd backend && python -m benchmarks.api_load --students 200 --attempts 2000 --concurrency 16 --requests 3000 --compare bench.json
+
+By default the app is served in-process by a threaded Werkzeug server on a free
+port, with a throwaway SQLite database. BENCH_DATABASE_URL selects another
+database. Use PostgreSQL for numbers closer to production, because SQLite
+serializes writers. --base-url drives a server that is already running instead.
+That server must use the same database (BENCH_DATABASE_URL) and the same
+JWT_SECRET_KEY, because the dataset is seeded and the tokens are minted here.
+It must also have METRICS_ENABLED on for the query counts.
+
+AI calls go to the local stub backend by default (LLM_BACKEND=stub, see
+llm_backends.py), so runs are offline and repeatable. Shape the stub with
+LLM_STUB_LATENCY_MS and the other LLM_STUB_* settings.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import itertools
+import statistics
+import subprocess
+import http.client
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+# Point the app at a scratch database and the stub AI backend before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="api_load_bench_")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("METRICS_ENABLED", "true")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+from app import app, job_runner
+from database import db, User, Material, MaterialChunk, Prompt, Quiz, StudentQuizAttempt, StudentAnswer
+from quiz_writer import prepare_question_rows, insert_question_rows
+from retrieval import chunk_text
+from rollups import rebuild_rollups
+from llm_backends import LLM_BACKEND
+
+WORDS = (
+    "κύτταρο ενέργεια φωτοσύνθεση μιτοχόνδριο πρωτεΐνη ένζυμο μεμβράνη γονίδιο εξέλιξη οικοσύστημα "
+    "δύναμη ταχύτητα επιτάχυνση μάζα ενέργεια θερμότητα κύμα ρεύμα τάση αντίσταση "
+    "cell energy photosynthesis protein enzyme membrane gene evolution ecosystem force velocity "
+    "acceleration mass heat wave current voltage resistance equation function derivative integral"
+).split()
+
+DEFAULT_MIX = "student_quizzes=3,take=3,take_revalidate=1,submit=2,ask=1,teacher_overview=1,quiz_analytics=1"
+INSERT_BATCH = 5000
+
+_SERVER_TIMING_RE = re.compile(r'(db|ai);dur=[\d.]+;desc="(\d+) (?:queries|calls)"')
+
+
+# --- Synthetic Dataset ---
+def synthetic_text(rng, chars):
+    paragraphs, size = [], 0
+    while size < chars:
+        paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "."
+        paragraphs.append(paragraph); size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(db.insert(model), rows[start:start + INSERT_BATCH])
+
+def seed(args, rng):
+    """Writes the dataset with bulk INSERTs and returns what the load clients need (ids, answer choices, tokens)."""
+    tag = uuid.uuid4().hex[:8] # Unique emails, so a persistent BENCH_DATABASE_URL can be reused
+    password_hash = generate_password_hash("bench") # Hashed once: hashing per user would dominate seeding
+    teachers = [{"id": str(uuid.uuid4()), "email": f"bench-{tag}-t{i}@example.com", "password_hash": password_hash, "role": "teacher"} for i in range(args.teachers)]
+    students = [{"id": str(uuid.uuid4()), "email": f"bench-{tag}-s{i}@example.com", "password_hash": password_hash, "role": "student"} for i in range(args.students)]
+    _insert(User, teachers + students)
+
+    # Materials with large texts, chunked as ingestion would, and one public assistant per material
+    materials, chunks, prompts = [], [], []
+    for i in range(args.materials):
+        teacher = teachers[i % len(teachers)]
+        material = {
+            "id": str(uuid.uuid4()), "user_id": teacher["id"], "filename": f"material-{i + 1}.txt",
+            "filepath": f"bench/material-{i + 1}.txt", "extracted_text": synthetic_text(rng, args.material_chars), "status": "ready",
+        }
+        materials.append(material)
+        chunks.extend({"id": str(uuid.uuid4()), "material_id": material["id"], "chunk_index": idx, "text": text} for idx, text in enumerate(chunk_text(material["extracted_text"])))
+        prompts.append({
+            "id": str(uuid.uuid4()), "user_id": teacher["id"], "name": f"Assistant {i + 1}", "is_public": True,
+            "structure": [
+                {"content": "Είσαι βοηθός μελέτης. Απάντησε με βάση το υλικό."},
+                {"isMaterialBlock": True, "materialId": material["id"], "content": f"[Material: {material['filename']}]"},
+            ],
+        })
+    _insert(Material, materials); _insert(MaterialChunk, chunks); _insert(Prompt, prompts)
+
+    quizzes = [] # (quiz_id, teacher_id, [(question_id, [choice_id, ...], correct_choice_id), ...])
+    for i in range(args.quizzes):
+        teacher = teachers[i % len(teachers)]
+        quiz_id = str(uuid.uuid4())
+        payload = [
+            {
+                "question_text": f"Ερώτηση {q + 1}: {' '.join(rng.choice(WORDS) for _ in range(8))};",
+                "question_type": "mcq",
+                "choices": [{"choice_text": f"{rng.choice(WORDS)} {c + 1}", "is_correct": c == 0} for c in range(args.choices)],
+            }
+            for q in range(args.questions)
+        ]
+        question_rows, choice_rows = prepare_question_rows(quiz_id, payload)
+        db.session.execute(db.insert(Quiz), [{"id": quiz_id, "teacher_id": teacher["id"], "title": f"Quiz {i + 1}", "is_published": True, "question_count": len(question_rows)}])
+        insert_question_rows(question_rows, choice_rows)
+        choices_by_question = {}
+        for row in choice_rows:
+            choices_by_question.setdefault(row["question_id"], []).append(row)
+        quizzes.append((quiz_id, teacher["id"], [
+            (row["id"], [c["id"] for c in choices_by_question[row["id"]]], next(c["id"] for c in choices_by_question[row["id"]] if c["is_correct"]))
+            for row in question_rows
+        ]))
+
+    # Submitted attempts spread over the last 30 days, on distinct (student, quiz) pairs since a quiz is submitted
+    # once per student. The rollups and quiz counters are rebuilt from them.
+    pairs = [(s, q) for s in range(len(students)) for q in range(len(quizzes))]
+    rng.shuffle(pairs)
+    attempts, answers = [], []
+    now = datetime.utcnow()
+    for student_idx, quiz_idx in pairs[:args.attempts]:
+        student = students[student_idx]; quiz_id, _, questions = quizzes[quiz_idx]
+        attempt_id = str(uuid.uuid4())
+        submitted_at = now - timedelta(seconds=rng.randint(0, 30 * 86400))
+        correct = 0
+        for question_id, choice_ids, correct_id in questions:
+            choice_id = correct_id if rng.random() < args.correct_rate else rng.choice(choice_ids)
+            correct += choice_id == correct_id
+            answers.append({"id": str(uuid.uuid4()), "attempt_id": attempt_id, "question_id": question_id, "choice_id": choice_id, "answer_text": choice_id, "is_correct": choice_id == correct_id})
+        attempts.append({
+            "id": attempt_id, "student_id": student["id"], "quiz_id": quiz_id, "started_at": submitted_at - timedelta(minutes=10),
+            "submitted_at": submitted_at, "score": 100.0 * correct / len(questions) if questions else 0.0,
+            "total_questions": len(questions), "correct_answers": correct,
+        })
+    _insert(StudentQuizAttempt, attempts); _insert(StudentAnswer, answers)
+    Quiz.backfill_stats(); rebuild_rollups()
+    db.session.commit()
+
+    def token(user_id): return create_access_token(identity=user_id, expires_delta=False)
+    student_tokens = [token(student["id"]) for student in students]
+    return {
+        "teacher_tokens": {teacher["id"]: token(teacher["id"]) for teacher in teachers},
+        "student_tokens": student_tokens,
+        "open_pairs": pairs[args.attempts:], # Not yet submitted: what the submit endpoint draws from
+        "open_pairs_lock": threading.Lock(),
+        "quizzes": quizzes,
+        "prompt_ids": [prompt["id"] for prompt in prompts],
+        "counts": {
+            "teachers": len(teachers), "students": len(students), "materials": len(materials), "material_chunks": len(chunks),
+            "quizzes": len(quizzes), "questions": sum(len(q[2]) for q in quizzes), "attempts": len(attempts), "answers": len(answers),
+            "open_pairs": len(pairs) - len(attempts),
+        },
+    }
+
+
+# --- HTTP Client ---
+class Client:
+    """One keep-alive HTTP connection, used by a single load thread."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host, self.port, self.prefix = parts.hostname, parts.port or 80, parts.path.rstrip("/")
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, token, body=None, headers=None):
+        """Returns (status, latency seconds, response headers). Reconnects once if the server closed the connection."""
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        request_headers = {"Authorization": f"Bearer {token}", **(headers or {})}
+        if payload is not None: request_headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.conn.request(method, self.prefix + path, body=payload, headers=request_headers)
+                response = self.conn.getresponse(); response.read()
+                return response.status, time.perf_counter() - started, response
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close(); self.conn = None
+                if attempt: raise
+            except Exception:
+                self.conn.close(); self.conn = None
+                raise
+
+
+# --- Endpoints ---
+# Each takes (client, dataset, rng, etags) and returns (status, latency, response), or None when it has nothing left to do
+def _student(dataset, rng):
+    return rng.choice(dataset["student_tokens"])
+
+def hit_student_quizzes(client, dataset, rng, etags):
+    return client.request("GET", "/api/student/quizzes", _student(dataset, rng))
+
+def hit_take(client, dataset, rng, etags):
+    quiz_id = rng.choice(dataset["quizzes"])[0]
+    status, latency, response = client.request("GET", f"/api/student/quizzes/{quiz_id}/take", _student(dataset, rng))
+    if response.getheader("ETag"): etags[quiz_id] = response.getheader("ETag")
+    return status, latency, response
+
+def hit_take_revalidate(client, dataset, rng, etags):
+    """A browser re-opening a quiz it has cached: If-None-Match, normally answered with 304."""
+    quiz_id = rng.choice(dataset["quizzes"])[0]
+    headers = {"If-None-Match": etags[quiz_id]} if quiz_id in etags else None
+    return client.request("GET", f"/api/student/quizzes/{quiz_id}/take", _student(dataset, rng), headers=headers)
+
+def hit_submit(client, dataset, rng, etags):
+    """Submits a quiz the student has not submitted yet. Returns None once every (student, quiz) pair is used."""
+    with dataset["open_pairs_lock"]:
+        if not dataset["open_pairs"]:
+            return None
+        student_idx, quiz_idx = dataset["open_pairs"].pop()
+    quiz_id, _, questions = dataset["quizzes"][quiz_idx]
+    answers = {question_id: (correct_id if rng.random() < dataset["correct_rate"] else rng.choice(choice_ids)) for question_id, choice_ids, correct_id in questions}
+    body = {"answers": answers, "feedback_mode": dataset["feedback_mode"]}
+    return client.request("POST", f"/api/student/quizzes/{quiz_id}/submit", dataset["student_tokens"][student_idx], body=body)
+
+def hit_ask(client, dataset, rng, etags):
+    question = f"Τι σχέση έχει {rng.choice(WORDS)} με {rng.choice(WORDS)};"
+    body = {"prompt_id": rng.choice(dataset["prompt_ids"]), "question": question}
+    return client.request("POST", "/api/student/ask", _student(dataset, rng), body=body)
+
+def hit_teacher_overview(client, dataset, rng, etags):
+    return client.request("GET", "/api/teachers/analytics/overview", rng.choice(list(dataset["teacher_tokens"].values())))
+
+def hit_quiz_analytics(client, dataset, rng, etags):
+    quiz_id, teacher_id, _ = rng.choice(dataset["quizzes"])
+    return client.request("GET", f"/api/teachers/quizzes/{quiz_id}/analytics", dataset["teacher_tokens"][teacher_id])
+
+ENDPOINTS = {
+    "student_quizzes": hit_student_quizzes,
+    "take": hit_take,
+    "take_revalidate": hit_take_revalidate,
+    "submit": hit_submit,
+    "ask": hit_ask,
+    "teacher_overview": hit_teacher_overview,
+    "quiz_analytics": hit_quiz_analytics,
+}
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint '{name}' in --mix (expected {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- Load Driver ---
+def _server_timing(response):
+    """(db queries, ai calls) from the Server-Timing header, None where missing."""
+    found = dict(_SERVER_TIMING_RE.findall(response.getheader("Server-Timing") or "")) if response is not None else {}
+    return (int(found["db"]) if "db" in found else None), (int(found["ai"]) if "ai" in found else None)
+
+def _issue(client, dataset, rng, etags, mix):
+    """
+    Issues one request to an endpoint drawn from mix and returns its sample. An endpoint with nothing left to do
+    (submit once every pair is used) is dropped from mix and another one drawn. Returns None when mix runs empty.
+    """
+    while mix:
+        name = rng.choices(list(mix), list(mix.values()))[0]
+        try:
+            result = ENDPOINTS[name](client, dataset, rng, etags)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"{name} request failed: {type(e).__name__}: {e}")
+            return (name, 0, None, None, None)
+        if result is None:
+            del mix[name]; continue
+        status, latency, response = result
+        return (name, status, latency) + _server_timing(response)
+    return None
+
+def run_load(base_url, dataset, mix, concurrency, requests, duration, seed, timeout):
+    """Runs until `requests` requests are issued or `duration` seconds pass. Returns (samples, wall seconds)."""
+    issued = itertools.count()
+    issued_lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client, etags, samples = Client(base_url, timeout), {}, []
+        worker_mix = dict(mix) # Endpoints that ran dry are dropped per worker
+        while True:
+            with issued_lock:
+                n = next(issued)
+            if (requests and n >= requests) or (deadline and time.monotonic() >= deadline):
+                return samples
+            sample = _issue(client, dataset, rng, etags, worker_mix) # Redraws instead of counting a skipped draw
+            if sample is None:
+                return samples
+            samples.append(sample)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = [sample for worker_samples in pool.map(worker, range(concurrency)) for sample in worker_samples]
+    return samples, time.perf_counter() - started
+
+
+# --- Reporting ---
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(s[2] * 1000 for s in samples if s[2] is not None)
+    db_queries = sorted(s[3] for s in samples if s[3] is not None)
+    ai_calls = [s[4] for s in samples if s[4] is not None]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[1])] = statuses.get(str(sample[1]), 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[1] == 0 or s[1] >= 400),
+        "status_counts": statuses,
+        "throughput_rps": len(samples) / wall_seconds if wall_seconds else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            "mean": statistics.fmean(latencies) if latencies else None, "max": latencies[-1] if latencies else None,
+        },
+        "db_queries": {
+            "mean": statistics.fmean(db_queries) if db_queries else None, "p95": percentile(db_queries, 95),
+            "max": db_queries[-1] if db_queries else None,
+        },
+        "ai_calls": {"mean": statistics.fmean(ai_calls) if ai_calls else None, "max": max(ai_calls) if ai_calls else None},
+    }
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _fmt(value, spec=".1f"):
+    return format(value, spec) if value is not None else "-"
+
+def print_report(report):
+    print(f"API load: {report['dataset']['attempts']} seeded attempts, concurrency {report['config']['concurrency']}, "
+          f"{report['totals']['requests']} requests in {report['wall_seconds']:.1f}s ({report['totals']['throughput_rps']:.1f} req/s)")
+    print(f"  {'endpoint':<17}{'reqs':>6}{'err':>5}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'sql/req':>9}{'ai/req':>8}")
+    for name, result in list(report["endpoints"].items()) + [("TOTAL", report["totals"])]:
+        latency = result["latency_ms"]
+        print(f"  {name:<17}{result['requests']:>6}{result['errors']:>5}{_fmt(result['throughput_rps']):>8}"
+              f"{_fmt(latency['p50']):>9}{_fmt(latency['p95']):>9}{_fmt(latency['p99']):>9}"
+              f"{_fmt(result['db_queries']['mean']):>9}{_fmt(result['ai_calls']['mean'], '.2f'):>8}")
+
+def compare(report, baseline, threshold):
+    """Prints per-endpoint changes against a baseline report. Returns the endpoints whose p95 latency or mean SQL count regressed."""
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}), regression threshold {threshold:.0f}%:")
+    regressions = []
+    for name, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            print(f"  {name:<17} (not in baseline)"); continue
+        changes = []
+        for label, old, new in (
+            ("p50", before["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            ("p95", before["latency_ms"]["p95"], result["latency_ms"]["p95"]),
+            ("rps", before["throughput_rps"], result["throughput_rps"]),
+            ("sql", before["db_queries"]["mean"], result["db_queries"]["mean"]),
+        ):
+            delta = (new - old) / old * 100 if old and new is not None else None
+            changes.append(f"{label} {_fmt(old)} -> {_fmt(new)} ({_fmt(delta, '+.0f')}%)")
+            if label in ("p95", "sql") and delta is not None and delta > threshold:
+                regressions.append(name)
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"  {name:<17}" + "   ".join(changes) + flag)
+    return sorted(set(regressions))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    dataset_args = parser.add_argument_group("dataset")
+    dataset_args.add_argument("--teachers", type=int, default=5)
+    dataset_args.add_argument("--materials", type=int, default=10)
+    dataset_args.add_argument("--material-chars", type=int, default=200_000, help="Extracted text size per material")
+    dataset_args.add_argument("--quizzes", type=int, default=20)
+    dataset_args.add_argument("--questions", type=int, default=15, help="Questions per quiz")
+    dataset_args.add_argument("--choices", type=int, default=4, help="Choices per question")
+    dataset_args.add_argument("--students", type=int, default=100)
+    dataset_args.add_argument("--attempts", type=int, default=1000, help="Submitted attempts seeded before the run")
+    dataset_args.add_argument("--correct-rate", type=float, default=0.6, help="Share of answers that pick the correct choice")
+    load_args = parser.add_argument_group("load")
+    load_args.add_argument("--concurrency", type=int, default=8)
+    load_args.add_argument("--requests", type=int, default=2000, help="Measured requests (0: run for --duration)")
+    load_args.add_argument("--duration", type=float, default=0, help="Seconds to run (0: stop after --requests)")
+    load_args.add_argument("--warmup", type=int, default=100, help="Requests issued before measuring (fill caches, open connections)")
+    load_args.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights, default {DEFAULT_MIX}")
+    load_args.add_argument("--feedback-mode", choices=("inline", "deferred"), default="deferred", help="feedback_mode sent with submissions")
+    load_args.add_argument("--timeout", type=float, default=120, help="Client timeout per request in seconds")
+    load_args.add_argument("--base-url", help="Drive a running server instead of an in-process one (see module docstring)")
+    load_args.add_argument("--seed", type=int, default=1)
+    output_args = parser.add_argument_group("output")
+    output_args.add_argument("--output", help="Write the JSON report to this file")
+    output_args.add_argument("--compare", help="Baseline JSON report to compare against; exits with 1 on a regression")
+    output_args.add_argument("--threshold", type=float, default=10.0, help="Percent increase in p95 latency or SQL per request that counts as a regression")
+    output_args.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging")
+    args = parser.parse_args(argv)
+    if not (args.requests or args.duration):
+        parser.error("set --requests or --duration")
+    if not args.verbose:
+        logging.disable(logging.INFO) # Per-request INFO logging would dominate the measurements
+
+    mix = parse_mix(args.mix)
+    if args.attempts > args.students * args.quizzes:
+        parser.error("--attempts cannot exceed --students x --quizzes (one submission per student and quiz)")
+    open_pairs = args.students * args.quizzes - args.attempts
+    if mix.get("submit") and not open_pairs:
+        parser.error("--mix includes submit, but --attempts leaves no (student, quiz) pair to submit; lower --attempts or drop submit")
+    expected_submits = (args.requests + args.warmup) * mix.get("submit", 0) / sum(mix.values()) if args.requests else 0
+    if open_pairs < expected_submits:
+        print(f"Warning: only {open_pairs} (student, quiz) pairs are left to submit, about {expected_submits:.0f} submissions expected; "
+              f"the rest of the run goes to the other endpoints", file=sys.stderr)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        dataset = seed(args, rng)
+        seed_seconds = time.perf_counter() - started
+        database = db.engine.dialect.name
+    dataset.update(correct_rate=args.correct_rate, feedback_mode=args.feedback_mode)
+    print(f"Seeded {dataset['counts']} in {seed_seconds:.1f}s ({database})")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        if args.warmup:
+            run_load(base_url, dataset, mix, args.concurrency, args.warmup, 0, args.seed + 1, args.timeout)
+        samples, wall_seconds = run_load(base_url, dataset, mix, args.concurrency, args.requests, args.duration, args.seed, args.timeout)
+    finally:
+        if server is not None:
+            server.shutdown()
+            job_runner.stop(timeout=args.timeout) # Let in-flight feedback jobs finish before the interpreter exits
+
+    report = {
+        "benchmark": "api_load",
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(), "platform": platform.platform(), "database": database,
+            "server": base_url if args.base_url else "in-process werkzeug (threaded)",
+            "llm_backend": LLM_BACKEND, "llm_stub_latency_ms": os.getenv("LLM_STUB_LATENCY_MS") if LLM_BACKEND == "stub" else None,
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "dataset": dict(dataset["counts"], seed_seconds=round(seed_seconds, 2)),
+        "wall_seconds": wall_seconds,
+        "totals": summarize(samples, wall_seconds),
+        "endpoints": {name: summarize([s for s in samples if s[0] == name], wall_seconds) for name in mix if any(s[0] == name for s in samples)},
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+    return report
+
+if __name__ == "__main__":
+    main()
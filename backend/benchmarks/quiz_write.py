@@ -0,0 +1,100 @@
+# backend/benchmarks/quiz_write.py
+"""
+Benchmark: per-row ORM quiz writes vs. the bulk path in quiz_writer.
+
+Creates the same quiz repeatedly in a throwaway SQLite database through both
+paths and reports wall time and SQL statements per quiz.
+
+    cd backend && python -m benchmarks.quiz_write --questions 15 --choices 4 --repeat 50
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+
+# Point the app at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="quiz_write_bench_")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app
+from database import db, User, Quiz, Question, Choice
+from quiz_writer import prepare_question_rows, insert_question_rows
+
+
+def build_payload(questions, choices):
+    return [
+        {
+            "question_text": f"Question {q + 1}?",
+            "question_type": "mcq",
+            "choices": [{"choice_text": f"Choice {c + 1}", "is_correct": c == 0} for c in range(choices)],
+        }
+        for q in range(questions)
+    ]
+
+def legacy_write(teacher_id, payload):
+    """The previous create_quiz loop: one add + flush per question to obtain its id."""
+    quiz = Quiz(teacher_id=teacher_id, title="Bench")
+    db.session.add(quiz); db.session.flush()
+    for idx, q_data in enumerate(payload):
+        question = Question(quiz_id=quiz.id, question_text=q_data["question_text"], question_type=q_data["question_type"], order_index=idx)
+        db.session.add(question); db.session.flush()
+        for choice_data in q_data["choices"]:
+            db.session.add(Choice(question_id=question.id, choice_text=choice_data["choice_text"], is_correct=choice_data["is_correct"]))
+    db.session.flush()
+    quiz.question_count = db.session.execute(db.select(db.func.count(Question.id)).filter(Question.quiz_id == quiz.id)).scalar_one()
+    db.session.commit()
+
+def bulk_write(teacher_id, payload):
+    """The create_quiz path: validate and build all rows up front, then two executemany INSERTs."""
+    quiz_id = str(uuid.uuid4())
+    question_rows, choice_rows = prepare_question_rows(quiz_id, payload)
+    db.session.add(Quiz(id=quiz_id, teacher_id=teacher_id, title="Bench", question_count=len(question_rows))); db.session.flush()
+    insert_question_rows(question_rows, choice_rows)
+    db.session.commit()
+
+def run(path, teacher_id, payload, repeat):
+    statements = [0]
+    def count(*_): statements[0] += 1
+    event.listen(db.engine, "before_cursor_execute", count)
+    timings = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            path(teacher_id, payload)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": sorted(timings)[max(0, int(len(timings) * 0.95) - 1)],
+        "statements_per_quiz": statements[0] / repeat,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--questions", type=int, default=15)
+    parser.add_argument("--choices", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    payload = build_payload(args.questions, args.choices)
+    with app.app_context():
+        db.create_all()
+        teacher = User(email="bench-teacher@example.com", role="teacher"); teacher.set_password("bench")
+        db.session.add(teacher); db.session.commit()
+        results = {name: run(path, teacher.id, payload, args.repeat) for name, path in (("legacy", legacy_write), ("bulk", bulk_write))}
+
+    print(f"Quiz write: {args.questions} questions x {args.choices} choices, {args.repeat} runs each")
+    for name, result in results.items():
+        print(f"  {name:<7} median {result['median_ms']:7.2f} ms   p95 {result['p95_ms']:7.2f} ms   {result['statements_per_quiz']:5.1f} statements/quiz")
+    print(f"  speedup (median): {results['legacy']['median_ms'] / results['bulk']['median_ms']:.1f}x")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# backend/cache.py
+"""Small in-process caches shared by the backend modules."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping. The least recently used entry is evicted once max_size is exceeded."""
+
+    def __init__(self, max_size, name="cache"):
+        self.max_size = max_size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def pop_where(self, predicate):
+        """Removes every entry whose key matches predicate(key). Returns how many were removed."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        return {"name": self.name, "size": len(self._data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
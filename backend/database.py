@@ -57,13 +57,46 @@ class Material(db.Model):
     extracted_text = db.Column(db.Text, nullable=True)
     summary = db.Column(db.Text, nullable=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Ingestion pipeline state: 'pending', 'extracting', 'summarizing', 'ready' or 'failed'
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
+    error_message = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True) # SHA-256 of the file, see StoredFile
+
+    # Retrieval chunks of extracted_text (see retrieval.py)
+    chunks = db.relationship('MaterialChunk', backref='material', lazy=True, cascade="all, delete-orphan", order_by='MaterialChunk.chunk_index')
 
     def to_dict(self):
-        return {"id": self.id, "name": self.filename, "summary": self.summary or "N/A", "uploaded_at": self.uploaded_at.isoformat()}
+        return {"id": self.id, "name": self.filename, "summary": self.summary or "N/A", "uploaded_at": self.uploaded_at.isoformat(), "status": self.status}
+
+    def status_dict(self):
+        return {"id": self.id, "name": self.filename, "status": self.status, "error": self.error_message}
 
     def __repr__(self):
         return f'<Material {self.filename} for User {self.user_id}>'
 
+class MaterialChunk(db.Model):
+    """A passage of a material's extracted text, the unit the retrieval index ranks."""
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    material_id = db.Column(db.String(36), db.ForeignKey('material.id'), nullable=False)
+    chunk_index = db.Column(db.Integer, nullable=False) # Position within the material
+    text = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (db.Index('ix_material_chunk_material_id_chunk_index', 'material_id', 'chunk_index'),)
+
+    def __repr__(self):
+        return f'<MaterialChunk {self.chunk_index} of Material {self.material_id}>'
+
+class StoredFile(db.Model):
+    """Content-hash index of uploaded files. One row (and one file on disk) per distinct content."""
+    content_hash = db.Column(db.String(64), primary_key=True) # SHA-256 hex digest
+    filepath = db.Column(db.String(512), nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=1) # Number of Material rows using this file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredFile {self.content_hash[:12]} refs:{self.ref_count}>'
+
 class Prompt(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
@@ -104,25 +137,40 @@ class Quiz(db.Model):
     is_published = db.Column(db.Boolean, default=False, nullable=False) # If students can take it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Denormalized counters so list views read one row per quiz (set by the quiz write path and record_attempt)
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    avg_score = db.Column(db.Float, nullable=True) # Mean score of submitted attempts, None until the first one
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+    # Bumped whenever student-visible content changes (title, description, questions, choices); keys per-quiz
+    # caches such as the answer key (grading.py) and the student /take payload (queries.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Relationship to Questions
     questions = db.relationship('Question', backref='quiz', lazy=True, cascade="all, delete-orphan", order_by='Question.order_index')
     # Relationship to student attempts
     attempts = db.relationship('StudentQuizAttempt', backref='quiz', lazy='dynamic', cascade="all, delete-orphan")
+    # Analytics rollups (rollups.py); removed together with the quiz
+    rollup = db.relationship('QuizRollup', lazy=True, uselist=False, cascade="all, delete-orphan")
+    question_rollups = db.relationship('QuestionRollup', lazy=True, cascade="all, delete-orphan")
+    student_rollups = db.relationship('StudentQuizRollup', lazy=True, cascade="all, delete-orphan")
 
-    def to_dict(self, include_questions=False, student_id=None):
+    def to_dict(self, include_questions=False, student_id=None, include_correct=False):
         data = {
             "id": self.id,
             "title": self.title,
             "description": self.description or "",
             "is_published": self.is_published,
-            "question_count": len(self.questions), # Calculate question count
+            "question_count": self.question_count or 0,
+            "attempt_count": self.attempt_count or 0,
+            "avg_score": self.avg_score,
+            "last_attempt_at": self.last_attempt_at.isoformat() if self.last_attempt_at else None,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
             "teacher_id": self.teacher_id,
         }
         if include_questions:
-            data['questions'] = [q.to_dict(include_choices=True) for q in self.questions] # Include choices when getting questions
+            data['questions'] = [q.to_dict(include_choices=True, include_correct=include_correct) for q in self.questions] # Include choices when getting questions
 
         # Optionally include student attempt info if student_id is provided
         if student_id:
@@ -132,6 +180,41 @@ class Quiz(db.Model):
 
         return data
 
+    @staticmethod
+    def record_attempt(quiz_id, score, submitted_at):
+        """
+        Folds a submitted attempt into the quiz statistics with a single UPDATE whose values are SQL
+        expressions over the current row, so concurrent submissions cannot overwrite each other's counts.
+        """
+        db.session.execute(
+            db.update(Quiz).where(Quiz.id == quiz_id).values(
+                attempt_count=Quiz.attempt_count + 1,
+                avg_score=(db.func.coalesce(Quiz.avg_score, 0.0) * Quiz.attempt_count + (score or 0.0)) / (Quiz.attempt_count + 1),
+                last_attempt_at=db.case(
+                    (Quiz.last_attempt_at == None, submitted_at),
+                    (Quiz.last_attempt_at < submitted_at, submitted_at),
+                    else_=Quiz.last_attempt_at,
+                ),
+                updated_at=Quiz.updated_at, # Statistics are not an edit: keep the onupdate stamp off
+            ).execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def backfill_stats():
+        """Recomputes the denormalized counters of every quiz from the question and attempt tables."""
+        question_count = db.select(db.func.count(Question.id)).filter(Question.quiz_id == Quiz.id).scalar_subquery()
+        attempt_filter = (StudentQuizAttempt.quiz_id == Quiz.id) & (StudentQuizAttempt.submitted_at != None)
+        result = db.session.execute(
+            db.update(Quiz).values(
+                question_count=question_count,
+                attempt_count=db.select(db.func.count(StudentQuizAttempt.id)).filter(attempt_filter).scalar_subquery(),
+                avg_score=db.select(db.func.avg(StudentQuizAttempt.score)).filter(attempt_filter).scalar_subquery(),
+                last_attempt_at=db.select(db.func.max(StudentQuizAttempt.submitted_at)).filter(attempt_filter).scalar_subquery(),
+                updated_at=Quiz.updated_at,
+            ).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
     def __repr__(self):
         status = "Published" if self.is_published else "Draft"
         return f'<Quiz {self.title} (Status: {status}) by User {self.teacher_id}>'
@@ -149,8 +232,11 @@ class Question(db.Model):
     choices = db.relationship('Choice', backref='question', lazy=True, cascade="all, delete-orphan", order_by='Choice.id')
     # Relationship to student answers for this question
     student_answers = db.relationship('StudentAnswer', backref='question', lazy='dynamic')
+    # Cached AI feedback for wrong answers; removed together with the question
+    feedback_cache = db.relationship('FeedbackCacheEntry', backref='question', lazy=True, cascade="all, delete-orphan")
+    rollup = db.relationship('QuestionRollup', lazy=True, uselist=False, cascade="all, delete-orphan")
 
-    def to_dict(self, include_choices=False):
+    def to_dict(self, include_choices=False, include_correct=False):
         data = {
             "id": self.id,
             "quiz_id": self.quiz_id,
@@ -160,16 +246,15 @@ class Question(db.Model):
             # "ai_generation_prompt": self.ai_generation_prompt # Maybe only for internal use
         }
         if include_choices and self.question_type == 'mcq':
-            data['choices'] = [c.to_dict() for c in self.choices]
-        # Don't include correct answer info when sending to student initially
+            data['choices'] = [c.to_dict(include_correct=include_correct) for c in self.choices]
+        # Correct answer info only for the teacher view (include_correct=True)
         return data
 
     def get_correct_answer_value(self):
-        """Helper to get the value of the correct choice(s) for grading."""
+        """Text of the correct choice(s) for feedback prompts; several correct choices are joined with '; '."""
         if self.question_type == 'mcq':
             correct_choices = [c.choice_text for c in self.choices if c.is_correct]
-            # Assuming single correct answer for now for MCQs
-            return correct_choices[0] if correct_choices else None
+            return "; ".join(correct_choices) if correct_choices else None
         # Add logic for other question types later (e.g., open_ended might need AI grading)
         return None
 
@@ -182,16 +267,17 @@ class Choice(db.Model):
     choice_text = db.Column(db.Text, nullable=False)
     is_correct = db.Column(db.Boolean, default=False, nullable=False)
 
-    def to_dict(self):
+    def to_dict(self, include_correct=False):
         # IMPORTANT: DO NOT send is_correct flag to student when taking the quiz!
-        # This dict might need adjustment depending on context (sending to teacher vs student).
-        # For now, let's assume this basic version is okay, and filter later.
-        return {
+        # include_correct is only for teacher views.
+        data = {
             "id": self.id,
             "question_id": self.question_id,
             "choice_text": self.choice_text,
-            # "is_correct": self.is_correct # Exclude this when sending to student taker UI
         }
+        if include_correct:
+            data["is_correct"] = self.is_correct
+        return data
 
     def __repr__(self):
         correct_marker = "*" if self.is_correct else ""
@@ -227,6 +313,10 @@ class StudentQuizAttempt(db.Model):
         self.total_questions = total_q
         self.score = (float(correct_q) / total_q) * 100 if total_q > 0 else 0.0
 
+    def get_feedback_status(self):
+        """'pending' while any answer still waits for deferred feedback, otherwise 'complete'."""
+        return 'pending' if any(a.get_feedback_status() == 'pending' for a in self.answers) else 'complete'
+
     def to_dict(self, include_answers=False):
         data = {
             "id": self.id,
@@ -241,6 +331,7 @@ class StudentQuizAttempt(db.Model):
         }
         if include_answers:
             data['answers'] = [a.to_dict() for a in self.answers]
+            data['feedback_status'] = self.get_feedback_status()
         return data
 
     def __repr__(self):
@@ -253,9 +344,17 @@ class StudentAnswer(db.Model):
     question_id = db.Column(db.String(36), db.ForeignKey('question.id'), nullable=False)
     # Store the answer provided by the student. For MCQ, this might be the Choice ID or text.
     answer_text = db.Column(db.Text, nullable=True)
+    # MCQ: id of the chosen Choice at submission time (no FK, so later quiz edits can drop the choice)
+    choice_id = db.Column(db.String(36), nullable=True)
     is_correct = db.Column(db.Boolean, nullable=True) # Null until graded
     # Store AI-generated feedback if the answer was incorrect
     ai_feedback = db.Column(db.Text, nullable=True)
+    # 'not_needed', 'pending', 'ready' or 'failed'. Pending while deferred feedback is generated in the background.
+    feedback_status = db.Column(db.String(20), nullable=True)
+
+    def get_feedback_status(self):
+        if self.feedback_status: return self.feedback_status
+        return 'ready' if self.ai_feedback else 'not_needed' # Answers stored before the column existed
 
     def to_dict(self):
         return {
@@ -265,6 +364,7 @@ class StudentAnswer(db.Model):
             "answer_text": self.answer_text,
             "is_correct": self.is_correct,
             "ai_feedback": self.ai_feedback,
+            "feedback_status": self.get_feedback_status(),
             # Optionally include question text for context
             "question_text": self.question.question_text if self.question else "N/A",
         }
@@ -274,6 +374,125 @@ class StudentAnswer(db.Model):
         return f'<Answer {self.id} for Att:{self.attempt_id} Q:{self.question_id} Status:{status}>'
 
 
+class FeedbackCacheEntry(db.Model):
+    """AI feedback reused for every student who gives the same wrong answer to a question (see feedback.py)."""
+    __tablename__ = 'feedback_cache'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    question_id = db.Column(db.String(36), db.ForeignKey('question.id'), nullable=False)
+    answer_hash = db.Column(db.String(64), nullable=False) # SHA-256 of the normalized student answer
+    normalized_answer = db.Column(db.Text, nullable=False)
+    feedback = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('question_id', 'answer_hash', name='uq_feedback_cache_question_answer'),)
+
+    def __repr__(self):
+        return f'<FeedbackCacheEntry Q:{self.question_id} Answer:{self.normalized_answer[:30]}>'
+
+
+class LLMResponseCacheEntry(db.Model):
+    """A stored AI response for a deterministic-enough call (summaries, quiz generation); see llm_cache.py."""
+    __tablename__ = 'llm_response_cache'
+    cache_key = db.Column(db.String(64), primary_key=True) # SHA-256 of model, messages and parameters
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    usage = db.Column(db.Text, nullable=True) # JSON of the usage reported for the original call
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True) # LRU eviction order
+    hit_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<LLMResponseCacheEntry {self.cache_key[:12]} ({self.model})>'
+
+
+# --- Analytics Rollups ---
+# Running totals maintained by rollups.py in the same transaction as each quiz submission,
+# so dashboards read a handful of rows instead of scanning attempts and answers.
+
+class QuizRollup(db.Model):
+    __tablename__ = 'quiz_rollup'
+    quiz_id = db.Column(db.String(36), db.ForeignKey('quiz.id'), primary_key=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+    student_count = db.Column(db.Integer, nullable=False, default=0) # Distinct students with a submitted attempt
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    score_sq_sum = db.Column(db.Float, nullable=False, default=0.0) # For the standard deviation
+    answer_count = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<QuizRollup Q:{self.quiz_id} Attempts:{self.attempt_count}>'
+
+class QuestionRollup(db.Model):
+    __tablename__ = 'question_rollup'
+    question_id = db.Column(db.String(36), db.ForeignKey('question.id'), primary_key=True)
+    quiz_id = db.Column(db.String(36), db.ForeignKey('quiz.id'), nullable=False, index=True)
+    answer_count = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<QuestionRollup Q:{self.question_id} {self.correct_count}/{self.answer_count}>'
+
+class StudentQuizRollup(db.Model):
+    __tablename__ = 'student_quiz_rollup'
+    student_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    quiz_id = db.Column(db.String(36), db.ForeignKey('quiz.id'), primary_key=True, index=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_score = db.Column(db.Float, nullable=True)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<StudentQuizRollup S:{self.student_id} Q:{self.quiz_id} Best:{self.best_score}>'
+
+
+# --- Background Jobs ---
+
+class BackgroundJob(db.Model):
+    """A unit of work for the DB-backed job queue (see jobs.py). Lives in the DB so queued work survives a restart."""
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(50), nullable=False) # Handler name, e.g. 'ingest_material'
+    target_id = db.Column(db.String(36), nullable=False) # ID of the row the handler works on
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True) # Worker that claimed the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_background_job_status_created_at', 'status', 'created_at'),)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "target_id": self.target_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.kind} for {self.target_id} Status:{self.status}>'
+
+
+def begin_savepoint():
+    """
+    db.session.begin_nested() that is safe as the first write of a transaction. pysqlite only emits BEGIN before
+    DML, so a SAVEPOINT issued first would open the real transaction and its RELEASE would commit it. BEGIN is
+    emitted here instead of via SQLAlchemy's documented "begin" event recipe, which would make every read hold
+    SQLite's shared lock until commit.
+    """
+    connection = db.session.connection()
+    if connection.dialect.driver == "pysqlite" and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN")
+    return db.session.begin_nested()
+
 # --- Database Initialization Function ---
 def init_db(app):
     """Initializes the database."""
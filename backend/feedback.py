@@ -0,0 +1,304 @@
+# backend/feedback.py
+"""
+AI feedback for incorrect quiz answers.
+
+Feedback for the wrong answers of one submission is requested in one
+structured batch call, falling back to per-question calls for anything the
+batch did not cover. Calls run on a small per-request thread pool, capped
+at FEEDBACK_MAX_CONCURRENCY calls in flight and bounded by an overall
+FEEDBACK_DEADLINE_SECONDS. Answers whose feedback is not ready by the
+deadline get a placeholder, so submit latency stays close to a single AI
+round-trip.
+
+Generated feedback is stored in the feedback_cache table keyed by question
+and normalized answer, so later students giving the same wrong answer skip
+the AI call. Entries are deleted together with their question.
+
+In deferred mode the attempt is graded and committed first and the
+'attempt_feedback' background job fills in StudentAnswer.ai_feedback later.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import unicodedata
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db, Question, StudentAnswer, FeedbackCacheEntry
+from jobs import job_handler, enqueue_job
+from utils import generate_ai_response
+from llm_gateway import PRIORITY_NORMAL, PRIORITY_BACKGROUND, DEFAULT_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+FEEDBACK_MAX_CONCURRENCY = int(os.getenv("FEEDBACK_MAX_CONCURRENCY", "5")) # AI calls in flight per submission
+FEEDBACK_DEADLINE_SECONDS = float(os.getenv("FEEDBACK_DEADLINE_SECONDS", "20")) # Overall budget for one submission
+# Budget of one deferred feedback job: it yields to interactive calls in the gateway, so it may queue for a while
+FEEDBACK_JOB_DEADLINE_SECONDS = float(os.getenv("FEEDBACK_JOB_DEADLINE_SECONDS", str(DEFAULT_TIMEOUTS[PRIORITY_BACKGROUND])))
+# Send all wrong answers of an attempt in one structured request (per-question calls remain the fallback)
+FEEDBACK_BATCH_ENABLED = os.getenv("FEEDBACK_BATCH", "true").lower() in ("1", "true", "yes")
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "15")) # Answers per batch request
+# 'inline' generates feedback before submit returns, 'deferred' hands it to the background job queue
+FEEDBACK_MODE = os.getenv("QUIZ_FEEDBACK_MODE", "inline")
+FEEDBACK_MODES = ('inline', 'deferred')
+ATTEMPT_FEEDBACK_JOB = "attempt_feedback"
+
+FEEDBACK_SYSTEM_PROMPT = "You are a helpful AI teaching assistant providing quiz feedback."
+FEEDBACK_ERROR_TEXT = "Sorry, an error occurred while generating feedback."
+FEEDBACK_TIMEOUT_TEXT = "Feedback for this question is not available right now. Please review the related material."
+FEEDBACK_UNEXPECTED_ERROR_TEXT = "An unexpected error occurred generating feedback."
+_UNCACHEABLE_TEXTS = {FEEDBACK_ERROR_TEXT, FEEDBACK_TIMEOUT_TEXT, FEEDBACK_UNEXPECTED_ERROR_TEXT}
+
+
+def build_feedback_prompt(task):
+    return f"""
+                    A student answered a quiz question incorrectly.
+                    Question: {task['question_text']}
+                    Student's Answer: {task['student_answer']}
+                    Correct Answer: {task['correct_answer']}
+
+                    Provide short (1-2 sentences), constructive feedback explaining why the student's answer is incorrect
+                    and gently guiding them towards the correct concept without giving away the answer directly.
+                    Maintain an encouraging and supportive tone suitable for a student.
+                    Focus on the conceptual mistake if possible.
+
+                    Feedback:
+                    """
+
+def generate_single_feedback(task, priority=PRIORITY_NORMAL, timeout=None):
+    """One AI call for one incorrect answer. Never raises; returns an error text instead."""
+    try:
+        feedback_text, usage = generate_ai_response(
+            system_prompt=FEEDBACK_SYSTEM_PROMPT, user_prompt=build_feedback_prompt(task), priority=priority, timeout=timeout
+        )
+        if usage:
+            logger.debug(f"Generated feedback for QID:{task['question_id']}")
+            return feedback_text.strip()
+        logger.error(f"AI call failed for feedback generation on QID:{task['question_id']}: {feedback_text}")
+        return FEEDBACK_ERROR_TEXT
+    except Exception as e:
+        logger.exception(f"Error during AI feedback generation for QID:{task['question_id']}: {e}")
+        return FEEDBACK_UNEXPECTED_ERROR_TEXT
+
+def build_batch_feedback_prompt(tasks):
+    items = [{
+        "question_id": task["question_id"],
+        "question": task["question_text"],
+        "student_answer": task["student_answer"],
+        "correct_answer": task["correct_answer"],
+    } for task in tasks]
+    return f"""A student answered the following quiz questions incorrectly:
+{json.dumps(items, ensure_ascii=False, indent=1)}
+
+For EACH item provide short (1-2 sentences), constructive feedback explaining why the student's answer is incorrect
+and gently guiding them towards the correct concept without giving away the answer directly.
+Maintain an encouraging and supportive tone suitable for a student. Focus on the conceptual mistake if possible.
+Output ONLY a valid JSON array with one object per item: {{"question_id": "<question_id from the input>", "feedback": "<feedback>"}}
+JSON Output:
+"""
+
+def _parse_batch_feedback(response_text, expected_ids):
+    """Parses the JSON array of a batch response. Returns {question_id: feedback} for the expected ids only."""
+    start, end = response_text.find('['), response_text.rfind(']') + 1
+    if start < 0 or end <= start:
+        raise ValueError("No JSON array in batch feedback response")
+    parsed = json.loads(response_text[start:end])
+    if not isinstance(parsed, list):
+        raise ValueError("Batch feedback response is not a list")
+    results = {}
+    for item in parsed:
+        if not isinstance(item, dict): continue
+        question_id, feedback_text = str(item.get("question_id", "")), item.get("feedback")
+        if question_id in expected_ids and isinstance(feedback_text, str) and feedback_text.strip():
+            results[question_id] = feedback_text.strip()
+    return results
+
+def generate_batch_feedback(tasks, priority=PRIORITY_NORMAL, timeout=None):
+    """One AI call for several incorrect answers. Returns what could be parsed; missing ids fall back to single calls."""
+    expected_ids = {task["question_id"] for task in tasks}
+    try:
+        response_text, usage = generate_ai_response(
+            system_prompt=FEEDBACK_SYSTEM_PROMPT, user_prompt=build_batch_feedback_prompt(tasks), priority=priority, timeout=timeout
+        )
+        if not usage:
+            logger.error(f"AI call failed for batch feedback ({len(tasks)} answers): {response_text}")
+            return {}
+        results = _parse_batch_feedback(response_text, expected_ids)
+        if len(results) < len(expected_ids):
+            logger.warning(f"Batch feedback covered {len(results)} of {len(expected_ids)} answers")
+        return results
+    except (json.JSONDecodeError, ValueError) as parse_error:
+        logger.warning(f"Could not parse batch feedback response, falling back to per-question calls: {parse_error}")
+        return {}
+    except Exception as e:
+        logger.exception(f"Error during batch AI feedback generation: {e}")
+        return {}
+
+def _run_bounded(fn, items, max_concurrency, timeout):
+    """Runs fn over items on a per-call pool. Returns ([(item, result)] finished in time, [items] that were not)."""
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items))), thread_name_prefix="feedback")
+    try:
+        # Each call runs in a copy of the caller's context, so per-request instrumentation still sees it
+        futures = {pool.submit(contextvars.copy_context().run, fn, item): item for item in items}
+        done, not_done = wait(futures, timeout=max(0.0, timeout))
+        for future in not_done:
+            future.cancel()
+        return [(futures[f], f.result()) for f in done], [futures[f] for f in not_done]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def generate_feedback(tasks, max_concurrency=FEEDBACK_MAX_CONCURRENCY, deadline=FEEDBACK_DEADLINE_SECONDS, batch=FEEDBACK_BATCH_ENABLED,
+                      priority=PRIORITY_NORMAL):
+    """
+    Generates feedback for every task. Returns {question_id: feedback_text}.
+    Each task is a dict with question_id, question_text, student_answer and correct_answer.
+    With batch=True the answers are sent in batches of FEEDBACK_BATCH_SIZE per AI call; anything a batch
+    did not cover is retried with concurrent per-question calls within the remaining deadline.
+    Each AI call gets the remaining deadline as its gateway budget, so none outlives the submission.
+    """
+    if not tasks:
+        return {}
+    started = time.monotonic()
+    results = {}
+    remaining = tasks
+    if batch and len(tasks) > 1:
+        batches = [tasks[i:i + FEEDBACK_BATCH_SIZE] for i in range(0, len(tasks), FEEDBACK_BATCH_SIZE)]
+        batch_fn = functools.partial(generate_batch_feedback, priority=priority, timeout=deadline)
+        done, _ = _run_bounded(batch_fn, batches, max_concurrency, deadline)
+        for _, batch_results in done:
+            results.update(batch_results)
+        remaining = [task for task in tasks if task["question_id"] not in results]
+        if remaining:
+            logger.info(f"Falling back to per-question feedback for {len(remaining)} of {len(tasks)} answers")
+
+    if remaining:
+        time_left = deadline - (time.monotonic() - started)
+        single_fn = functools.partial(generate_single_feedback, priority=priority, timeout=max(0.1, time_left))
+        done, not_done = _run_bounded(single_fn, remaining, max_concurrency, time_left)
+        for task, feedback_text in done:
+            results[task["question_id"]] = feedback_text
+        for task in not_done:
+            results[task["question_id"]] = FEEDBACK_TIMEOUT_TEXT
+        if not_done:
+            logger.warning(f"Feedback deadline ({deadline}s) reached, {len(not_done)} of {len(tasks)} answers got a placeholder")
+    return results
+
+
+# --- Feedback Cache ---
+def normalize_answer(answer_text):
+    """Cache form of an answer: case, accents (e.g. Greek tonos) and whitespace are ignored."""
+    decomposed = unicodedata.normalize("NFD", " ".join(str(answer_text or "").split()).casefold())
+    return unicodedata.normalize("NFC", "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn"))
+
+def _answer_hash(answer_text):
+    return hashlib.sha256(normalize_answer(answer_text).encode("utf-8")).hexdigest()
+
+def get_cached_feedback(tasks):
+    """Returns {question_id: feedback} for tasks whose (question, normalized answer) is cached. One query."""
+    if not tasks:
+        return {}
+    wanted = {(task["question_id"], _answer_hash(task["student_answer"])) for task in tasks}
+    rows = db.session.execute(
+        db.select(FeedbackCacheEntry.question_id, FeedbackCacheEntry.answer_hash, FeedbackCacheEntry.feedback)
+        .filter(FeedbackCacheEntry.question_id.in_({qid for qid, _ in wanted}))
+    ).all()
+    hits = {row.question_id: row.feedback for row in rows if (row.question_id, row.answer_hash) in wanted}
+    if hits:
+        logger.info(f"Feedback cache: {len(hits)} of {len(tasks)} answers served from cache")
+    return hits
+
+def store_feedback_in_cache(tasks, results):
+    """Caches freshly generated feedback. Runs in its own transaction; a concurrent insert of the same key is ignored."""
+    stored = 0
+    for task in tasks:
+        feedback_text = results.get(task["question_id"])
+        if not feedback_text or feedback_text in _UNCACHEABLE_TEXTS:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(FeedbackCacheEntry(
+                    question_id=task["question_id"], answer_hash=_answer_hash(task["student_answer"]),
+                    normalized_answer=normalize_answer(task["student_answer"]), feedback=feedback_text
+                ))
+            stored += 1
+        except IntegrityError:
+            logger.debug(f"Feedback cache entry for QID:{task['question_id']} already exists")
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        logger.exception("Could not store feedback in cache"); return 0
+    return stored
+
+def generate_feedback_cached(tasks, priority=PRIORITY_NORMAL, deadline=FEEDBACK_DEADLINE_SECONDS):
+    """Cache lookup followed by generation for the misses. Returns ({question_id: feedback}, generated_tasks)."""
+    results = get_cached_feedback(tasks)
+    misses = [task for task in tasks if task["question_id"] not in results]
+    if misses:
+        results.update(generate_feedback(misses, deadline=deadline, priority=priority))
+    return results, misses
+
+
+# --- Deferred Feedback ---
+def _mark_attempt_feedback_failed(attempt_id, error):
+    pending = db.session.execute(
+        db.select(StudentAnswer).filter_by(attempt_id=attempt_id, feedback_status='pending')
+    ).scalars().all()
+    for answer in pending:
+        answer.feedback_status = 'failed'
+        answer.ai_feedback = FEEDBACK_ERROR_TEXT
+    logger.error(f"Deferred feedback for attempt {attempt_id} failed permanently: {error}")
+
+@job_handler(ATTEMPT_FEEDBACK_JOB, on_failure=_mark_attempt_feedback_failed)
+def generate_attempt_feedback(attempt_id):
+    """
+    Background job: generates feedback for the pending answers of a submitted attempt. Answers that got only a
+    placeholder or error text stay 'pending' and the job raises, so it is retried for them; after the last
+    attempt _mark_attempt_feedback_failed marks them 'failed'.
+    """
+    pending = db.session.execute(
+        db.select(StudentAnswer)
+        .options(db.selectinload(StudentAnswer.question).selectinload(Question.choices))
+        .filter_by(attempt_id=attempt_id, feedback_status='pending')
+    ).scalars().all()
+    if not pending:
+        logger.info(f"Attempt {attempt_id}: no pending feedback"); return
+
+    tasks = []
+    for answer in pending:
+        question = answer.question
+        tasks.append({
+            "question_id": answer.question_id,
+            "question_text": question.question_text if question else "N/A",
+            "student_answer": answer.answer_text or "N/A",
+            "correct_answer": (question.get_correct_answer_value() if question else None) or "N/A",
+        })
+    answer_ids = [answer.id for answer in pending]
+    db.session.commit() # Release the read transaction while the AI calls run
+
+    results, generated = generate_feedback_cached( # Nobody is waiting on it
+        tasks, priority=PRIORITY_BACKGROUND, deadline=FEEDBACK_JOB_DEADLINE_SECONDS
+    )
+    answers = db.session.execute(db.select(StudentAnswer).filter(StudentAnswer.id.in_(answer_ids))).scalars().all()
+    stored = 0
+    for answer in answers:
+        feedback_text = results.get(answer.question_id)
+        if not feedback_text or feedback_text in _UNCACHEABLE_TEXTS:
+            continue # Stays 'pending' for the retry
+        answer.ai_feedback = feedback_text
+        answer.feedback_status = 'ready'; stored += 1
+    db.session.commit()
+    store_feedback_in_cache(generated, results)
+    logger.info(f"Attempt {attempt_id}: stored deferred feedback for {stored} of {len(answers)} answers")
+    if stored < len(answers):
+        raise RuntimeError(f"No feedback generated for {len(answers) - stored} answer(s) of attempt {attempt_id}")
+
+def enqueue_attempt_feedback(attempt):
+    """Queues feedback generation for an attempt whose pending answers are in the current session."""
+    return enqueue_job(ATTEMPT_FEEDBACK_JOB, attempt.id)
@@ -0,0 +1,97 @@
+# backend/grading.py
+"""
+Grading against a precomputed answer key.
+
+A quiz's answer key (per question: type, text, the set of correct choice ids and
+the choice texts) is built with one query and cached in an LRU keyed by
+(quiz_id, version). Quiz.version is bumped by quiz_writer.sync_questions()
+whenever questions or choices change, so an edited quiz simply misses the cache
+and stale keys age out; nothing has to be invalidated explicitly.
+
+Submitted MCQ answers are matched by choice id. A list of ids is a
+multi-select answer and is correct only if it equals the set of correct
+choices. A single id is correct if it is any of the correct choices. Plain
+choice text is still accepted from older clients and is matched against the
+choice texts.
+"""
+import os
+import logging
+from collections import namedtuple
+
+from cache import LRUCache
+from database import db, Question, Choice
+
+logger = logging.getLogger(__name__)
+
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("ANSWER_KEY_CACHE_SIZE", "512"))
+_answer_key_cache = LRUCache(ANSWER_KEY_CACHE_SIZE, name="answer_key")
+
+# choice_texts: {choice_id: text}; ids_by_text: {text: (choice_id, ...)} for the text fallback
+QuestionKey = namedtuple("QuestionKey", "question_type question_text correct_ids choice_texts ids_by_text")
+# choice_id is set for single-choice answers; answer_text is what gets stored and shown
+GradedAnswer = namedtuple("GradedAnswer", "is_correct choice_id answer_text")
+
+
+# --- Answer Keys ---
+def _load_answer_key(quiz_id):
+    rows = db.session.execute(
+        db.select(
+            Question.id, Question.question_type, Question.question_text,
+            Choice.id.label("choice_id"), Choice.choice_text, Choice.is_correct,
+        )
+        .outerjoin(Choice, Choice.question_id == Question.id)
+        .filter(Question.quiz_id == quiz_id)
+    ).all()
+    parts = {}
+    for row in rows:
+        question = parts.setdefault(row.id, (row.question_type, row.question_text, set(), {}, {}))
+        if row.choice_id is None:
+            continue
+        if row.is_correct: question[2].add(row.choice_id)
+        question[3][row.choice_id] = row.choice_text
+        question[4].setdefault(row.choice_text, []).append(row.choice_id)
+    return {
+        qid: QuestionKey(q_type, q_text, frozenset(correct), texts, {text: tuple(ids) for text, ids in by_text.items()})
+        for qid, (q_type, q_text, correct, texts, by_text) in parts.items()
+    }
+
+def get_answer_key(quiz_id, version):
+    """{question_id: QuestionKey} for a quiz version, from the cache or built with one query."""
+    cache_key = (quiz_id, version)
+    answer_key = _answer_key_cache.get(cache_key)
+    if answer_key is None:
+        answer_key = _load_answer_key(quiz_id)
+        _answer_key_cache.set(cache_key, answer_key)
+        logger.debug(f"Built answer key for quiz {quiz_id} v{version} ({len(answer_key)} questions)")
+    return answer_key
+
+def correct_answer_text(key):
+    """Text of the correct choice(s), several joined with '; ' (as Question.get_correct_answer_value)."""
+    texts = [text for cid, text in key.choice_texts.items() if cid in key.correct_ids]
+    return "; ".join(texts) if texts else None
+
+
+# --- Grading ---
+def _resolve_choice(key, value):
+    """Maps a submitted choice id (or, from older clients, choice text) to a choice id, or None."""
+    if value in key.choice_texts:
+        return value
+    ids = key.ids_by_text.get(value, ())
+    # Duplicate texts: prefer a correct choice, as matching by text cannot tell them apart
+    return next((cid for cid in ids if cid in key.correct_ids), ids[0] if ids else None)
+
+def grade_answer(key, provided):
+    """Grades one submitted answer against a QuestionKey. is_correct is None for question types not graded here."""
+    if key.question_type != 'mcq':
+        return GradedAnswer(None, None, provided if isinstance(provided, str) else None)
+    if isinstance(provided, list): # Multi-select
+        chosen = {_resolve_choice(key, value) for value in provided if isinstance(value, str)}
+        chosen.discard(None)
+        text = "; ".join(key.choice_texts[cid] for cid in key.choice_texts if cid in chosen) or None
+        return GradedAnswer(bool(chosen) and chosen == key.correct_ids, None, text)
+    if not isinstance(provided, str) or not provided:
+        return GradedAnswer(False, None, None)
+    choice_id = _resolve_choice(key, provided)
+    if choice_id is None: # Unknown id or text (e.g. a choice edited after the quiz was loaded)
+        return GradedAnswer(False, None, provided)
+    return GradedAnswer(choice_id in key.correct_ids, choice_id, key.choice_texts[choice_id])
@@ -0,0 +1,69 @@
+# backend/ingestion.py
+"""
+Material ingestion pipeline: text extraction and summarization run as
+background jobs so /api/upload can answer immediately.
+
+Material.status walks through pending -> extracting -> summarizing -> ready,
+or ends in 'failed' once the job has used up its attempts.
+"""
+import os
+import logging
+
+from flask import current_app
+
+from database import db, Material
+from jobs import job_handler, enqueue_job
+from storage import find_processed_duplicate
+from retrieval import index_material
+from utils import extract_text, summarize_text
+
+logger = logging.getLogger(__name__)
+
+INGEST_MATERIAL_JOB = "ingest_material"
+
+
+def _set_status(material, status):
+    material.status = status
+    db.session.commit()
+    logger.info(f"Material {material.id} ('{material.filename}') -> {status}")
+
+def mark_material_failed(material_id, error):
+    material = db.session.get(Material, material_id)
+    if material:
+        material.status = 'failed'
+        material.error_message = str(error)[:2000]
+        logger.error(f"Ingestion of material {material_id} failed permanently: {error}")
+
+@job_handler(INGEST_MATERIAL_JOB, on_failure=mark_material_failed)
+def ingest_material(material_id):
+    """Extracts and summarizes an uploaded material, committing after each stage so progress is visible."""
+    material = db.session.get(Material, material_id)
+    if not material:
+        logger.warning(f"Ingestion: material {material_id} no longer exists, skipping"); return
+    if material.status == 'ready':
+        logger.info(f"Ingestion: material {material_id} already ready, skipping"); return
+
+    duplicate = find_processed_duplicate(material.content_hash, exclude_id=material.id)
+    if duplicate: # An identical upload finished processing while this job was queued
+        material.extracted_text = duplicate.extracted_text
+        material.summary = duplicate.summary
+        material.error_message = None
+        index_material(material)
+        logger.info(f"Ingestion: reusing results of material {duplicate.id} (same content) for {material_id}")
+        _set_status(material, 'ready'); return
+
+    full_filepath = os.path.join(current_app.root_path, material.filepath)
+    _set_status(material, 'extracting')
+    material.extracted_text = extract_text(full_filepath, material.filepath)
+    index_material(material)
+
+    _set_status(material, 'summarizing')
+    material.summary = summarize_text(material.extracted_text) if material.extracted_text else ""
+
+    material.error_message = None
+    _set_status(material, 'ready')
+
+def enqueue_material_ingestion(material):
+    """Queues ingestion for a freshly added (not yet committed) material."""
+    material.status = 'pending'
+    return enqueue_job(INGEST_MATERIAL_JOB, material.id)
@@ -0,0 +1,206 @@
+# backend/instrumentation.py
+"""
+Per-request instrumentation: SQL statement count and time, AI call count and time,
+and total duration.
+
+- SQLAlchemy cursor events (on every Engine) and utils' AI call wrappers add to the
+  RequestMetrics of the current request, held in a context variable. Work outside
+  a request (job workers, CLI) is not counted. Thread pools that work for a request
+  copy the context (see feedback._run_bounded), so their calls are counted too.
+- Every response gets a Server-Timing header (db, ai, total), visible in the
+  browser dev tools.
+- Per-route histograms are exposed in Prometheus text format at /metrics. A scraper
+  must send "Authorization: Bearer <METRICS_TOKEN>"; without METRICS_TOKEN the
+  endpoint is off, unless METRICS_PUBLIC=true. There is no exemption for loopback
+  clients: behind a reverse proxy request.remote_addr is the proxy's address
+  (usually 127.0.0.1), so it is not a security boundary.
+
+A streamed response's body is produced after its headers are sent. Work done
+while streaming therefore appears in neither its Server-Timing header nor its
+histograms.
+"""
+import os
+import hmac
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from flask import request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "") # Bearer token required by /metrics
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+# --- Per-Request Metrics ---
+class RequestMetrics:
+    """Counters for one request. Locked because feedback worker threads add AI calls concurrently."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.ai_count = 0
+        self.ai_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_sql(self, seconds):
+        with self._lock:
+            self.sql_count += 1; self.sql_seconds += seconds
+
+    def add_ai(self, seconds):
+        with self._lock:
+            self.ai_count += 1; self.ai_seconds += seconds
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+@contextmanager
+def ai_call_timer():
+    """Times an AI API call and counts it against the current request, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_ai(time.perf_counter() - started)
+
+
+# --- SQLAlchemy Hooks ---
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("instrumentation_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current.get()
+    started = conn.info.get("instrumentation_started")
+    if metrics is not None and started:
+        metrics.add_sql(time.perf_counter() - started.pop())
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("instrumentation_started") if exception_context.connection is not None else None
+    if _current.get() is not None and started:
+        started.pop() # A failed statement never reaches after_cursor_execute
+
+
+# --- Prometheus Histograms ---
+class Histogram:
+    """Minimal labelled Prometheus histogram (cumulative buckets, _sum and _count)."""
+
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value) # First bucket with value <= upper bound
+        with self._lock:
+            series = self._series.setdefault(labelvalues, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labelvalues, values in series_items:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]:g}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return "\n".join(lines)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+ROUTE_LABELS = ("method", "route")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request duration", SECONDS_BUCKETS, ROUTE_LABELS + ("status",))
+DB_QUERIES = Histogram("http_request_db_queries", "SQL statements per request", COUNT_BUCKETS, ROUTE_LABELS)
+DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in SQL statements per request", SECONDS_BUCKETS, ROUTE_LABELS)
+AI_CALLS = Histogram("http_request_ai_calls", "AI API calls per request", COUNT_BUCKETS, ROUTE_LABELS)
+AI_SECONDS = Histogram("http_request_ai_seconds", "Time spent in AI API calls per request", SECONDS_BUCKETS, ROUTE_LABELS)
+HISTOGRAMS = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, AI_CALLS, AI_SECONDS)
+
+def render_metrics():
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+
+
+# --- Flask Hooks ---
+def _route_label():
+    # The URL rule, not the path, so /api/quizzes/<id> is one series rather than one per quiz
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def _start_request():
+    request.environ["instrumentation.token"] = _current.set(RequestMetrics())
+
+def _finish_request(response):
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    total = time.perf_counter() - metrics.started
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.sql_count} queries", '
+        f'ai;dur={metrics.ai_seconds * 1000:.1f};desc="{metrics.ai_count} calls", '
+        f"total;dur={total * 1000:.1f}",
+    )
+    if request.endpoint != "metrics":
+        route = _route_label()
+        REQUEST_SECONDS.observe(total, request.method, route, str(response.status_code))
+        DB_QUERIES.observe(metrics.sql_count, request.method, route)
+        DB_SECONDS.observe(metrics.sql_seconds, request.method, route)
+        AI_CALLS.observe(metrics.ai_count, request.method, route)
+        AI_SECONDS.observe(metrics.ai_seconds, request.method, route)
+    return response
+
+def _end_request(exc):
+    token = request.environ.pop("instrumentation.token", None)
+    if token is None:
+        return
+    try:
+        _current.reset(token)
+    except ValueError: # Torn down from another context (e.g. after a streamed body)
+        _current.set(None)
+
+def init_instrumentation(app):
+    """Registers the request hooks and the /metrics endpoint. Call before the app's other before_request hooks."""
+    if not METRICS_ENABLED:
+        logger.info("Request instrumentation disabled (METRICS_ENABLED=false)"); return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+
+    @app.route("/metrics", methods=["GET"], endpoint="metrics")
+    def metrics():
+        if not METRICS_PUBLIC:
+            if not METRICS_TOKEN: return {"error": "Metrics are disabled (METRICS_TOKEN not set)."}, 403
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+                return {"error": "Invalid or missing metrics token."}, 401
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    if not (METRICS_TOKEN or METRICS_PUBLIC):
+        logger.info("/metrics is disabled until METRICS_TOKEN is set")
+    logger.info("Request instrumentation enabled (Server-Timing headers, /metrics)")
@@ -0,0 +1,184 @@
+# backend/jobs.py
+"""
+DB-backed background job queue.
+
+Jobs are rows in the `background_job` table, so anything queued survives a
+restart. Each process runs a small pool of worker threads that claim queued
+jobs with a conditional UPDATE (safe with several gunicorn workers) and
+dispatch them to the handler registered for the job's kind.
+"""
+import os
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from database import db, BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2")) # Worker threads per process (0 disables in-process workers)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5")) # Seconds an idle worker sleeps before polling again
+JOB_STALE_AFTER = timedelta(seconds=int(os.getenv("JOB_STALE_AFTER_SECONDS", "900"))) # Running jobs older than this are requeued
+
+# --- Handler Registry ---
+# kind -> (handler(target_id), on_failure(target_id, error) or None)
+JOB_HANDLERS = {}
+
+def job_handler(kind, on_failure=None):
+    """Registers a function as the handler for jobs of the given kind."""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = (fn, on_failure)
+        return fn
+    return decorator
+
+def enqueue_job(kind, target_id, max_attempts=3):
+    """Adds a job to the current session. The caller commits, so the job is only visible once its data is."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"No job handler registered for kind '{kind}'")
+    job = BackgroundJob(kind=kind, target_id=target_id, max_attempts=max_attempts)
+    db.session.add(job)
+    return job
+
+
+# --- Claiming and Running ---
+def requeue_stale_jobs():
+    """Puts jobs whose worker died mid-run (e.g. a restart) back in the queue."""
+    cutoff = datetime.utcnow() - JOB_STALE_AFTER
+    result = db.session.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.status == 'running', BackgroundJob.started_at < cutoff)
+        .values(status='queued', locked_by=None)
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.warning(f"Requeued {result.rowcount} stale background job(s)")
+    return result.rowcount
+
+def claim_next_job(worker_id):
+    """Atomically claims the oldest queued job. Returns its ID or None if the queue is empty."""
+    candidate_ids = db.session.execute(
+        db.select(BackgroundJob.id).filter_by(status='queued').order_by(BackgroundJob.created_at).limit(5)
+    ).scalars().all()
+    for job_id in candidate_ids:
+        result = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == 'queued')
+            .values(status='running', locked_by=worker_id, started_at=datetime.utcnow(), attempts=BackgroundJob.attempts + 1)
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+def run_job(job_id):
+    """Runs a claimed job and records the outcome. Failed jobs are retried until max_attempts."""
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        logger.warning(f"Claimed job {job_id} disappeared before it could run"); return
+    handler, on_failure = JOB_HANDLERS.get(job.kind, (None, None))
+    if handler is None:
+        logger.error(f"No handler for job kind '{job.kind}' (job {job_id}), marking failed")
+        job.status = 'failed'; job.last_error = "No handler registered"; job.finished_at = datetime.utcnow()
+        db.session.commit(); return
+
+    kind, target_id = job.kind, job.target_id
+    logger.info(f"Running job {job_id} ({kind} for {target_id}), attempt {job.attempts}/{job.max_attempts}")
+    try:
+        handler(target_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Job {job_id} ({kind} for {target_id}) failed: {e}")
+        job = db.session.get(BackgroundJob, job_id)
+        job.last_error = str(e)[:2000]
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+        else:
+            job.status = 'failed'; job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if job.status == 'failed' and on_failure:
+            try:
+                on_failure(target_id, e)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception(f"on_failure callback for job {job_id} raised")
+        return
+
+    job = db.session.get(BackgroundJob, job_id)
+    job.status = 'done'; job.finished_at = datetime.utcnow(); job.last_error = None
+    db.session.commit()
+    logger.info(f"Job {job_id} ({kind} for {target_id}) done")
+
+
+# --- Worker Pool ---
+class JobRunner:
+    """A pool of daemon threads that drain the job queue inside the Flask app context."""
+
+    def __init__(self, app, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    def ensure_started(self):
+        """Starts the worker threads once per process. Cheap to call on every request."""
+        if self._threads or self.workers <= 0:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            with self.app.app_context():
+                try:
+                    requeue_stale_jobs()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Could not requeue stale jobs on startup")
+            for idx in range(self.workers):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{idx}"
+                thread = threading.Thread(target=self._worker_loop, args=(worker_id,), name=f"job-worker-{idx}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} background job worker(s) in process {os.getpid()}")
+
+    def notify(self):
+        """Wakes idle workers so newly enqueued jobs start without waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Asks the workers to exit after their current job; with a timeout, waits up to that long for them."""
+        self._stop.set(); self._wake.set()
+        if timeout is not None:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    def run_forever(self, worker_id=None):
+        """Runs a single worker loop in the calling thread (used by the `flask run-jobs` command)."""
+        with self.app.app_context():
+            requeue_stale_jobs()
+        self._worker_loop(worker_id or f"{socket.gethostname()}:{os.getpid()}:cli")
+
+    def _worker_loop(self, worker_id):
+        while not self._stop.is_set():
+            job_id = None
+            try:
+                with self.app.app_context():
+                    job_id = claim_next_job(worker_id)
+                    if job_id:
+                        run_job(job_id)
+            except Exception:
+                logger.exception(f"Job worker {worker_id} loop error")
+            if job_id is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
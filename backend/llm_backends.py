@@ -0,0 +1,207 @@
+# backend/llm_backends.py
+"""
+LLM backends for the gateway (llm_gateway.py), chosen with LLM_BACKEND:
+
+- "openai" (default): the OpenAI SDK client.
+- "stub": StubLLMClient, a local, deterministic stand-in for load tests and
+  offline benchmarks. It needs no network access and no API key.
+
+A backend is any object with the SDK's `chat.completions.create(**kwargs)` shape.
+It returns a response with `.choices[0].message.content` and `.usage`, or, with
+stream=True, an iterator of chunks with `.choices[0].delta.content` and a final
+`.usage` chunk. The gateway's scheduling, retries and deadlines apply to every
+backend.
+
+Stub configuration (environment):
+  LLM_STUB_LATENCY_MS     time to first byte: "fixed:200", "uniform:50,400",
+                          "normal:300,80" or "lognormal:250,0.5" (median ms, sigma)
+  LLM_STUB_TOKENS_PER_SEC streaming / generation speed after the first byte
+  LLM_STUB_REPLY_TOKENS   length of free-text replies, in tokens (words)
+  LLM_STUB_FAILURE_RATE   share of calls that fail (0-1)
+  LLM_STUB_FAILURES       comma list of failure kinds: rate_limit, server_error, timeout
+  LLM_STUB_SEED           seed for latencies and failures
+
+Response text depends only on the prompt. Latencies and failures come from one
+seeded generator, so a sequential run is fully reproducible. The stub returns
+valid JSON for quiz generation and batch feedback prompts.
+"""
+import os
+import re
+import json
+import time
+import math
+import random
+import hashlib
+import logging
+import threading
+
+import openai
+
+try:
+    import httpx
+except ImportError: # Bundled with the openai SDK; needed only to build the injected API errors
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+
+STUB_WORDS = (
+    "η απάντηση βασίζεται στο υλικό του μαθήματος και εξηγεί την έννοια με απλά λόγια "
+    "the answer draws on the course material and explains the concept step by step with an example"
+).split()
+
+_QUIZ_PROMPT_RE = re.compile(r"generate (\d+) quiz questions")
+_BATCH_FEEDBACK_MARKER = '"question_id": "<question_id from the input>"'
+
+
+# --- Response Objects (the subset of the SDK's shapes the app reads) ---
+class _Usage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+    def model_dump(self):
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "total_tokens": self.total_tokens}
+
+class _Message:
+    def __init__(self, content):
+        self.role = "assistant"
+        self.content = content
+
+class _Choice:
+    def __init__(self, content):
+        self.index = 0
+        self.message = _Message(content)
+        self.finish_reason = "stop"
+
+class _Response:
+    def __init__(self, model, content, usage):
+        self.model = model
+        self.choices = [_Choice(content)]
+        self.usage = usage
+
+class _Delta:
+    def __init__(self, content):
+        self.content = content
+
+class _ChunkChoice:
+    def __init__(self, content):
+        self.index = 0
+        self.delta = _Delta(content)
+
+class _Chunk:
+    def __init__(self, content=None, usage=None):
+        self.choices = [_ChunkChoice(content)] if content is not None else []
+        self.usage = usage
+
+
+# --- Stub Backend ---
+def _parse_latency(spec):
+    """Returns a function rng -> seconds for a latency spec (see module docstring)."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        low, high = values[0], values[1] if len(values) > 1 else values[0]
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == "normal":
+        mean, stddev = values[0], values[1] if len(values) > 1 else 0.0
+        return lambda rng: max(0.0, rng.gauss(mean, stddev)) / 1000
+    if kind == "lognormal":
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda rng: rng.lognormvariate(math.log(max(median, 1e-3)), sigma) / 1000
+    raise ValueError(f"Unknown LLM_STUB_LATENCY_MS distribution '{kind}'")
+
+def _count_tokens(text):
+    return max(1, len(text) // 4)
+
+def _stub_error(kind):
+    if httpx is None:
+        return ConnectionError(f"Injected stub failure: {kind}")
+    request = httpx.Request("POST", "http://llm-stub.local/v1/chat/completions")
+    if kind == "timeout":
+        return openai.APITimeoutError(request=request)
+    status, error_cls = (429, openai.RateLimitError) if kind == "rate_limit" else (500, openai.InternalServerError)
+    headers = {"retry-after": "1"} if status == 429 else {}
+    return error_cls(f"Injected stub failure: {kind}", response=httpx.Response(status, headers=headers, request=request), body=None)
+
+
+class StubLLMClient:
+    """Deterministic local backend with the OpenAI client's chat.completions.create shape."""
+
+    def __init__(self, latency=None, tokens_per_second=None, reply_tokens=None, failure_rate=None, failures=None, seed=None):
+        self.latency = _parse_latency(latency or os.getenv("LLM_STUB_LATENCY_MS", "lognormal:400,0.4"))
+        self.tokens_per_second = float(tokens_per_second or os.getenv("LLM_STUB_TOKENS_PER_SEC", "80"))
+        self.reply_tokens = int(reply_tokens or os.getenv("LLM_STUB_REPLY_TOKENS", "60"))
+        self.failure_rate = float(failure_rate if failure_rate is not None else os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+        self.failures = [f.strip() for f in (failures or os.getenv("LLM_STUB_FAILURES", "rate_limit,server_error,timeout")).split(",") if f.strip()]
+        self._rng = random.Random(int(seed if seed is not None else os.getenv("LLM_STUB_SEED", "42")))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chat = self # client.chat.completions.create(...)
+        self.completions = self
+
+    def _draw(self):
+        """(first-byte latency, failure kind or None) from the shared seeded generator."""
+        with self._lock:
+            self.calls += 1
+            latency = self.latency(self._rng)
+            fails = self.failures and self._rng.random() < self.failure_rate
+            return latency, (self._rng.choice(self.failures) if fails else None)
+
+    def _reply(self, messages):
+        prompt = (messages[-1].get("content") or "") if messages else ""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        quiz = _QUIZ_PROMPT_RE.search(prompt)
+        if quiz:
+            return json.dumps([
+                {
+                    "text": f"Ερώτηση {i + 1}: ποια πρόταση συμφωνεί με το κείμενο;",
+                    "type": "mcq",
+                    "choices": [f"Επιλογή {chr(65 + c)} ({digest[i % len(digest)] % 97})" for c in range(4)],
+                    "correct_answer_index": digest[i % len(digest)] % 4,
+                }
+                for i in range(int(quiz.group(1)))
+            ], ensure_ascii=False)
+        if _BATCH_FEEDBACK_MARKER in prompt:
+            items, _ = json.JSONDecoder().raw_decode(prompt, prompt.index("["))
+            return json.dumps([
+                {"question_id": item["question_id"], "feedback": "Ξαναδιάβασε την ενότητα: η σωστή ιδέα διαφέρει από αυτό που επέλεξες."}
+                for item in items
+            ], ensure_ascii=False)
+        start = digest[0] % len(STUB_WORDS)
+        return " ".join(STUB_WORDS[(start + i) % len(STUB_WORDS)] for i in range(self.reply_tokens))
+
+    def create(self, model=None, messages=(), stream=False, stream_options=None, timeout=None, **params):
+        latency, failure = self._draw()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout); raise _stub_error("timeout")
+        time.sleep(latency)
+        if failure:
+            logger.info(f"LLM stub: injecting {failure}")
+            raise _stub_error(failure)
+        content = self._reply(list(messages))
+        prompt_tokens = sum(_count_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = _count_tokens(content)
+        if params.get("max_tokens"):
+            completion_tokens = min(completion_tokens, params["max_tokens"])
+        usage = _Usage(prompt_tokens, completion_tokens)
+        if stream:
+            return self._stream(content, usage if (stream_options or {}).get("include_usage") else None)
+        time.sleep(completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+        return _Response(model, content, usage)
+
+    def _stream(self, content, usage):
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for piece in pieces:
+            time.sleep(delay)
+            yield _Chunk(piece)
+        if usage is not None:
+            yield _Chunk(usage=usage)
+
+
+BACKENDS = {"stub": StubLLMClient}
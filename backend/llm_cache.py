@@ -0,0 +1,89 @@
+# backend/llm_cache.py
+"""
+Persistent cache of AI responses for calls whose output is worth reusing:
+material summaries and quiz generation, where teachers often repeat the same
+request. It lives in the llm_response_cache table, so it survives restarts and
+is shared by all workers.
+
+- The key is a SHA-256 of the model, messages and sampling parameters, so any
+  change to the prompt or the settings is a different entry.
+- Each entry has a TTL (expires_at). The table is capped at
+  LLM_CACHE_MAX_ENTRIES; past that, the least recently used entries go first.
+- Callers opt in by passing a TTL (see utils.generate_ai_response). fresh=True
+  skips the lookup but still stores the new answer.
+
+Reads and writes run on their own engine connection in a short transaction of
+their own. They never commit or roll back the caller's session, so they are
+safe inside job handlers. Without an app context (e.g. a feedback worker
+thread), the cache is skipped. It is best effort: a database error is logged
+and treated as a miss.
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+from sqlalchemy import func
+
+from database import db, LLMResponseCacheEntry
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+_table = LLMResponseCacheEntry.__table__
+
+
+def response_cache_key(model, messages, params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _usable():
+    return LLM_CACHE_ENABLED and has_app_context()
+
+def get_cached_response(cache_key):
+    """(response_text, usage_dict) for a live entry, or None. A hit refreshes the entry's LRU position."""
+    if not _usable():
+        return None
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            row = conn.execute(
+                db.select(_table.c.response, _table.c.usage).where(_table.c.cache_key == cache_key, _table.c.expires_at > now)
+            ).one_or_none()
+            if row is None:
+                return None
+            conn.execute(
+                _table.update().where(_table.c.cache_key == cache_key)
+                .values(last_used_at=now, hit_count=_table.c.hit_count + 1)
+            )
+    except Exception as e:
+        logger.warning(f"LLM response cache lookup failed, treating as a miss: {e}")
+        return None
+    logger.info(f"LLM response cache hit {cache_key[:12]}")
+    return row.response, (json.loads(row.usage) if row.usage else None)
+
+def store_cached_response(cache_key, model, response_text, usage, ttl_seconds):
+    """Stores (or replaces) an entry, then drops expired entries and trims the table to LLM_CACHE_MAX_ENTRIES."""
+    if not _usable() or not response_text:
+        return
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(_table.delete().where(_table.c.cache_key == cache_key))
+            conn.execute(_table.insert().values(
+                cache_key=cache_key, model=model, response=response_text,
+                usage=json.dumps(usage) if usage is not None else None,
+                created_at=now, expires_at=now + timedelta(seconds=ttl_seconds), last_used_at=now, hit_count=0,
+            ))
+            conn.execute(_table.delete().where(_table.c.expires_at <= now))
+            excess = conn.execute(db.select(func.count()).select_from(_table)).scalar_one() - LLM_CACHE_MAX_ENTRIES
+            if excess > 0:
+                oldest = db.select(_table.c.cache_key).order_by(_table.c.last_used_at).limit(excess).scalar_subquery()
+                conn.execute(_table.delete().where(_table.c.cache_key.in_(oldest)))
+                logger.info(f"LLM response cache: evicted {excess} least recently used entries")
+    except Exception as e:
+        logger.warning(f"Could not store LLM response in cache: {e}")
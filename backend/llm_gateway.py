@@ -0,0 +1,250 @@
+# backend/llm_gateway.py
+"""
+Single entry point for OpenAI chat calls (or a local backend, see llm_backends.py).
+
+- One shared client. Its HTTP connection pool is sized for the gateway's
+  concurrency, and it has connect and read timeouts. The SDK's own retries are
+  off; retries are done here.
+- Admission control: a call needs a free concurrency slot, one request from the
+  requests-per-minute bucket and its estimated tokens from the tokens-per-minute
+  bucket. Waiting calls are admitted highest priority first, FIFO within a
+  priority, so student chat goes ahead of feedback and background
+  summarization. A 429 pauses admission for everyone for the Retry-After period.
+- Retries: 429, timeouts, connection errors and 5xx are retried with full-jitter
+  exponential backoff, at least Retry-After when the API sends one.
+- Deadlines: each call has one budget (timeout seconds) covering queueing,
+  attempts and backoff. Each attempt's HTTP timeout is cut to what is left.
+  Running out raises LLMUnavailable.
+"""
+import os
+import time
+import heapq
+import random
+import logging
+import threading
+import itertools
+
+import openai
+from openai import OpenAI
+
+from instrumentation import ai_call_timer
+from llm_backends import LLM_BACKEND, BACKENDS
+from prompt_budget import count_tokens, MESSAGE_OVERHEAD_TOKENS
+
+try:
+    import httpx
+except ImportError: # Bundled with the openai SDK; only the pool tuning needs it directly
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8")) # Calls in flight at once (also the HTTP pool size)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "3000"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "160000"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+# Priority classes: lower is admitted first
+PRIORITY_INTERACTIVE = 0 # Student chat, teacher sandbox
+PRIORITY_NORMAL = 1 # Quiz generation, inline feedback
+PRIORITY_BACKGROUND = 2 # Deferred feedback, material summaries
+DEFAULT_TIMEOUTS = {PRIORITY_INTERACTIVE: 45.0, PRIORITY_NORMAL: 90.0, PRIORITY_BACKGROUND: 300.0}
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) # APITimeoutError is an APIConnectionError
+
+
+class LLMUnavailable(Exception):
+    """The call could not be completed within its deadline (rate limited, overloaded or failing upstream)."""
+
+
+# --- Token Buckets ---
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to per_minute. Not locked; the scheduler holds its lock."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity) # A call larger than the bucket waits for a full bucket, not forever
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount # May go negative (actual usage above the estimate): later calls wait it off
+
+
+class _Scheduler:
+    """Priority admission over a concurrency limit and the request/token buckets."""
+
+    def __init__(self, max_concurrency, requests_per_minute, tokens_per_minute):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.active = 0
+        self.paused_until = 0.0
+        self._waiting = [] # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, tokens, deadline):
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None # None: woken by release or a new head
+                    if self._waiting[0] == entry and self.active < self.max_concurrency:
+                        wait = max(self.paused_until - now, self.requests.seconds_until(1, now), self.tokens.seconds_until(tokens, now))
+                        if wait <= 0:
+                            heapq.heappop(self._waiting)
+                            self.requests.take(1); self.tokens.take(tokens); self.active += 1
+                            self._cond.notify_all() # The next waiter is now at the head
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise LLMUnavailable("The AI service is busy right now. Please try again in a moment.")
+                    self._cond.wait(min(remaining, wait) if wait is not None else remaining)
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry); heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def release(self, estimated_tokens, used_tokens=None):
+        with self._cond:
+            self.active -= 1
+            if used_tokens is not None:
+                self.tokens.take(used_tokens - estimated_tokens) # Refund or charge the difference
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            logger.warning(f"LLM gateway: rate limited, pausing admissions for {seconds:.1f}s")
+
+
+# --- Gateway ---
+def _build_client():
+    """The backend selected by LLM_BACKEND (see llm_backends.py); "openai" is the SDK client with a tuned pool."""
+    if LLM_BACKEND != "openai":
+        if LLM_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}' (expected openai or {', '.join(BACKENDS)})")
+        logger.warning(f"LLM gateway using the '{LLM_BACKEND}' backend: no real AI calls are made")
+        return BACKENDS[LLM_BACKEND]()
+    kwargs = {"max_retries": 0, "timeout": LLM_READ_TIMEOUT} # Retries and deadlines are handled by the gateway
+    if httpx is not None:
+        kwargs["http_client"] = httpx.Client(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY, keepalive_expiry=30.0),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+    return OpenAI(**kwargs) # Uses OPENAI_API_KEY from environment
+
+def _retry_after(error):
+    """Seconds from a Retry-After(-ms) header on an API error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def _estimate_tokens(messages, max_tokens):
+    """Admission estimate: prompt tokens plus the completion limit. Corrected with the reported usage afterwards."""
+    prompt = sum(count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for message in messages)
+    return prompt + (max_tokens or 0)
+
+def _used_tokens(usage):
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+class LLMGateway:
+    def __init__(self, client=None, max_concurrency=LLM_MAX_CONCURRENCY,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.client = client
+        self.scheduler = _Scheduler(max_concurrency, requests_per_minute, tokens_per_minute)
+
+    @property
+    def available(self):
+        return self.client is not None
+
+    def _create(self, priority, timeout, messages, params):
+        """Admits and sends one request with retries. Returns (result, estimated_tokens); the caller releases the slot."""
+        deadline = time.monotonic() + (timeout or DEFAULT_TIMEOUTS.get(priority, LLM_READ_TIMEOUT))
+        estimated = _estimate_tokens(messages, params.get("max_tokens"))
+        attempt = 0
+        while True:
+            self.scheduler.acquire(priority, estimated, deadline)
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMUnavailable("The AI service did not respond in time.")
+                result = self.client.chat.completions.create(messages=messages, timeout=min(LLM_READ_TIMEOUT, remaining), **params)
+                return result, estimated
+            except RETRYABLE_ERRORS as e:
+                self.scheduler.release(estimated, 0) # Refund the tokens of a failed attempt
+                retry_after = _retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    self.scheduler.pause(retry_after if retry_after is not None else LLM_RETRY_BASE_DELAY)
+                delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt)) # Full jitter
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                attempt += 1
+                if attempt > LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    logger.error(f"LLM call failed after {attempt} attempt(s): {type(e).__name__}: {e}")
+                    raise LLMUnavailable("The AI service is busy right now. Please try again in a moment.") from e
+                logger.warning(f"LLM call attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+            except BaseException:
+                self.scheduler.release(estimated, 0)
+                raise
+
+    def chat(self, messages, priority=PRIORITY_NORMAL, timeout=None, **params):
+        """
+        chat.completions.create through the scheduler. timeout is the whole call's budget in seconds
+        (default per priority). Raises LLMUnavailable when it runs out; other API errors propagate.
+        """
+        with ai_call_timer():
+            response, estimated = self._create(priority, timeout, messages, params)
+        self.scheduler.release(estimated, _used_tokens(getattr(response, "usage", None)))
+        return response
+
+    def stream_chat(self, messages, priority=PRIORITY_INTERACTIVE, timeout=None, **params):
+        """
+        Streaming chat: yields chunks. The concurrency slot is held until the stream ends or is closed.
+        Only opening the stream is retried; a stream that fails midway raises.
+        """
+        with ai_call_timer():
+            stream, estimated = self._create(priority, timeout, messages, dict(params, stream=True))
+        used = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    used = _used_tokens(chunk.usage)
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close: close() # Release the upstream HTTP connection
+            self.scheduler.release(estimated, used)
+
+
+try:
+    gateway = LLMGateway(_build_client())
+except Exception as e:
+    logger.error(f"Failed to initialize OpenAI client: {e}")
+    gateway = LLMGateway(None)
@@ -0,0 +1,50 @@
+"""Add background_job table and ingestion status to Material
+
+Revision ID: 1b7d3e9a5c21
+Revises: c8ba4f103e90
+Create Date: 2026-10-16 10:12:41.512830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7d3e9a5c21'
+down_revision = 'c8ba4f103e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('background_job',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('target_id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('locked_by', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('background_job', schema=None) as batch_op:
+        batch_op.create_index('ix_background_job_status_created_at', ['status', 'created_at'], unique=False)
+
+    with op.batch_alter_table('material', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+        batch_op.add_column(sa.Column('error_message', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('material', schema=None) as batch_op:
+        batch_op.drop_column('error_message')
+        batch_op.drop_column('status')
+
+    with op.batch_alter_table('background_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_background_job_status_created_at')
+
+    op.drop_table('background_job')
@@ -0,0 +1,38 @@
+"""Add stored_file content-hash index and Material.content_hash
+
+Revision ID: 5e2f8c0d7a43
+Revises: 1b7d3e9a5c21
+Create Date: 2026-10-16 11:03:17.204955
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2f8c0d7a43'
+down_revision = '1b7d3e9a5c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stored_file',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('filepath', sa.String(length=512), nullable=False),
+    sa.Column('size_bytes', sa.Integer(), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+    with op.batch_alter_table('material', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_material_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('material', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_material_content_hash'))
+        batch_op.drop_column('content_hash')
+
+    op.drop_table('stored_file')
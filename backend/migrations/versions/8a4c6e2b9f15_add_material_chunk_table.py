@@ -0,0 +1,36 @@
+"""Add material_chunk table for retrieval
+
+Revision ID: 8a4c6e2b9f15
+Revises: 5e2f8c0d7a43
+Create Date: 2026-10-16 12:26:50.871346
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4c6e2b9f15'
+down_revision = '5e2f8c0d7a43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('material_chunk',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('material_id', sa.String(length=36), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['material.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('material_chunk', schema=None) as batch_op:
+        batch_op.create_index('ix_material_chunk_material_id_chunk_index', ['material_id', 'chunk_index'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('material_chunk', schema=None) as batch_op:
+        batch_op.drop_index('ix_material_chunk_material_id_chunk_index')
+
+    op.drop_table('material_chunk')
@@ -0,0 +1,40 @@
+"""Add quiz version and student answer choice id
+
+Revision ID: a7d2f4c8e631
+Revises: f1c3e5a7b902
+Create Date: 2026-10-17 10:21:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2f4c8e631'
+down_revision = 'f1c3e5a7b902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('student_answer', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('choice_id', sa.String(length=36), nullable=True))
+
+    # Existing answers stored the choice text; link them to the choice with that text where there is one
+    op.execute("""
+        UPDATE student_answer SET choice_id = (
+            SELECT MIN(choice.id) FROM choice
+            WHERE choice.question_id = student_answer.question_id AND choice.choice_text = student_answer.answer_text
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('student_answer', schema=None) as batch_op:
+        batch_op.drop_column('choice_id')
+
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.drop_column('version')
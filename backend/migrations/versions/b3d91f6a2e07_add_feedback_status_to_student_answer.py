@@ -0,0 +1,26 @@
+"""Add feedback_status to StudentAnswer for deferred feedback
+
+Revision ID: b3d91f6a2e07
+Revises: 8a4c6e2b9f15
+Create Date: 2026-10-16 14:08:33.119482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d91f6a2e07'
+down_revision = '8a4c6e2b9f15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student_answer', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('feedback_status', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('student_answer', schema=None) as batch_op:
+        batch_op.drop_column('feedback_status')
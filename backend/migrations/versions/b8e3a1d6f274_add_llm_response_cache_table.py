@@ -0,0 +1,41 @@
+"""Add llm_response_cache table
+
+Revision ID: b8e3a1d6f274
+Revises: a7d2f4c8e631
+Create Date: 2026-10-17 12:04:51.903126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e3a1d6f274'
+down_revision = 'a7d2f4c8e631'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('llm_response_cache',
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('usage', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_response_cache_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_llm_response_cache_last_used_at'), ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_response_cache_last_used_at'))
+        batch_op.drop_index(batch_op.f('ix_llm_response_cache_expires_at'))
+
+    op.drop_table('llm_response_cache')
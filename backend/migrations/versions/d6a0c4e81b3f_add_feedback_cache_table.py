@@ -0,0 +1,34 @@
+"""Add feedback_cache table
+
+Revision ID: d6a0c4e81b3f
+Revises: b3d91f6a2e07
+Create Date: 2026-10-16 15:21:05.640217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a0c4e81b3f'
+down_revision = 'b3d91f6a2e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feedback_cache',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('question_id', sa.String(length=36), nullable=False),
+    sa.Column('answer_hash', sa.String(length=64), nullable=False),
+    sa.Column('normalized_answer', sa.Text(), nullable=False),
+    sa.Column('feedback', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('question_id', 'answer_hash', name='uq_feedback_cache_question_answer')
+    )
+
+
+def downgrade():
+    op.drop_table('feedback_cache')
@@ -0,0 +1,41 @@
+"""Add denormalized question/attempt statistics to Quiz
+
+Revision ID: e4b7a2c9d150
+Revises: d6a0c4e81b3f
+Create Date: 2026-10-16 23:31:04.502117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7a2c9d150'
+down_revision = 'd6a0c4e81b3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('question_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('attempt_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('avg_score', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('last_attempt_at', sa.DateTime(), nullable=True))
+
+    # Initial backfill for existing rows; `flask backfill-quiz-stats` recomputes the same values later
+    op.execute("""
+        UPDATE quiz SET
+            question_count = (SELECT COUNT(question.id) FROM question WHERE question.quiz_id = quiz.id),
+            attempt_count = (SELECT COUNT(a.id) FROM student_quiz_attempt a WHERE a.quiz_id = quiz.id AND a.submitted_at IS NOT NULL),
+            avg_score = (SELECT AVG(a.score) FROM student_quiz_attempt a WHERE a.quiz_id = quiz.id AND a.submitted_at IS NOT NULL),
+            last_attempt_at = (SELECT MAX(a.submitted_at) FROM student_quiz_attempt a WHERE a.quiz_id = quiz.id AND a.submitted_at IS NOT NULL)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('quiz', schema=None) as batch_op:
+        batch_op.drop_column('last_attempt_at')
+        batch_op.drop_column('avg_score')
+        batch_op.drop_column('attempt_count')
+        batch_op.drop_column('question_count')
@@ -0,0 +1,70 @@
+"""Add analytics rollup tables
+
+Revision ID: f1c3e5a7b902
+Revises: e4b7a2c9d150
+Create Date: 2026-10-16 23:48:12.640381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3e5a7b902'
+down_revision = 'e4b7a2c9d150'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('quiz_rollup',
+    sa.Column('quiz_id', sa.String(length=36), nullable=False),
+    sa.Column('attempt_count', sa.Integer(), nullable=False),
+    sa.Column('student_count', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.Column('score_sq_sum', sa.Float(), nullable=False),
+    sa.Column('answer_count', sa.Integer(), nullable=False),
+    sa.Column('correct_count', sa.Integer(), nullable=False),
+    sa.Column('last_attempt_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id'], ),
+    sa.PrimaryKeyConstraint('quiz_id')
+    )
+    op.create_table('question_rollup',
+    sa.Column('question_id', sa.String(length=36), nullable=False),
+    sa.Column('quiz_id', sa.String(length=36), nullable=False),
+    sa.Column('answer_count', sa.Integer(), nullable=False),
+    sa.Column('correct_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+    sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id'], ),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    with op.batch_alter_table('question_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_question_rollup_quiz_id'), ['quiz_id'], unique=False)
+
+    op.create_table('student_quiz_rollup',
+    sa.Column('student_id', sa.String(length=36), nullable=False),
+    sa.Column('quiz_id', sa.String(length=36), nullable=False),
+    sa.Column('attempt_count', sa.Integer(), nullable=False),
+    sa.Column('best_score', sa.Float(), nullable=True),
+    sa.Column('last_score', sa.Float(), nullable=True),
+    sa.Column('last_attempt_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'quiz_id')
+    )
+    with op.batch_alter_table('student_quiz_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_student_quiz_rollup_quiz_id'), ['quiz_id'], unique=False)
+
+    # Existing history is loaded with `flask rebuild-analytics-rollups`
+
+
+def downgrade():
+    with op.batch_alter_table('student_quiz_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_student_quiz_rollup_quiz_id'))
+
+    op.drop_table('student_quiz_rollup')
+    with op.batch_alter_table('question_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_question_rollup_quiz_id'))
+
+    op.drop_table('question_rollup')
+    op.drop_table('quiz_rollup')
@@ -0,0 +1,170 @@
+# backend/prompt_budget.py
+"""
+Token counting and token-budgeted prompt assembly.
+
+Each request gets a token budget: the model's context window minus the expected
+completion, the user's message and a small safety margin. A system prompt is
+assembled to fit it, in this order of priority:
+
+1. Instruction text: the prompt's text blocks and the instructions of its
+   material blocks. It is kept whole unless it alone exceeds the budget. Then
+   later blocks are trimmed first, because the opening blocks usually set the
+   assistant's role.
+2. Material context: the remainder is split across material blocks max-min
+   fairly. A block that needs less than an equal share gets what it needs, and
+   the rest share what is left. No block gets more than
+   PROMPT_MATERIAL_MAX_TOKENS. Each block takes its chunks best-ranked first,
+   skipping any that do not fit, and shows them in document order.
+
+Tokens are counted with tiktoken when it is installed (TOKENIZER_ENCODING). If
+it is missing, or its encoding cannot be loaded, a heuristic is used instead:
+about 4 characters per token for ASCII and 2 for other scripts such as Greek.
+The heuristic errs on the high side, so prompts stay within the window.
+"""
+import os
+import math
+import logging
+import threading
+from collections import namedtuple
+
+try:
+    import tiktoken
+except ImportError: # Optional: the character heuristic is used instead
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "16385")) # gpt-3.5-turbo
+PROMPT_MATERIAL_MAX_TOKENS = int(os.getenv("PROMPT_MATERIAL_MAX_TOKENS", "3000")) # Cap per material block, also with budget to spare
+PROMPT_RESERVE_TOKENS = int(os.getenv("PROMPT_RESERVE_TOKENS", "500")) # Kept for the user message when it is not known yet (or shorter)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+MESSAGE_OVERHEAD_TOKENS = 4 # Per chat message: role and separators
+SAFETY_MARGIN_TOKENS = 64
+MIN_MATERIAL_TOKENS = 50 # A material share smaller than this is left out rather than cut to a fragment
+
+CHUNK_SEPARATOR = "\n...\n"
+
+Instruction = namedtuple("Instruction", "text")
+# chunks: [(position, text, tokens), ...] best-ranked first
+MaterialContext = namedtuple("MaterialContext", "name instruction chunks")
+
+
+# --- Counting ---
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e: # e.g. the encoding file cannot be downloaded
+                    _encoding_failed = True
+                    logger.warning(f"tiktoken encoding '{TOKENIZER_ENCODING}' unavailable, estimating tokens from characters: {e}")
+    return _encoding
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+def trim_to_tokens(text, max_tokens):
+    """Longest prefix of text within max_tokens, cut back to a word boundary when one is near."""
+    if max_tokens <= 0 or not text:
+        return ""
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        trimmed = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        while trimmed and count_tokens(trimmed) > max_tokens: # Decoding a cut multi-byte character can add a token
+            trimmed = trimmed[:-1]
+    else:
+        cut = int(len(text) * max_tokens / total)
+        while cut > 0 and count_tokens(text[:cut]) > max_tokens:
+            cut = int(cut * 0.95)
+        trimmed = text[:cut]
+    space = trimmed.rfind(" ")
+    return trimmed[:space] if space > len(trimmed) * 0.8 else trimmed
+
+
+# --- Budgets ---
+def prompt_token_budget(other_text, completion_tokens, context_window=None):
+    """
+    Tokens left for a system prompt (or context) in a request whose other message text is other_text,
+    at least PROMPT_RESERVE_TOKENS being kept for it, and whose completion may use completion_tokens.
+    """
+    window = context_window or LLM_CONTEXT_WINDOW
+    other = max(count_tokens(other_text), PROMPT_RESERVE_TOKENS)
+    return max(0, window - completion_tokens - other - 2 * MESSAGE_OVERHEAD_TOKENS - SAFETY_MARGIN_TOKENS)
+
+def share_budget(demands, total):
+    """Max-min fair split of total over demands: small demands are met in full, the rest share equally. Ties go by position."""
+    allocation = [0] * len(demands)
+    remaining = max(0, total)
+    order = sorted(range(len(demands)), key=lambda i: (demands[i], i))
+    for n, i in enumerate(order):
+        allocation[i] = min(demands[i], remaining // (len(order) - n))
+        remaining -= allocation[i]
+    return allocation
+
+
+# --- Assembly ---
+def material_section(name, text):
+    return f"\n\n--- Context from Material: {name} ---\n{text}\n--- End Context from Material: {name} ---\n\n"
+
+def _select_chunks(chunks, budget):
+    """Best-ranked chunks that fit within budget, joined in document order. The top chunk is trimmed if nothing fits whole."""
+    selected, used = [], 0
+    separator = count_tokens(CHUNK_SEPARATOR)
+    for position, text, tokens in chunks:
+        cost = tokens + (separator if selected else 0)
+        if used + cost <= budget:
+            selected.append((position, text)); used += cost
+    if not selected and chunks and budget >= MIN_MATERIAL_TOKENS:
+        position, text, _ = chunks[0]
+        selected.append((position, trim_to_tokens(text, budget)))
+    return CHUNK_SEPARATOR.join(text for _, text in sorted(selected))
+
+def assemble_system_prompt(blocks, budget):
+    """Renders Instruction and MaterialContext blocks as one system prompt of at most ~budget tokens (see module docstring)."""
+    instructions = [block.text if isinstance(block, Instruction) else block.instruction for block in blocks]
+    instruction_tokens = [count_tokens(text) for text in instructions]
+    if sum(instruction_tokens) > budget:
+        logger.warning(f"Prompt instructions ({sum(instruction_tokens)} tokens) exceed the budget of {budget}; trimming the last blocks")
+        left = budget
+        for idx, tokens in enumerate(instruction_tokens):
+            if tokens > left:
+                instructions[idx] = trim_to_tokens(instructions[idx], left)
+            left = max(0, left - tokens)
+    material_budget = max(0, budget - sum(instruction_tokens))
+
+    materials = [idx for idx, block in enumerate(blocks) if isinstance(block, MaterialContext) and block.chunks]
+    wrappers = {idx: count_tokens(material_section(blocks[idx].name, "")) for idx in materials}
+    separator = count_tokens(CHUNK_SEPARATOR)
+    demands = [
+        min(PROMPT_MATERIAL_MAX_TOKENS, wrappers[idx] + sum(tokens + separator for _, _, tokens in blocks[idx].chunks))
+        for idx in materials
+    ]
+    shares = dict(zip(materials, share_budget(demands, material_budget)))
+
+    parts = []
+    for idx, block in enumerate(blocks):
+        if isinstance(block, MaterialContext):
+            share = shares.get(idx, 0)
+            context = _select_chunks(block.chunks, share - wrappers[idx]) if share > wrappers.get(idx, 0) else ""
+            if context:
+                parts.append(material_section(block.name, context))
+            elif block.chunks:
+                logger.warning(f"No token budget left for material '{block.name}' ({share} tokens); left out of the prompt")
+        parts.append(instructions[idx])
+    return "\n\n".join(filter(None, parts)) # Join non-empty parts
@@ -0,0 +1,160 @@
+# backend/queries.py
+"""
+Read-only listing queries that project plain columns instead of loading ORM objects.
+
+List endpoints used to serialize each row with Model.to_dict(), which lazy-loads
+relationships per row (N+1 queries). The functions here fetch everything a listing
+needs in a single SQL statement and return JSON-ready dicts with the same
+shape as the corresponding to_dict() output.
+
+The student /take payload is also built here. It is encoded once per quiz
+version and served from the cache as bytes with an ETag.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from sqlalchemy import func
+
+from cache import LRUCache
+from database import db, Quiz, Question, Choice, StudentQuizAttempt
+
+logger = logging.getLogger(__name__)
+
+STUDENT_QUIZ_CACHE_SIZE = int(os.getenv("STUDENT_QUIZ_CACHE_SIZE", "256"))
+# (quiz_id, version) -> (etag, JSON bytes); the /take payload is identical for every student
+_student_quiz_cache = LRUCache(STUDENT_QUIZ_CACHE_SIZE, name="student_quiz")
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def list_published_quizzes_for_student(student_id):
+    """
+    Published quizzes ordered by title, each with its question count and the student's latest
+    attempt (if any). One query: a ranked attempt subquery is joined onto the quiz rows, whose
+    question_count is stored on the row.
+    """
+    ranked_attempts = (
+        db.select(
+            StudentQuizAttempt.id, StudentQuizAttempt.quiz_id, StudentQuizAttempt.started_at,
+            StudentQuizAttempt.submitted_at, StudentQuizAttempt.score,
+            StudentQuizAttempt.total_questions, StudentQuizAttempt.correct_answers,
+            func.row_number().over(
+                partition_by=StudentQuizAttempt.quiz_id, order_by=StudentQuizAttempt.submitted_at.desc()
+            ).label("rank"),
+        )
+        .filter(StudentQuizAttempt.student_id == student_id)
+        .subquery()
+    )
+    stmt = (
+        db.select(
+            Quiz.id, Quiz.title, Quiz.description, Quiz.is_published, Quiz.created_at, Quiz.updated_at, Quiz.teacher_id,
+            Quiz.question_count, Quiz.attempt_count, Quiz.avg_score, Quiz.last_attempt_at,
+            ranked_attempts.c.id.label("attempt_id"), ranked_attempts.c.started_at.label("attempt_started_at"),
+            ranked_attempts.c.submitted_at.label("attempt_submitted_at"), ranked_attempts.c.score.label("attempt_score"),
+            ranked_attempts.c.total_questions.label("attempt_total_questions"),
+            ranked_attempts.c.correct_answers.label("attempt_correct_answers"),
+        )
+        .outerjoin(ranked_attempts, (ranked_attempts.c.quiz_id == Quiz.id) & (ranked_attempts.c.rank == 1))
+        .filter(Quiz.is_published == True)
+        .order_by(Quiz.title)
+    )
+
+    result = []
+    for row in db.session.execute(stmt):
+        data = {
+            "id": row.id,
+            "title": row.title,
+            "description": row.description or "",
+            "is_published": row.is_published,
+            "question_count": row.question_count or 0,
+            "attempt_count": row.attempt_count or 0,
+            "avg_score": row.avg_score,
+            "last_attempt_at": _isoformat(row.last_attempt_at),
+            "created_at": _isoformat(row.created_at),
+            "updated_at": _isoformat(row.updated_at),
+            "teacher_id": row.teacher_id,
+        }
+        if row.attempt_id:
+            data["student_attempt"] = {
+                "id": row.attempt_id,
+                "student_id": student_id,
+                "quiz_id": row.id,
+                "quiz_title": row.title,
+                "started_at": _isoformat(row.attempt_started_at),
+                "submitted_at": _isoformat(row.attempt_submitted_at),
+                "score": row.attempt_score,
+                "total_questions": row.attempt_total_questions,
+                "correct_answers": row.attempt_correct_answers,
+            }
+        result.append(data)
+    return result
+
+
+def _build_student_quiz_payload(quiz_id):
+    """
+    Returns (version, payload) for a published quiz, or (None, None). One statement: quiz, questions and
+    choices are outer-joined, so the version always matches the content it is cached under.
+    Correct-answer flags are never selected.
+    """
+    rows = db.session.execute(
+        db.select(
+            Quiz.title, Quiz.description, Quiz.is_published, Quiz.question_count, Quiz.created_at, Quiz.teacher_id, Quiz.version,
+            Question.id.label("question_id"), Question.question_text, Question.question_type, Question.order_index,
+            Choice.id.label("choice_id"), Choice.choice_text,
+        )
+        .outerjoin(Question, Question.quiz_id == Quiz.id)
+        .outerjoin(Choice, Choice.question_id == Question.id)
+        .filter(Quiz.id == quiz_id, Quiz.is_published == True)
+        .order_by(Question.order_index, Question.id, Choice.id)
+    ).all()
+    if not rows:
+        return None, None
+    first = rows[0]
+    questions = {}
+    for row in rows:
+        if row.question_id is None:
+            continue
+        question = questions.get(row.question_id)
+        if question is None:
+            question = questions[row.question_id] = {
+                "id": row.question_id, "quiz_id": quiz_id, "question_text": row.question_text,
+                "question_type": row.question_type, "order_index": row.order_index,
+            }
+            if row.question_type == 'mcq':
+                question["choices"] = []
+        if row.choice_id is not None and "choices" in question:
+            question["choices"].append({"id": row.choice_id, "choice_text": row.choice_text})
+    # Same shape as Quiz.to_dict(include_questions=True) without the per-submission statistics,
+    # which would otherwise change the payload on every submission
+    payload = {
+        "id": quiz_id,
+        "title": first.title,
+        "description": first.description or "",
+        "is_published": first.is_published,
+        "question_count": first.question_count or 0,
+        "created_at": _isoformat(first.created_at),
+        "teacher_id": first.teacher_id,
+        "version": first.version,
+        "questions": list(questions.values()),
+    }
+    return first.version, payload
+
+def get_student_quiz_payload(quiz_id, version):
+    """
+    (etag, JSON bytes) of the student /take payload for a quiz version, encoded once and cached.
+    Returns (None, None) if the quiz is not published.
+    """
+    cached = _student_quiz_cache.get((quiz_id, version))
+    if cached is not None:
+        return cached
+    built_version, payload = _build_student_quiz_payload(quiz_id)
+    if payload is None:
+        return None, None
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    entry = (f"{quiz_id}-v{built_version}-{hashlib.sha1(body).hexdigest()[:16]}", body)
+    _student_quiz_cache.set((quiz_id, built_version), entry) # Cached under the version actually read
+    logger.info(f"Encoded student payload for quiz {quiz_id} v{built_version} ({len(body)} bytes)")
+    return entry
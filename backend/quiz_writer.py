@@ -0,0 +1,174 @@
+# backend/quiz_writer.py
+"""
+Write paths for quiz questions and choices.
+
+The whole questions payload is validated and parsed first, before anything is
+written.
+
+- New quizzes: all questions are inserted with one executemany INSERT and all
+  choices with another. UUIDs are generated client-side, so no per-row flush
+  is needed to learn ids.
+- Existing quizzes: sync_questions() matches the payload to existing rows by
+  id and writes only the difference, so unchanged questions keep their ids
+  and StudentAnswer links. Any change bumps Quiz.version.
+"""
+import uuid
+import logging
+from datetime import datetime
+
+from database import db, Quiz, Question, Choice, StudentAnswer, FeedbackCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+# --- Parsing ---
+def _parse_choices(question_text, choices_data, correct_answer_text):
+    """Returns [{"id", "choice_text", "is_correct"}, ...]. Raises ValueError unless at least one choice is correct."""
+    if not choices_data or not isinstance(choices_data, list):
+        raise ValueError(f"MCQ '{question_text[:50]}...' needs 1 correct answer.")
+    choices = []
+    for choice_data in choices_data:
+        choice_id = None; choice_text = None; is_correct = False
+        if isinstance(choice_data, str):
+            choice_text = choice_data
+        elif isinstance(choice_data, dict):
+            choice_id = choice_data.get("id")
+            choice_text = choice_data.get("choice_text")
+            is_correct = bool(choice_data.get("is_correct", False))
+        if not choice_text:
+            logger.warning(f"Skip choice Q '{question_text[:50]}' no text"); continue
+        if correct_answer_text and choice_text == correct_answer_text:
+            is_correct = True
+        choices.append({"id": choice_id, "choice_text": choice_text, "is_correct": is_correct})
+    if not any(choice["is_correct"] for choice in choices):
+        raise ValueError(f"MCQ '{question_text[:50]}...' needs 1 correct answer.")
+    return choices
+
+def parse_questions(questions_data):
+    """
+    Validates a questions payload. Returns [{"id", "question_text", "question_type", "order_index", "choices"}, ...]
+    where ids are the client-supplied ids (None for new rows). Questions without text are skipped (their
+    position still counts for order_index). Raises ValueError on the first invalid question.
+    """
+    parsed = []
+    for idx, q_data in enumerate(questions_data):
+        if not isinstance(q_data, dict):
+            raise ValueError(f"Question {idx + 1} is not an object.")
+        question_text = q_data.get("question_text"); question_type = q_data.get("question_type", "mcq")
+        if not question_text:
+            logger.warning(f"Skip Q {idx + 1} no text"); continue
+        choices = _parse_choices(question_text, q_data.get("choices", []), q_data.get("correct_answer")) if question_type == 'mcq' else []
+        parsed.append({
+            "id": q_data.get("id"), "question_text": question_text, "question_type": question_type,
+            "order_index": idx, "choices": choices,
+        })
+    return parsed
+
+def _question_row(quiz_id, question):
+    return {
+        "id": str(uuid.uuid4()), "quiz_id": quiz_id, "question_text": question["question_text"],
+        "question_type": question["question_type"], "order_index": question["order_index"],
+    }
+
+def _choice_row(question_id, choice):
+    return {"id": str(uuid.uuid4()), "question_id": question_id, "choice_text": choice["choice_text"], "is_correct": choice["is_correct"]}
+
+
+# --- New Quizzes ---
+def prepare_question_rows(quiz_id, questions_data):
+    """
+    Validates a questions payload and builds the rows to insert, without touching the session.
+    Returns (question_rows, choice_rows) with freshly generated ids. Raises ValueError before anything is written.
+    """
+    question_rows, choice_rows = [], []
+    for question in parse_questions(questions_data):
+        row = _question_row(quiz_id, question)
+        question_rows.append(row)
+        choice_rows.extend(_choice_row(row["id"], choice) for choice in question["choices"])
+    return question_rows, choice_rows
+
+def insert_question_rows(question_rows, choice_rows):
+    """Inserts prepared rows with two executemany INSERTs (questions first for the foreign key). The caller commits."""
+    if question_rows:
+        db.session.execute(db.insert(Question), question_rows)
+    if choice_rows:
+        db.session.execute(db.insert(Choice), choice_rows)
+    logger.info(f"Bulk inserted {len(question_rows)} questions and {len(choice_rows)} choices")
+    return len(question_rows)
+
+
+# --- Existing Quizzes ---
+def _sync_choices(question, wanted):
+    """Diffs a loaded question's choices against parsed ones. Returns (new choice rows, whether anything changed)."""
+    existing = {choice.id: choice for choice in question.choices}
+    new_rows, changed = [], False
+    for choice in wanted:
+        current = existing.pop(choice["id"], None) if choice["id"] else None
+        if current is None:
+            new_rows.append(_choice_row(question.id, choice)); changed = True
+            continue
+        if current.choice_text != choice["choice_text"]: current.choice_text = choice["choice_text"]; changed = True
+        if current.is_correct != choice["is_correct"]: current.is_correct = choice["is_correct"]; changed = True
+    for leftover in existing.values():
+        db.session.delete(leftover); changed = True
+    return new_rows, changed
+
+def sync_questions(quiz, questions_data):
+    """
+    Applies a full questions payload to a quiz whose questions and choices are loaded, writing only the
+    difference. Payload items with an id of one of the quiz's questions/choices update that row; items
+    without a (known) id are inserted; rows missing from the payload are deleted. Cached AI feedback is
+    dropped for questions whose text, type or choices changed. The caller commits.
+    Raises ValueError (before any write) if the payload is invalid or would delete an answered question.
+    """
+    parsed = parse_questions(questions_data)
+    existing = {question.id: question for question in quiz.questions}
+    kept_ids = {q["id"] for q in parsed if q["id"] in existing}
+
+    removed = [question for qid, question in existing.items() if qid not in kept_ids]
+    if removed:
+        answered = db.session.execute(
+            db.select(StudentAnswer.question_id).filter(StudentAnswer.question_id.in_([q.id for q in removed])).distinct()
+        ).scalars().all()
+        if answered:
+            text = existing[answered[0]].question_text
+            raise ValueError(f"Question '{text[:50]}...' already has student answers and cannot be removed.")
+
+    new_question_rows, new_choice_rows = [], []
+    changed_ids, seen_ids = set(), set(); updated = 0
+    for question in parsed:
+        current = existing.get(question["id"]) if question["id"] not in seen_ids else None # A repeated id is a new copy
+        if current is None:
+            row = _question_row(quiz.id, question)
+            new_question_rows.append(row)
+            new_choice_rows.extend(_choice_row(row["id"], choice) for choice in question["choices"])
+            continue
+        seen_ids.add(current.id); content_changed = False
+        if current.question_text != question["question_text"]: current.question_text = question["question_text"]; content_changed = True
+        if current.question_type != question["question_type"]: current.question_type = question["question_type"]; content_changed = True
+        choice_rows, choices_changed = _sync_choices(current, question["choices"])
+        new_choice_rows.extend(choice_rows)
+        moved = current.order_index != question["order_index"]
+        if moved: current.order_index = question["order_index"]
+        if content_changed or choices_changed:
+            changed_ids.add(current.id)
+        if content_changed or choices_changed or moved:
+            updated += 1
+
+    for question in removed:
+        db.session.delete(question) # Cascades to its choices, feedback cache and rollup
+    db.session.flush()
+    if new_question_rows or new_choice_rows:
+        insert_question_rows(new_question_rows, new_choice_rows)
+    if changed_ids:
+        db.session.execute(db.delete(FeedbackCacheEntry).where(FeedbackCacheEntry.question_id.in_(changed_ids)))
+
+    quiz.question_count = len(parsed)
+    if new_question_rows or removed or updated:
+        quiz.updated_at = datetime.utcnow()
+        quiz.version = Quiz.version + 1 # New answer key (grading.py); SQL increment so concurrent edits both count
+    logger.info(
+        f"Synced questions for quiz {quiz.id}: {len(new_question_rows)} added, {updated} updated, "
+        f"{len(removed)} removed, {len(parsed) - len(new_question_rows) - updated} unchanged"
+    )
+    return {"added": len(new_question_rows), "updated": updated, "removed": len(removed)}
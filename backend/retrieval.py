@@ -0,0 +1,170 @@
+# backend/retrieval.py
+"""
+Chunked lexical retrieval over Material.extracted_text.
+
+Materials are split into overlapping chunks when they are ingested
+(MaterialChunk rows). At question time a BM25 index over a material's
+chunks picks the passages most relevant to the student's question, so
+prompts carry the relevant parts of a document instead of its first N
+characters. Indexes are built locally and kept in an LRU cache, with each
+chunk's token count so prompt assembly (prompt_budget.py) does not recount them.
+"""
+import os
+import re
+import math
+import logging
+import unicodedata
+from collections import Counter
+
+from database import db, Material, MaterialChunk
+from cache import LRUCache
+from prompt_budget import count_tokens, trim_to_tokens, CHUNK_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500")) # Target chunk size in characters
+CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200")) # Characters repeated between neighbouring chunks
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6")) # Chunks per material block put into a prompt
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_index_cache = LRUCache(int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "64")), name="material_index")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# --- Chunking and Tokenizing ---
+def chunk_text(text, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Greedily packs paragraphs into ~chunk_chars chunks, splitting oversized paragraphs on whitespace."""
+    if not text or not text.strip():
+        return []
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph: continue
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(" ", 0, chunk_chars)
+            if cut <= chunk_chars // 2: cut = chunk_chars
+            pieces.append(paragraph[:cut].strip()); paragraph = paragraph[cut:].strip()
+        if paragraph: pieces.append(paragraph)
+
+    chunks, current = [], []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) + 1 > chunk_chars:
+            chunks.append("\n".join(current))
+            tail = chunks[-1][-overlap:] if overlap else ""
+            # Start the next chunk at a word boundary inside the overlap tail
+            tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+            current, current_len = ([tail], len(tail)) if tail else ([], 0)
+        current.append(piece); current_len += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _strip_accents(text):
+    # Greek material is written with tonos; students often type without it
+    return "".join(ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn")
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(_strip_accents(text.lower())) if len(t) > 1]
+
+
+# --- BM25 ---
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunk texts."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.token_counts = [count_tokens(chunk) for chunk in chunks]
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Returns up to k (chunk_index, score) pairs, best first. Chunks with no query term are skipped."""
+        query_terms = set(tokenize(query or ""))
+        if not query_terms or not self.chunks:
+            return []
+        scores = []
+        for idx, tf in enumerate(self.term_freqs):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[idx] / (self.avg_length or 1))
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((idx, score))
+        scores.sort(key=lambda pair: pair[1], reverse=True)
+        return scores[:k]
+
+
+# --- Persistence and Lookup ---
+def index_material(material):
+    """(Re)builds the MaterialChunk rows for a material from its extracted text. The caller commits."""
+    db.session.execute(db.delete(MaterialChunk).where(MaterialChunk.material_id == material.id))
+    chunks = chunk_text(material.extracted_text or "")
+    for idx, chunk in enumerate(chunks):
+        db.session.add(MaterialChunk(material_id=material.id, chunk_index=idx, text=chunk))
+    invalidate_material_index(material.id)
+    logger.info(f"Indexed material {material.id} into {len(chunks)} chunks")
+    return len(chunks)
+
+def invalidate_material_index(material_id):
+    _index_cache.pop(material_id)
+
+def get_material_index(material_id):
+    """Returns the cached BM25Index for a material, loading its chunks on a miss. None if the material has no text."""
+    index = _index_cache.get(material_id)
+    if index is not None:
+        return index
+    chunks = db.session.execute(
+        db.select(MaterialChunk.text).filter_by(material_id=material_id).order_by(MaterialChunk.chunk_index)
+    ).scalars().all()
+    if not chunks:
+        # Material ingested before chunking existed: chunk on the fly (persisted by `flask index-materials`)
+        text = db.session.execute(db.select(Material.extracted_text).filter_by(id=material_id)).scalar_one_or_none()
+        chunks = chunk_text(text or "")
+    if not chunks:
+        return None
+    index = BM25Index(chunks)
+    _index_cache.set(material_id, index)
+    return index
+
+def ranked_chunks(material_id, query, k=RETRIEVAL_TOP_K):
+    """
+    [(chunk_index, text, tokens), ...] for the query's top-k chunks, best first, for prompt_budget.MaterialContext.
+    Without a query, or when nothing matches (e.g. greetings), all chunks in document order (the opening text first).
+    """
+    index = get_material_index(material_id)
+    if index is None:
+        return []
+    hits = index.search(query, k=k) if query and query.strip() else []
+    order = [idx for idx, _ in hits] if hits else range(len(index.chunks))
+    return [(idx, index.chunks[idx], index.token_counts[idx]) for idx in order]
+
+def sample_context(material_id, max_tokens):
+    """Chunks spread evenly over the whole material up to max_tokens, so nothing past the start is ignored."""
+    index = get_material_index(material_id)
+    if index is None:
+        return ""
+    total = len(index.chunks)
+    avg_tokens = max(1, sum(index.token_counts) // total)
+    wanted = max(1, min(total, max_tokens // avg_tokens))
+    selected = sorted({int(i * total / wanted) for i in range(wanted)})
+    parts, used = [], 0
+    separator = count_tokens(CHUNK_SEPARATOR)
+    for idx in selected:
+        if used + index.token_counts[idx] > max_tokens:
+            continue # Spacing is uneven when chunk sizes vary; a later, shorter chunk may still fit
+        parts.append(index.chunks[idx]); used += index.token_counts[idx] + separator
+    if not parts:
+        parts.append(trim_to_tokens(index.chunks[selected[0]], max_tokens))
+    return CHUNK_SEPARATOR.join(parts)
@@ -0,0 +1,244 @@
+# backend/rollups.py
+"""
+Incrementally maintained analytics rollups.
+
+submit_quiz_answers calls record_attempt() in the submission's transaction. It
+adds the attempt to three tables of running totals: per quiz, per question and
+per (student, quiz). The teacher overview then reads one rollup row per quiz plus a
+short list of question rows, however much attempt history exists.
+`flask rebuild-analytics-rollups` recomputes all three tables from the
+attempts and answers.
+
+Increments are UPDATE statements whose values are SQL expressions over the
+current row, so concurrent submissions never overwrite each other. Missing
+rows are created first inside a savepoint. If another request inserts the same
+row at the same moment, the IntegrityError is ignored and the update still
+applies.
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, case
+from sqlalchemy.exc import IntegrityError
+
+from database import (
+    db, User, Quiz, Question, StudentQuizAttempt, StudentAnswer,
+    QuizRollup, QuestionRollup, StudentQuizRollup,
+)
+
+logger = logging.getLogger(__name__)
+
+WEAKEST_QUESTIONS_LIMIT = 5
+WEAKEST_QUESTIONS_MIN_ANSWERS = 3 # Ignore questions answered too rarely to rank
+
+
+# --- Incremental Updates ---
+def _ensure_rows(model, key_columns, keys, defaults=None):
+    """Creates rollup rows for keys that do not exist yet. Returns the set of keys that were created here."""
+    if not keys:
+        return set()
+    columns = [getattr(model, name) for name in key_columns]
+    if len(columns) == 1:
+        existing = {(value,) for value in db.session.execute(db.select(columns[0]).filter(columns[0].in_([k[0] for k in keys]))).scalars()}
+    else:
+        existing = set(db.session.execute(db.select(*columns).filter(db.tuple_(*columns).in_(list(keys)))).tuples())
+    created = set()
+    for key in keys:
+        if key in existing:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**dict(zip(key_columns, key)), **(defaults or {}).get(key, {})))
+            created.add(key)
+        except IntegrityError: # Inserted concurrently by another submission; the increment below still applies
+            logger.debug(f"{model.__tablename__} row {key} created concurrently")
+    return created
+
+def record_attempt(attempt):
+    """
+    Adds a finalized (scored, flushed) attempt to the rollups. Runs inside the caller's transaction;
+    the caller commits. Uses the attempt's in-memory answers, so no answer rows are re-read.
+    """
+    score = attempt.score or 0.0
+    submitted_at = attempt.submitted_at
+    per_question = defaultdict(lambda: [0, 0]) # question_id -> [answers, correct]
+    for answer in attempt.answers:
+        per_question[answer.question_id][0] += 1
+        per_question[answer.question_id][1] += 1 if answer.is_correct else 0
+    answer_count = sum(counts[0] for counts in per_question.values())
+    correct_count = sum(counts[1] for counts in per_question.values())
+
+    # Per (student, quiz): tells whether this is the student's first submission of the quiz
+    new_students = _ensure_rows(StudentQuizRollup, ("student_id", "quiz_id"), {(attempt.student_id, attempt.quiz_id)})
+    db.session.execute(
+        db.update(StudentQuizRollup)
+        .where(StudentQuizRollup.student_id == attempt.student_id, StudentQuizRollup.quiz_id == attempt.quiz_id)
+        .values(
+            attempt_count=StudentQuizRollup.attempt_count + 1,
+            best_score=case((StudentQuizRollup.best_score == None, score), (StudentQuizRollup.best_score < score, score), else_=StudentQuizRollup.best_score),
+            last_score=score,
+            last_attempt_at=submitted_at,
+        ).execution_options(synchronize_session=False)
+    )
+
+    _ensure_rows(QuizRollup, ("quiz_id",), {(attempt.quiz_id,)})
+    db.session.execute(
+        db.update(QuizRollup).where(QuizRollup.quiz_id == attempt.quiz_id).values(
+            attempt_count=QuizRollup.attempt_count + 1,
+            student_count=QuizRollup.student_count + (1 if new_students else 0),
+            score_sum=QuizRollup.score_sum + score,
+            score_sq_sum=QuizRollup.score_sq_sum + score * score,
+            answer_count=QuizRollup.answer_count + answer_count,
+            correct_count=QuizRollup.correct_count + correct_count,
+            last_attempt_at=case(
+                (QuizRollup.last_attempt_at == None, submitted_at),
+                (QuizRollup.last_attempt_at < submitted_at, submitted_at),
+                else_=QuizRollup.last_attempt_at,
+            ),
+        ).execution_options(synchronize_session=False)
+    )
+
+    if per_question:
+        _ensure_rows(
+            QuestionRollup, ("question_id",), {(qid,) for qid in per_question},
+            defaults={(qid,): {"quiz_id": attempt.quiz_id} for qid in per_question},
+        )
+        # One executemany for all questions of the attempt
+        table = QuestionRollup.__table__
+        db.session.execute(
+            table.update().where(table.c.question_id == bindparam("b_question_id")).values(
+                answer_count=table.c.answer_count + bindparam("b_answers"),
+                correct_count=table.c.correct_count + bindparam("b_correct"),
+            ),
+            [{"b_question_id": qid, "b_answers": counts[0], "b_correct": counts[1]} for qid, counts in per_question.items()],
+        )
+    logger.info(f"Rollups updated for attempt {attempt.id} (quiz {attempt.quiz_id}, {len(per_question)} questions)")
+
+
+# --- Full Rebuild ---
+def rebuild_rollups():
+    """Recomputes every rollup table from submitted attempts and their answers with INSERT ... SELECT. The caller commits."""
+    for model in (QuestionRollup, QuizRollup, StudentQuizRollup):
+        db.session.execute(db.delete(model))
+
+    submitted = StudentQuizAttempt.submitted_at != None
+    score = func.coalesce(StudentQuizAttempt.score, 0.0)
+    correct = case((StudentAnswer.is_correct == True, 1), else_=0)
+
+    answer_totals = (
+        db.select(StudentAnswer.attempt_id, func.count(StudentAnswer.id).label("answers"), func.sum(correct).label("correct"))
+        .group_by(StudentAnswer.attempt_id)
+        .subquery()
+    )
+    db.session.execute(db.insert(QuizRollup).from_select(
+        ["quiz_id", "attempt_count", "student_count", "score_sum", "score_sq_sum", "answer_count", "correct_count", "last_attempt_at"],
+        db.select(
+            StudentQuizAttempt.quiz_id, func.count(StudentQuizAttempt.id), func.count(StudentQuizAttempt.student_id.distinct()),
+            func.sum(score), func.sum(score * score),
+            func.coalesce(func.sum(answer_totals.c.answers), 0), func.coalesce(func.sum(answer_totals.c.correct), 0),
+            func.max(StudentQuizAttempt.submitted_at),
+        )
+        .outerjoin(answer_totals, answer_totals.c.attempt_id == StudentQuizAttempt.id)
+        .filter(submitted).group_by(StudentQuizAttempt.quiz_id)
+    ))
+    db.session.execute(db.insert(QuestionRollup).from_select(
+        ["question_id", "quiz_id", "answer_count", "correct_count"],
+        db.select(StudentAnswer.question_id, Question.quiz_id, func.count(StudentAnswer.id), func.sum(correct))
+        .join(Question, Question.id == StudentAnswer.question_id)
+        .join(StudentQuizAttempt, StudentQuizAttempt.id == StudentAnswer.attempt_id)
+        .filter(submitted).group_by(StudentAnswer.question_id, Question.quiz_id)
+    ))
+
+    latest = (
+        db.select(
+            StudentQuizAttempt.student_id, StudentQuizAttempt.quiz_id, score.label("score"),
+            func.row_number().over(
+                partition_by=(StudentQuizAttempt.student_id, StudentQuizAttempt.quiz_id),
+                order_by=StudentQuizAttempt.submitted_at.desc(),
+            ).label("rank"),
+        ).filter(submitted).subquery()
+    )
+    last_scores = db.select(latest.c.student_id, latest.c.quiz_id, latest.c.score).filter(latest.c.rank == 1).subquery()
+    db.session.execute(db.insert(StudentQuizRollup).from_select(
+        ["student_id", "quiz_id", "attempt_count", "best_score", "last_score", "last_attempt_at"],
+        db.select(
+            StudentQuizAttempt.student_id, StudentQuizAttempt.quiz_id, func.count(StudentQuizAttempt.id),
+            func.max(score), func.max(last_scores.c.score), func.max(StudentQuizAttempt.submitted_at),
+        )
+        .join(last_scores, (last_scores.c.student_id == StudentQuizAttempt.student_id) & (last_scores.c.quiz_id == StudentQuizAttempt.quiz_id))
+        .filter(submitted).group_by(StudentQuizAttempt.student_id, StudentQuizAttempt.quiz_id)
+    ))
+    counts = {model.__tablename__: db.session.execute(db.select(func.count()).select_from(model)).scalar_one()
+              for model in (QuizRollup, QuestionRollup, StudentQuizRollup)}
+    logger.info(f"Rebuilt analytics rollups: {counts}")
+    return counts
+
+
+# --- Reads ---
+def _quiz_summary(row, student_total):
+    attempts = row.attempt_count or 0
+    average = (row.score_sum / attempts) if attempts else None
+    variance = (row.score_sq_sum / attempts - average * average) if attempts else None
+    return {
+        "id": row.id,
+        "title": row.title,
+        "is_published": row.is_published,
+        "question_count": row.question_count or 0,
+        "attempt_count": attempts,
+        "student_count": row.student_count or 0,
+        "average_score": average,
+        "score_stddev": max(0.0, variance) ** 0.5 if variance is not None else None,
+        "correct_rate": (row.correct_count / row.answer_count) if row.answer_count else None,
+        # Share of all student accounts that submitted the quiz (there is no per-class enrolment)
+        "completion_rate": ((row.student_count or 0) / student_total) if student_total else None,
+        "last_attempt_at": row.last_attempt_at.isoformat() if row.last_attempt_at else None,
+    }
+
+def teacher_overview(teacher_id):
+    """Cross-quiz dashboard numbers for a teacher, read from the rollups: three queries in total."""
+    student_total = db.session.execute(db.select(func.count(User.id)).filter(User.role == 'student')).scalar_one()
+    rows = db.session.execute(
+        db.select(
+            Quiz.id, Quiz.title, Quiz.is_published, Quiz.question_count,
+            QuizRollup.attempt_count, QuizRollup.student_count, QuizRollup.score_sum, QuizRollup.score_sq_sum,
+            QuizRollup.answer_count, QuizRollup.correct_count, QuizRollup.last_attempt_at,
+        )
+        .outerjoin(QuizRollup, QuizRollup.quiz_id == Quiz.id)
+        .filter(Quiz.teacher_id == teacher_id)
+        .order_by(Quiz.updated_at.desc())
+    ).all()
+    quizzes = [_quiz_summary(row, student_total) for row in rows]
+
+    correct_rate = QuestionRollup.correct_count * 1.0 / QuestionRollup.answer_count
+    weakest = db.session.execute(
+        db.select(
+            QuestionRollup.question_id, QuestionRollup.quiz_id, QuestionRollup.answer_count, QuestionRollup.correct_count,
+            Question.question_text, Quiz.title.label("quiz_title"),
+        )
+        .join(Question, Question.id == QuestionRollup.question_id)
+        .join(Quiz, Quiz.id == QuestionRollup.quiz_id)
+        .filter(Quiz.teacher_id == teacher_id, QuestionRollup.answer_count >= WEAKEST_QUESTIONS_MIN_ANSWERS)
+        .order_by(correct_rate, QuestionRollup.answer_count.desc(), QuestionRollup.question_id)
+        .limit(WEAKEST_QUESTIONS_LIMIT)
+    ).all()
+
+    total_attempts = sum(q["attempt_count"] for q in quizzes)
+    score_sum = sum(row.score_sum or 0.0 for row in rows)
+    return {
+        "totals": {
+            "quiz_count": len(quizzes),
+            "published_count": sum(1 for q in quizzes if q["is_published"]),
+            "attempt_count": total_attempts,
+            "average_score": (score_sum / total_attempts) if total_attempts else None,
+            "student_total": student_total,
+        },
+        "quizzes": quizzes,
+        "weakest_questions": [
+            {
+                "question_id": row.question_id, "quiz_id": row.quiz_id, "quiz_title": row.quiz_title,
+                "question_text": row.question_text, "answer_count": row.answer_count,
+                "correct_rate": row.correct_count / row.answer_count if row.answer_count else None,
+            }
+            for row in weakest
+        ],
+    }
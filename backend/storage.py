@@ -0,0 +1,106 @@
+# backend/storage.py
+"""
+Content-addressed storage for uploaded materials.
+
+Uploads are hashed (SHA-256) while they are written to disk. Identical
+files share one StoredFile row and one file on disk; StoredFile.ref_count
+tracks how many Material rows point at it, and the file is only removed
+when the last of them is deleted.
+"""
+import os
+import uuid
+import hashlib
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, begin_savepoint, Material, StoredFile
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024 # Bytes read per iteration while saving/hashing
+
+
+def save_upload(file_storage, base_dir, relative_folder, extension):
+    """
+    Streams an uploaded file to disk while hashing it.
+    Returns (content_hash, relative_filepath). If the content is already stored the
+    new copy is discarded and the existing file's path is returned with its ref_count bumped.
+    That also holds when another request stores the same new content concurrently: the
+    insert runs in a savepoint (see database.begin_savepoint), and losing the race on the
+    content_hash key falls back to reuse.
+    The caller commits (or rolls back and calls discard_upload on failure).
+    """
+    os.makedirs(os.path.join(base_dir, relative_folder), exist_ok=True)
+    relative_filepath = os.path.join(relative_folder, f"{uuid.uuid4()}.{extension}")
+    full_filepath = os.path.join(base_dir, relative_filepath)
+
+    hasher = hashlib.sha256(); size = 0
+    stream = file_storage.stream
+    with open(full_filepath, "wb") as out:
+        while True:
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            if not chunk: break
+            hasher.update(chunk); out.write(chunk); size += len(chunk)
+    content_hash = hasher.hexdigest()
+
+    existing = db.session.get(StoredFile, content_hash)
+    if existing and os.path.exists(os.path.join(base_dir, existing.filepath)):
+        return content_hash, _reuse_stored_file(content_hash, existing.filepath, full_filepath)
+
+    if existing: # Index entry whose file went missing: point it at the new copy
+        logger.warning(f"Stored file for {content_hash[:12]} missing on disk, replacing with new upload")
+        existing.filepath = relative_filepath; existing.size_bytes = size
+        existing.ref_count = (existing.ref_count or 0) + 1
+    else:
+        try:
+            with begin_savepoint():
+                db.session.add(StoredFile(content_hash=content_hash, filepath=relative_filepath, size_bytes=size, ref_count=1))
+        except IntegrityError: # The same new content was uploaded concurrently and its row committed first
+            winner = db.session.execute(db.select(StoredFile.filepath).filter_by(content_hash=content_hash)).scalar_one()
+            return content_hash, _reuse_stored_file(content_hash, winner, full_filepath)
+    logger.info(f"Saved new upload {content_hash[:12]} ({size} bytes) to {relative_filepath}")
+    return content_hash, relative_filepath
+
+def _reuse_stored_file(content_hash, stored_filepath, new_full_filepath):
+    """Drops the just-written copy and takes a reference on the stored one. Returns the stored path."""
+    os.remove(new_full_filepath)
+    db.session.execute(update(StoredFile).where(StoredFile.content_hash == content_hash).values(ref_count=StoredFile.ref_count + 1))
+    logger.info(f"Upload matches stored content {content_hash[:12]}, reusing {stored_filepath}")
+    return stored_filepath
+
+def discard_upload(base_dir, relative_filepath):
+    """Cleanup after a failed upload transaction. Only removes files that no StoredFile row points at."""
+    still_referenced = db.session.execute(db.select(StoredFile.content_hash).filter_by(filepath=relative_filepath)).first()
+    full_filepath = os.path.join(base_dir, relative_filepath)
+    if not still_referenced and os.path.exists(full_filepath):
+        try:
+            os.remove(full_filepath); logger.info(f"Cleaned up: {full_filepath}")
+        except OSError as rm_err:
+            logger.error(f"Cleanup failed {full_filepath}: {rm_err}")
+
+def find_processed_duplicate(content_hash, exclude_id=None):
+    """Returns a ready Material with the same content, whose extracted text and summary can be reused."""
+    if not content_hash:
+        return None
+    stmt = db.select(Material).filter(Material.content_hash == content_hash, Material.status == 'ready')
+    if exclude_id:
+        stmt = stmt.filter(Material.id != exclude_id)
+    return db.session.execute(stmt.limit(1)).scalar_one_or_none()
+
+def release_material_file(material, base_dir):
+    """
+    Drops the material's reference to its stored file. Returns the path to delete from disk
+    once the transaction commits, or None while other materials still use the file.
+    """
+    full_filepath = os.path.join(base_dir, material.filepath)
+    if not material.content_hash: # Uploaded before content addressing: the file is exclusively ours
+        return full_filepath
+    stored = db.session.get(StoredFile, material.content_hash)
+    if not stored or stored.ref_count <= 1:
+        if stored: db.session.delete(stored)
+        return full_filepath
+    db.session.execute(update(StoredFile).where(StoredFile.content_hash == material.content_hash).values(ref_count=StoredFile.ref_count - 1))
+    logger.info(f"Stored file {material.content_hash[:12]} still referenced by other material(s), keeping it")
+    return None
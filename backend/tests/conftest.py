@@ -0,0 +1,34 @@
+# backend/tests/conftest.py
+"""Shared fixtures: the app on an in-memory SQLite database, with the stub AI backend and no job workers."""
+import os
+import sys
+
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("JOB_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import app as flask_app
+from database import db, User
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def teacher_headers(app):
+    teacher = User(email="teacher@example.com", role="teacher"); teacher.set_password("secret")
+    db.session.add(teacher); db.session.commit()
+    return {"Authorization": f"Bearer {create_access_token(identity=teacher.id)}"}
@@ -0,0 +1,38 @@
+# backend/tests/test_compiled_prompt_cache.py
+"""Compiled prompts follow their materials: pending ones are picked up once ready, deleted ones are dropped in every worker."""
+from database import db, User, Material, Prompt
+from utils import get_compiled_prompt
+
+
+def test_pending_material_is_not_cached(app):
+    teacher = User(email="prompt-teacher@example.com", role="teacher"); teacher.set_password("secret")
+    db.session.add(teacher); db.session.flush()
+    material = Material(user_id=teacher.id, filename="notes.txt", filepath="notes.txt", status="pending")
+    db.session.add(material); db.session.flush()
+    prompt = Prompt(user_id=teacher.id, name="Tutor", is_public=True, structure=[
+        {"content": "You are a tutor."},
+        {"isMaterialBlock": True, "materialId": material.id, "content": f"[Material: {material.filename}]"},
+    ])
+    db.session.add(prompt); db.session.commit()
+
+    assert [segment[0] for segment in get_compiled_prompt(prompt)] == ["text", "text"] # Placeholder while pending
+
+    material.extracted_text = "Photosynthesis turns light into chemical energy."; material.status = "ready"
+    db.session.commit()
+    assert [segment[0] for segment in get_compiled_prompt(prompt)] == ["text", "material"]
+
+def test_material_deleted_elsewhere_is_dropped(app):
+    teacher = User(email="prompt-teacher@example.com", role="teacher"); teacher.set_password("secret")
+    db.session.add(teacher); db.session.flush()
+    material = Material(user_id=teacher.id, filename="notes.txt", filepath="notes.txt", status="ready",
+                        extracted_text="Photosynthesis turns light into chemical energy.")
+    db.session.add(material); db.session.flush()
+    prompt = Prompt(user_id=teacher.id, name="Tutor", is_public=True, structure=[
+        {"isMaterialBlock": True, "materialId": material.id, "content": f"[Material: {material.filename}]"},
+    ])
+    db.session.add(prompt); db.session.commit()
+    assert [segment[0] for segment in get_compiled_prompt(prompt)] == ["material"]
+
+    # Deleted through another worker: this process's cache is not invalidated
+    db.session.execute(db.delete(Material).where(Material.id == material.id)); db.session.commit()
+    assert [segment[0] for segment in get_compiled_prompt(prompt)] == ["text"]
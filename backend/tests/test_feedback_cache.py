@@ -0,0 +1,10 @@
+"""Answers that differ only in case, accents or whitespace share a feedback cache entry."""
+from feedback import normalize_answer
+
+
+def test_normalize_answer_ignores_case_accents_and_whitespace():
+    assert normalize_answer("Φωτοσύνθεση") == normalize_answer("φωτοσυνθεση") == "φωτοσυνθεση"
+    assert normalize_answer("  ΜΙΤΟΧΌΝΔΡΙΟ \n") == "μιτοχονδριο"
+    assert normalize_answer("Café   au lait") == "cafe au lait"
+    assert normalize_answer("ενέργεια") != normalize_answer("ενεργός")
+    assert normalize_answer(None) == ""
@@ -0,0 +1,14 @@
+"""/metrics needs the METRICS_TOKEN bearer token, whatever the client address."""
+import instrumentation
+
+
+def test_metrics_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 403
+
+def test_metrics_require_bearer_token(client, monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 401 # The test client connects from 127.0.0.1
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200 and response.mimetype == "text/plain"
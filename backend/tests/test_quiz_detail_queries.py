@@ -0,0 +1,46 @@
+# backend/tests/test_quiz_detail_queries.py
+"""The teacher quiz detail endpoint runs a fixed number of SQL statements, whatever the quiz size (no N+1)."""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from database import db
+
+
+def _questions(count):
+    return [
+        {
+            "question_text": f"Question {q + 1}?",
+            "question_type": "mcq",
+            "choices": [{"choice_text": f"Choice {c + 1}", "is_correct": c == 0} for c in range(4)],
+        }
+        for q in range(count)
+    ]
+
+@contextmanager
+def _count_statements():
+    statements = []
+    def record(conn, cursor, statement, *args): statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+def _detail_statements(client, headers, question_count):
+    created = client.post("/api/quizzes", headers=headers, json={"title": f"Quiz {question_count}", "questions": _questions(question_count)})
+    assert created.status_code == 201, created.get_json()
+    quiz_id = created.get_json()["id"]
+    db.session.expire_all() # Nothing preloaded in the identity map from creating it
+    with _count_statements() as statements:
+        response = client.get(f"/api/quizzes/{quiz_id}", headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["questions"]) == question_count
+    assert all(len(q["choices"]) == 4 for q in body["questions"])
+    return len(statements)
+
+def test_quiz_detail_query_count_is_constant(client, teacher_headers):
+    small = _detail_statements(client, teacher_headers, 2)
+    large = _detail_statements(client, teacher_headers, 20)
+    assert small == large
@@ -0,0 +1,26 @@
+"""Quiz statistics are folded in without touching the quiz's updated_at (its "last modified" time)."""
+from flask_jwt_extended import create_access_token
+
+from database import db, User, Quiz
+
+
+def test_submission_keeps_quiz_updated_at(client, teacher_headers):
+    questions = [{"question_text": "2 + 2?", "question_type": "mcq", "choices": [{"choice_text": "4", "is_correct": True}, {"choice_text": "5"}]}]
+    quiz_id = client.post("/api/quizzes", headers=teacher_headers, json={"title": "Sums", "questions": questions}).get_json()["id"]
+    assert client.put(f"/api/quizzes/{quiz_id}", headers=teacher_headers, json={"is_published": True}).status_code == 200
+    updated_at = db.session.get(Quiz, quiz_id).updated_at
+
+    student = User(email="student@example.com", role="student"); student.set_password("secret")
+    db.session.add(student); db.session.commit()
+    student_headers = {"Authorization": f"Bearer {create_access_token(identity=student.id)}"}
+    taken = client.get(f"/api/student/quizzes/{quiz_id}/take", headers=student_headers).get_json()
+    answers = {question["id"]: "4" for question in taken["questions"]}
+    submitted = client.post(f"/api/student/quizzes/{quiz_id}/submit", headers=student_headers, json={"answers": answers})
+    assert submitted.status_code in (200, 201), submitted.get_json()
+
+    db.session.expire_all()
+    quiz = db.session.get(Quiz, quiz_id)
+    assert quiz.attempt_count == 1 and quiz.updated_at == updated_at
+
+    Quiz.backfill_stats(); db.session.commit(); db.session.expire_all()
+    assert db.session.get(Quiz, quiz_id).updated_at == updated_at
@@ -0,0 +1,38 @@
+"""Content-addressed uploads: concurrent first uploads of the same content share one stored file, and a failed upload leaves nothing behind."""
+import io
+import os
+
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+import storage
+from database import db, init_db, StoredFile
+
+
+def test_concurrent_first_upload_reuses_winning_row(app, tmp_path, monkeypatch):
+    content = b"same lecture notes"
+    first_hash, first_path = storage.save_upload(FileStorage(io.BytesIO(content)), str(tmp_path), "materials", "txt")
+    db.session.commit()
+
+    # The second request looked before the first one's row was committed
+    monkeypatch.setattr(db.session, "get", lambda *args, **kwargs: None)
+    second_hash, second_path = storage.save_upload(FileStorage(io.BytesIO(content)), str(tmp_path), "materials", "txt")
+    db.session.commit()
+    monkeypatch.undo()
+
+    assert (second_hash, second_path) == (first_hash, first_path)
+    assert db.session.get(StoredFile, first_hash).ref_count == 2
+    assert os.listdir(tmp_path / "materials") == [os.path.basename(first_path)]
+
+def test_rollback_after_upload_leaves_no_stored_file(tmp_path, monkeypatch):
+    """On a file-backed SQLite database the savepoint must not commit the StoredFile row on its own."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/uploads.db")
+    file_app = Flask(__name__); init_db(file_app)
+    with file_app.app_context():
+        db.create_all()
+        content_hash, path = storage.save_upload(FileStorage(io.BytesIO(b"notes")), str(tmp_path), "materials", "txt")
+        db.session.rollback() # e.g. the Material insert failed
+        storage.discard_upload(str(tmp_path), path)
+        assert db.session.execute(db.select(db.func.count()).select_from(StoredFile)).scalar() == 0
+        assert os.listdir(tmp_path / "materials") == []
+        db.session.remove()
@@ -0,0 +1,26 @@
+"""Streamed AI answers do not keep a database transaction open while the model streams."""
+from flask_jwt_extended import create_access_token
+
+import app as app_module
+from database import db, User, Prompt
+
+
+def test_ask_stream_releases_session_before_streaming(client, teacher_headers, monkeypatch):
+    teacher = db.session.execute(db.select(User).filter_by(role="teacher")).scalar_one()
+    prompt = Prompt(user_id=teacher.id, name="Helper", structure=[{"content": "Be helpful."}], is_public=True)
+    student = User(email="student@example.com", role="student"); student.set_password("secret")
+    db.session.add_all([prompt, student]); db.session.commit()
+    prompt_id, student_id = prompt.id, student.id
+
+    in_transaction = []
+    def fake_stream(system_prompt, user_prompt, priority=None):
+        in_transaction.append(db.session().in_transaction())
+        yield "token", "Hi"
+        yield "usage", {"total_tokens": 1}
+    monkeypatch.setattr(app_module, "stream_ai_response", fake_stream)
+
+    headers = {"Authorization": f"Bearer {create_access_token(identity=student_id)}"}
+    response = client.post("/api/student/ask/stream", headers=headers, json={"prompt_id": prompt_id, "question": "Why?"})
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200 and "event: done" in body
+    assert in_transaction == [False]
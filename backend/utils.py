@@ -1,12 +1,21 @@
 import os
 import traceback
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
 import PyPDF2
-from openai import OpenAI
 import logging
+from cache import LRUCache
+from llm_gateway import gateway, LLMUnavailable, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+from llm_cache import response_cache_key, get_cached_response, store_cached_response
+from prompt_budget import Instruction, MaterialContext, assemble_system_prompt, prompt_token_budget, trim_to_tokens
 
 # --- Import models needed for fetching Material content ---
 try:
     from database import db, Material # Ensure Material can be imported here
+    from retrieval import ranked_chunks, invalidate_material_index
     # If 'db' is not initialized yet or causes circular imports, consider a different approach
     # for fetching Material (e.g., pass app context or use a service function).
     # For now, assume this works within Flask app context.
@@ -27,91 +36,365 @@ except ImportError:
     PPTX_AVAILABLE = False
     logger.warning("python-pptx not installed. PowerPoint file processing disabled.")
 
-try:
-    client = OpenAI() # Uses OPENAI_API_KEY from environment
-except Exception as e:
-    logger.error(f"Failed to initialize OpenAI client: {e}")
-    client = None
-
-# --- Truncation constant ---
-# Max characters to send to OpenAI for a single material's full text.
-# This is an approximation. A typical token is ~4 chars. 16k model has ~64k char limit.
-# GPT-3.5-turbo (4k model) ~16k chars. GPT-3.5-turbo-16k model ~64k chars.
-# Let's be conservative for multiple materials and the rest of the prompt.
-# For a single material placeholder in a larger prompt:
-MAX_CHARS_PER_MATERIAL_CONTEXT = 12000 # Approx 3000 tokens (adjust based on needs and model used)
-# For Quiz generation where only one material's text is the main context:
-MAX_CHARS_FOR_QUIZ_CONTEXT = 30000 # Approx 7500 tokens (adjust based on needs)
+# OpenAI calls go through llm_gateway.gateway (pooling, rate limits, priorities, retries, deadlines)
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(30 * 24 * 3600))) # Summaries of identical text are reused for 30 days
+
+# --- Token limits ---
+# Prompts are sized in tokens against the model's context window (see prompt_budget.py)
+CHAT_MAX_TOKENS = 1500 # Completion tokens requested for chat and quiz generation; reserved in every prompt budget
+SUMMARY_INPUT_MAX_TOKENS = int(os.getenv("SUMMARY_INPUT_MAX_TOKENS", "4000")) # Material text sent for a summary
+
+# --- PDF extraction settings ---
+# PDFs with at least this many pages are extracted page-parallel in a process pool.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "20"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_RANGE_TIMEOUT = float(os.getenv("PDF_RANGE_TIMEOUT", "120")) # Seconds to wait for one task (a range of PDF_PAGES_PER_TASK pages)
+PDF_PAGES_PER_TASK = 8 # Pages handed to a worker per task, so each task re-opens the file fewer times
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _new_pdf_pool(workers):
+    """'spawn' avoids forking a process that has live threads (job workers)."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _get_pdf_pool():
+    """Lazily creates the shared extraction pool."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = _new_pdf_pool(PDF_EXTRACT_WORKERS)
+        return _pdf_pool
+
+def _recycle_pdf_pool(pool, stuck_future, workers=None, grace=PDF_RANGE_TIMEOUT):
+    """
+    Replaces a pool whose worker is stuck on a timed-out range and returns a fresh one. Ranges still queued on the
+    old pool are cancelled (iter_pdf_pages resubmits those, including for concurrent extractions). A running task
+    cannot be interrupted, so _reap_pdf_workers terminates the old workers once their other ranges are done.
+    ProcessPoolExecutor has no public way to terminate workers before Python 3.14, hence its private attributes.
+    """
+    global _pdf_pool
+    processes = list((pool._processes or {}).values())
+    in_flight = [item.future for item in list(pool._pending_work_items.values()) if item.future is not stuck_future]
+    pool.shutdown(wait=False, cancel_futures=True)
+    threading.Thread(target=_reap_pdf_workers, args=(processes, in_flight, grace), name="pdf-pool-reaper", daemon=True).start()
+    if workers is not None: # A private pool
+        return _new_pdf_pool(workers)
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    return _get_pdf_pool()
+
+def _reap_pdf_workers(processes, in_flight, grace=PDF_RANGE_TIMEOUT):
+    """
+    Lets the ranges already running on a recycled pool's healthy workers finish, then terminates its workers, so a
+    hung one does not live on. Terminating breaks the old pool: ranges that were queued behind the stuck worker
+    (and could not be cancelled) fail with BrokenProcessPool, and iter_pdf_pages resubmits them.
+    """
+    wait(in_flight, timeout=grace)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            logger.warning(f"Terminated PDF extraction worker {process.pid} of a recycled pool")
+
+def _extract_pdf_page_range(file_path, start, stop):
+    """Runs in a pool worker: extracts pages [start, stop) and returns their texts in order."""
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+def iter_pdf_pages(file_path, parallel=None, workers=None, range_timeout=PDF_RANGE_TIMEOUT):
+    """
+    Yields the text of each PDF page in page order.
+    With parallel=True (default for PDFs of PDF_PARALLEL_MIN_PAGES+ pages) ranges of PDF_PAGES_PER_TASK pages are
+    spread across a process pool. range_timeout applies per range, counted from when its turn to be yielded comes:
+    a range that exceeds it yields empty strings for its pages instead of stalling the whole document, and the
+    pool is recycled so the stuck worker does not hold up later extractions.
+    """
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        if reader.is_encrypted:
+            logger.warning(f"Encrypted PDF: {file_path}"); return
+        num_pages = len(reader.pages)
+        if parallel is None:
+            parallel = PDF_EXTRACT_WORKERS > 1 and num_pages >= PDF_PARALLEL_MIN_PAGES
+        if not parallel:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+    pool = _get_pdf_pool() if workers is None else _new_pdf_pool(workers)
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages)) for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+    futures = {} # page range -> (pool, future)
+
+    def submit(page_range):
+        nonlocal pool
+        while True:
+            try:
+                futures[page_range] = (pool, pool.submit(_extract_pdf_page_range, file_path, *page_range)); return
+            except RuntimeError: # Shut down by a concurrent extraction's recycle since it was fetched
+                if workers is not None: raise
+                pool = _get_pdf_pool()
+
+    def resubmit_cancelled(pending):
+        """Moves the ranges of a recycled pool that can still be cancelled; the ones already running finish there."""
+        for page_range in pending:
+            future_pool, future = futures[page_range]
+            if future_pool is not pool and future.cancel():
+                submit(page_range)
+
+    try:
+        for page_range in ranges:
+            submit(page_range)
+        logger.info(f"Extracting {num_pages} PDF pages in {len(ranges)} tasks across the process pool")
+        for idx, (start, stop) in enumerate(ranges):
+            page_texts = [""] * (stop - start)
+            for attempt in range(3):
+                if workers is None: pool = _get_pdf_pool() # Recycled meanwhile if a concurrent extraction timed out
+                future_pool, future = futures[(start, stop)]
+                try:
+                    page_texts = future.result(timeout=range_timeout)
+                except (CancelledError, BrokenProcessPool) as e: # Left on a pool recycled after a timeout (maybe a concurrent extraction's)
+                    if attempt == 2:
+                        logger.warning(f"PDF pages {start + 1}-{stop} of {file_path} could not be extracted: {type(e).__name__}"); break
+                    submit((start, stop)); resubmit_cancelled(ranges[idx + 1:]); continue
+                except FutureTimeoutError:
+                    if attempt < 2 and future_pool is not pool:
+                        continue # Queued behind the stuck worker of a recycled pool: it is reaped, then this range resubmitted
+                    logger.warning(f"PDF pages {start + 1}-{stop} of {file_path} timed out after {range_timeout:.0f}s, skipping them")
+                    if future_pool is pool:
+                        pool = _recycle_pdf_pool(pool, future, workers, grace=range_timeout)
+                        resubmit_cancelled(ranges[idx + 1:])
+                except Exception as e:
+                    logger.warning(f"PDF pages {start + 1}-{stop} of {file_path} failed to extract: {e}")
+                break
+            yield from page_texts
+    finally:
+        if workers is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
 
 def extract_text(file_path, filename):
-    # ... (Keep this function exactly as it was in your working version) ...
-    ext = filename.lower().split('.')[-1]; text = ""
+    ext = filename.lower().split('.')[-1]; parts = []
     logger.info(f"Attempting to extract text from {filename} (type: {ext})")
     try:
         if ext == "pdf":
-            with open(file_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                if reader.is_encrypted: logger.warning(f"Encrypted PDF: {filename}"); return ""
-                for page in reader.pages: text += (page.extract_text() or "") + "\n"
+            parts = list(iter_pdf_pages(file_path))
         elif ext in ["ppt", "pptx"]:
             if not PPTX_AVAILABLE: logger.warning(f"PPT/PPTX skip: {filename}"); return ""
             prs = Presentation(file_path)
             for slide in prs.slides:
                 for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text: text += shape.text + "\n"
+                    if hasattr(shape, "text") and shape.text: parts.append(shape.text)
         elif ext == "txt":
-             with open(file_path, "r", encoding='utf-8', errors='ignore') as f: text = f.read()
+             with open(file_path, "r", encoding='utf-8', errors='ignore') as f: parts = [f.read()]
         else: logger.warning(f"Unsupported type: {ext}"); return ""
+        text = "\n".join(parts)
         logger.info(f"Extracted ~{len(text)} chars from {filename}")
         return text.strip()
     except FileNotFoundError: logger.error(f"File not found for extraction: {file_path}"); return ""
     except Exception as e: logger.exception(f"Error extracting text from {filename}: {e}"); return ""
 
 
-def summarize_text(text, max_length=15000): # Max length of INPUT text to summarize
-    # ... (Keep this function exactly as it was) ...
-    if not client: logger.error("OpenAI client NI. Cannot summarize."); return "OpenAI client error."
+def summarize_text(text, max_tokens=SUMMARY_INPUT_MAX_TOKENS, fresh=False): # Max tokens of INPUT text to summarize
+    if not gateway.available: logger.error("OpenAI client NI. Cannot summarize."); return "OpenAI client error."
     if not text or not text.strip(): logger.warning("No text to summarize."); return ""
-    if len(text) > max_length: logger.warning(f"Text too long ({len(text)}), truncating to {max_length} for summary."); text = text[:max_length]
+    trimmed = trim_to_tokens(text, max_tokens)
+    if len(trimmed) < len(text): logger.warning(f"Text too long ({len(text)} chars), truncating to {max_tokens} tokens for summary."); text = trimmed
     try:
-        logger.info("Requesting summarization from OpenAI...");
         prompt_message = f"Provide a concise summary (100-150 words) of the following educational material:\n\n{text}\n\nSummary:"
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": "You are an expert summarizer of educational content."}, {"role": "user", "content": prompt_message}],
-            temperature=0.3, max_tokens=250, n=1, stop=None,
+        messages = [{"role": "system", "content": "You are an expert summarizer of educational content."}, {"role": "user", "content": prompt_message}]
+        params = {"temperature": 0.3, "max_tokens": 250, "n": 1, "stop": None}
+        cache_key = response_cache_key("gpt-3.5-turbo", messages, params)
+        cached = None if fresh else get_cached_response(cache_key)
+        if cached: logger.info("Summary served from the response cache."); return cached[0]
+        logger.info("Requesting summarization from OpenAI...");
+        response = gateway.chat(
+            messages, priority=PRIORITY_BACKGROUND, # Material ingestion runs in the background and yields to interactive calls
+            model="gpt-3.5-turbo", **params,
         )
         summary = response.choices[0].message.content.strip(); logger.info("Summarization successful.")
+        store_cached_response(cache_key, "gpt-3.5-turbo", summary, response.usage.model_dump() if response.usage else None, SUMMARY_CACHE_TTL)
         return summary
     except Exception as e: logger.exception(f"Error summarizing with OpenAI: {e}"); return "Error during summarization."
 
 
-def generate_ai_response(system_prompt, user_prompt):
-    # ... (Keep this function exactly as it was, ensure it returns content, usage_dict) ...
-    if not client: logger.error("OpenAI client NI. Cannot generate."); return "OpenAI client error.", None
+def generate_ai_response(system_prompt, user_prompt, priority=PRIORITY_NORMAL, timeout=None, cache_ttl=None, fresh=False, cache_if=None):
+    """
+    Returns (content, usage_dict), or (error message, None) on failure.
+    priority and timeout (whole-call budget in seconds) are passed to the LLM gateway.
+    With cache_ttl (seconds) the response is served from / stored in the persistent response cache
+    (usage then carries "cached": True on a hit); fresh=True skips the lookup but refreshes the entry.
+    cache_if(content) -> bool can veto storing a response (e.g. one the caller cannot parse).
+    """
+    if not gateway.available: logger.error("OpenAI client NI. Cannot generate."); return "OpenAI client error.", None
     if not user_prompt: return "User prompt required.", None
     try:
         logger.info("Requesting AI response...")
         if not isinstance(system_prompt, str): logger.warning(f"System prompt type {type(system_prompt)}, converting."); system_prompt = str(system_prompt)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Consider gpt-3.5-turbo-0125 for better instruction following if available
-            messages=[ {"role": "system", "content": system_prompt or "You are a helpful AI assistant."}, {"role": "user", "content": user_prompt}],
-            temperature=0.7, max_tokens=1500, n=1, stop=None, # Increased max_tokens for student chat
-        )
+        messages = [ {"role": "system", "content": system_prompt or "You are a helpful AI assistant."}, {"role": "user", "content": user_prompt}]
+        params = {"temperature": 0.7, "max_tokens": CHAT_MAX_TOKENS, "n": 1, "stop": None} # Increased max_tokens for student chat
+        model = "gpt-3.5-turbo" # Consider gpt-3.5-turbo-0125 for better instruction following if available
+        cache_key = response_cache_key(model, messages, params) if cache_ttl else None
+        cached = get_cached_response(cache_key) if cache_key and not fresh else None
+        if cached: return cached[0], dict(cached[1] or {}, cached=True)
+        response = gateway.chat(messages, priority=priority, timeout=timeout, model=model, **params)
         content = response.choices[0].message.content.strip()
         usage = response.usage.model_dump() if response.usage else None
         logger.info(f"AI response OK. Usage: {usage}")
+        if cache_key and (cache_if is None or cache_if(content)): store_cached_response(cache_key, model, content, usage, cache_ttl)
         return content, usage
+    except LLMUnavailable as e: logger.error(f"AI response unavailable: {e}"); return str(e), None
     except Exception as e: logger.exception(f"Error generating AI response: {e}"); return f"Error: {e}", None
 
+def stream_ai_response(system_prompt, user_prompt, priority=PRIORITY_INTERACTIVE, timeout=None):
+    """
+    Streaming counterpart of generate_ai_response. Yields ("token", text) as content deltas arrive,
+    then exactly one final ("usage", usage_dict) or ("error", message) event.
+    """
+    if not gateway.available: logger.error("OpenAI client NI. Cannot stream."); yield ("error", "OpenAI client error."); return
+    if not user_prompt: yield ("error", "User prompt required."); return
+    usage = None; started = time.monotonic(); first_token_at = None
+    try:
+        logger.info("Requesting streamed AI response...")
+        if not isinstance(system_prompt, str): system_prompt = str(system_prompt)
+        stream = gateway.stream_chat(
+            [ {"role": "system", "content": system_prompt or "You are a helpful AI assistant."}, {"role": "user", "content": user_prompt}],
+            priority=priority, timeout=timeout,
+            model="gpt-3.5-turbo", temperature=0.7, max_tokens=CHAT_MAX_TOKENS, n=1, stop=None,
+            stream_options={"include_usage": True}, # Usage arrives in a last chunk with no choices
+        )
+        try:
+            for chunk in stream:
+                if chunk.usage: usage = chunk.usage.model_dump()
+                if not chunk.choices: continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic(); logger.info(f"First streamed token after {first_token_at - started:.2f}s")
+                    yield ("token", delta)
+        finally:
+            stream.close() # Client disconnected or finished: frees the gateway slot and the upstream HTTP connection
+    except LLMUnavailable as e:
+        logger.error(f"Streamed AI response unavailable: {e}"); yield ("error", str(e)); return
+    except Exception as e:
+        logger.exception(f"Error streaming AI response: {e}"); yield ("error", f"Error: {e}"); return
+    logger.info(f"Streamed AI response OK in {time.monotonic() - started:.2f}s. Usage: {usage}")
+    yield ("usage", usage)
+
+
+# --- Prompt compilation ---
+# A prompt structure is "compiled" once into a list of segments: ("text", content) for plain
+# instruction blocks and ("material", material_id, filename, instruction) for material blocks.
+# Rendering a compiled prompt only needs the (cached) retrieval index of each material, so the
+# per-question hot path does no large-text queries.
+MATERIAL_PLACEHOLDER_PREFIX = "[USE_FULL_TEXT_FROM_MATERIAL_ID:"
+COMPILED_PROMPT_CACHE_SIZE = int(os.getenv("COMPILED_PROMPT_CACHE_SIZE", "256"))
+_compiled_prompt_cache = LRUCache(COMPILED_PROMPT_CACHE_SIZE, name="compiled_prompt")
+
+def _structure_material_ids(prompt_structure):
+    return tuple(sorted({
+        str(block.get('materialId')) for block in prompt_structure
+        if isinstance(block, dict) and block.get('isMaterialBlock') and block.get('materialId')
+    }))
+
+def compile_prompt_structure(prompt_structure):
+    """Resolves a prompt structure into segments. Looks up all referenced materials in one query."""
+    material_ids = _structure_material_ids(prompt_structure)
+    materials = {}
+    if material_ids:
+        rows = db.session.execute(
+            db.select(Material.id, Material.filename)
+            .filter(Material.id.in_(material_ids), Material.extracted_text != None, Material.extracted_text != "")
+        ).all()
+        materials = {row.id: row.filename for row in rows}
+
+    segments = []
+    for block in prompt_structure:
+        if isinstance(block, dict):
+            block_content = str(block.get('content', ''))
+            material_id = block.get('materialId', None)
+            if block.get('isMaterialBlock', False) and material_id:
+                if str(material_id) in materials:
+                    # Keep the block's own instruction unless it is only the placeholder
+                    instruction = "" if block_content.startswith(MATERIAL_PLACEHOLDER_PREFIX) else block_content
+                    segments.append(("material", str(material_id), materials[str(material_id)], instruction))
+                else:
+                    logger.warning(f"Material ID {material_id} not found or has no extracted text. Placeholder block content used: '{block_content}'")
+                    segments.append(("text", block_content)) # Fallback to stored block content
+            else:
+                segments.append(("text", block_content))
+        elif isinstance(block, str): # Handle simple string blocks if needed
+            segments.append(("text", block))
+        else:
+            logger.warning(f"Skipping invalid block in prompt structure during final prompt construction: {block}")
+    return segments
+
+def render_compiled_prompt(segments, user_question):
+    """
+    Builds the system prompt from compiled segments within the request's token budget (see prompt_budget.py).
+    With a user_question each material block gets the chunks most relevant to it (see retrieval.py);
+    without one it gets the material's opening text.
+    """
+    blocks = []
+    for segment in segments:
+        if segment[0] == "text":
+            blocks.append(Instruction(segment[1])); continue
+        _, material_id, filename, instruction = segment
+        try:
+            chunks = ranked_chunks(material_id, user_question)
+        except Exception as e:
+            logger.exception(f"Error retrieving context of material ID {material_id} for prompt: {e}")
+            chunks = []
+        blocks.append(MaterialContext(filename, instruction, chunks))
+    budget = prompt_token_budget(user_question, CHAT_MAX_TOKENS) # The question is the user message; the reply gets CHAT_MAX_TOKENS
+    return assemble_system_prompt(blocks, budget)
+
+def _materials_ready(material_ids):
+    """True if every material still exists and is ready. One primary-key lookup."""
+    ready = db.session.execute(
+        db.select(db.func.count(Material.id)).filter(Material.id.in_(material_ids), Material.status == 'ready')
+    ).scalar()
+    return ready == len(material_ids)
+
+def get_compiled_prompt(prompt):
+    """
+    Compiled segments for a saved Prompt, cached by (prompt id, updated_at, material ids). Segments with a
+    material that has no text yet (still being ingested) are not cached: finishing ingestion changes none of
+    the key's parts, and the cache is per process, so the placeholder would otherwise stick.
+    For the same reason a hit is checked against the materials: one deleted (or re-ingesting) through another
+    worker is only invalidated in that worker's cache, so the entry is dropped and the prompt recompiled.
+    """
+    structure = prompt.structure if isinstance(prompt.structure, list) else []
+    material_ids = _structure_material_ids(structure)
+    key = (prompt.id, prompt.updated_at, material_ids)
+    segments = _compiled_prompt_cache.get(key)
+    if segments is not None and material_ids and not _materials_ready(material_ids):
+        logger.info(f"Prompt {prompt.id}: a material changed since it was compiled, recompiling")
+        for material_id in material_ids:
+            invalidate_material_index(material_id)
+        invalidate_compiled_prompt(prompt.id); segments = None
+    if segments is None:
+        segments = compile_prompt_structure(structure)
+        resolved = {segment[1] for segment in segments if segment[0] == "material"}
+        if resolved.issuperset(material_ids):
+            invalidate_compiled_prompt(prompt.id) # Drop entries for older versions of this prompt
+            _compiled_prompt_cache.set(key, segments)
+        else:
+            logger.info(f"Prompt {prompt.id}: {len(set(material_ids) - resolved)} material(s) not ready, compiled without caching")
+    return segments
+
+def invalidate_compiled_prompt(prompt_id):
+    _compiled_prompt_cache.pop_where(lambda key: key[0] == prompt_id)
+
+def invalidate_compiled_prompts_for_material(material_id):
+    _compiled_prompt_cache.pop_where(lambda key: material_id in key[2])
 
-# --- MODIFIED: construct_final_prompt ---
 def construct_final_prompt(prompt_structure, user_question):
     """
     Constructs the final system prompt string from the saved structure,
-    replacing material placeholders with their full (truncated) text.
+    replacing material placeholders with material text. With a user_question the
+    most relevant chunks are retrieved; without one the opening text is used.
     """
-    final_prompt_parts = []
     logger.debug(f"Constructing final prompt from structure: {prompt_structure}")
 
     if not isinstance(prompt_structure, list):
@@ -121,58 +404,13 @@ def construct_final_prompt(prompt_structure, user_question):
     if not DATABASE_ACCESS_AVAILABLE: # Fallback if Material model couldn't be imported
         logger.error("Database access not available in construct_final_prompt. Cannot resolve material placeholders.")
         # Proceed by just joining content, placeholders will remain as text.
+        final_prompt_parts = []
         for block in prompt_structure:
             if isinstance(block, dict) and 'content' in block: final_prompt_parts.append(str(block['content']))
             elif isinstance(block, str): final_prompt_parts.append(block)
         system_prompt = "\n\n".join(final_prompt_parts)
         return system_prompt, user_question
 
-    # Iterate through the blocks provided by the teacher
-    for block in prompt_structure:
-        if isinstance(block, dict):
-            block_content = str(block.get('content', ''))
-            is_material_block = block.get('isMaterialBlock', False)
-            material_id = block.get('materialId', None)
-
-            # Check if it's a material placeholder to be replaced
-            # The content should look like: "[USE_FULL_TEXT_FROM_MATERIAL_ID:xxxx-xxxx-xxxx]"
-            # Or use the isMaterialBlock flag and materialId field
-            if is_material_block and material_id:
-                logger.info(f"Found material placeholder for Material ID: {material_id}")
-                try:
-                    # Fetch the Material object from the database
-                    material_obj = db.session.get(Material, material_id) # Use session.get
-                    if material_obj and material_obj.extracted_text:
-                        logger.debug(f"Material '{material_obj.filename}' found. Using its extracted text.")
-                        full_text = material_obj.extracted_text
-                        truncated_text = full_text[:MAX_CHARS_PER_MATERIAL_CONTEXT]
-                        if len(full_text) > MAX_CHARS_PER_MATERIAL_CONTEXT:
-                            logger.warning(f"Material '{material_obj.filename}' text (len {len(full_text)}) was truncated to {MAX_CHARS_PER_MATERIAL_CONTEXT} chars.")
-                        # Replace placeholder text or prepend/append material context
-                        # For now, let's assume the block_content itself might contain some instruction like "Based on material X:"
-                        # So we append the truncated text.
-                        # A more robust way would be for the block_content to ONLY be the placeholder ID,
-                        # and we construct the text "Context from [Material Name]:\n[Truncated Text]" here.
-                        # For current structure where block_content might be "[USE_...]", let's just append.
-                        final_prompt_parts.append(f"\n\n--- Context from Material: {material_obj.filename} ---\n{truncated_text}\n--- End Context from Material: {material_obj.filename} ---\n\n")
-                        # Also add the original instruction block content if it's not just the placeholder
-                        if not block_content.startswith("[USE_FULL_TEXT_FROM_MATERIAL_ID:"):
-                            final_prompt_parts.append(block_content)
-
-                    else:
-                        logger.warning(f"Material ID {material_id} not found or has no extracted text. Placeholder block content used: '{block_content}'")
-                        final_prompt_parts.append(block_content) # Fallback to stored block content
-                except Exception as e:
-                    logger.exception(f"Error fetching/processing material ID {material_id} for prompt: {e}")
-                    final_prompt_parts.append(block_content) # Fallback
-            else:
-                # It's a regular text block, just add its content
-                final_prompt_parts.append(block_content)
-        elif isinstance(block, str): # Handle simple string blocks if needed
-             final_prompt_parts.append(block)
-        else:
-            logger.warning(f"Skipping invalid block in prompt structure during final prompt construction: {block}")
-
-    system_prompt = "\n\n".join(filter(None, final_prompt_parts)) # Join non-empty parts
+    system_prompt = render_compiled_prompt(compile_prompt_structure(prompt_structure), user_question)
     logger.debug(f"Constructed System Prompt (length {len(system_prompt)}):\n{system_prompt[:500]}...") # Log beginning of prompt
-    return system_prompt, user_question
\ No newline at end of file
+    return system_prompt, user_question
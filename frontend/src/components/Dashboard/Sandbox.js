@@ -1,6 +1,6 @@
 // frontend/src/components/Dashboard/Sandbox.jsx
 import React, { useState, useEffect } from 'react';
-import { generateTestResponse } from '../../services/api';
+import { generateTestResponseStream } from '../../services/api';
 import { FaPaperPlane, FaSpinner, FaVial, FaLightbulb, FaBroom } from 'react-icons/fa';
 import '../../styles/TeacherDashboard.css';
 import '../../styles/Sandbox.css';
@@ -56,9 +56,9 @@ function Sandbox({
     };
 
     try {
-      const response = await generateTestResponse(payload);
-      setAiResponse(response.data.response);
-      setUsageInfo(response.data.usage);
+      const result = await generateTestResponseStream(payload, (text) => setAiResponse(prev => prev + text));
+      setAiResponse(result.response);
+      setUsageInfo(result.usage);
       if (showSuccess) showSuccess("AI response received successfully.");
     } catch (error) {
       console.error('Sandbox generation error:', error);
@@ -114,8 +114,8 @@ function Sandbox({
 
       <div className="sandbox-output-area">
         <strong>AI Response:</strong>
-        {isLoading && <div className="loading-indicator-sandbox"><FaSpinner className="spin" /> Thinking...</div>}
-        {aiResponse && !isLoading && <pre className="ai-response-text">{aiResponse}</pre>}
+        {isLoading && !aiResponse && <div className="loading-indicator-sandbox"><FaSpinner className="spin" /> Thinking...</div>}
+        {aiResponse && <pre className="ai-response-text">{aiResponse}</pre>}
         {!aiResponse && !isLoading && <p className="empty-list-message" style={{ padding: '1rem', fontSize: '0.9em' }}>(AI's response will appear here)</p>}
         {usageInfo && (
           <p className="usage-info">
@@ -1,14 +1,16 @@
 // frontend/src/components/Dashboard/TeacherAnalyticsOverview.js
 import React, { useState, useEffect, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getTeacherQuizzes } from '../../services/api'; // We need to fetch quizzes
-import { FaChartBar, FaSpinner, FaSearch, FaEye, FaEyeSlash } from 'react-icons/fa';
+import { getTeacherAnalyticsOverview } from '../../services/api'; // Served from the analytics rollups
+import { FaChartBar, FaSpinner, FaSearch, FaEye, FaEyeSlash, FaUsers, FaPercentage, FaExclamationTriangle } from 'react-icons/fa';
 // Styles can be shared or new
 import '../../styles/TeacherDashboard.css'; // For .page-header, .widget etc.
 import '../../styles/QuizComponents.css';   // For .quiz-table or .items-grid if reusing
 
 function TeacherAnalyticsOverview() {
     const [quizzes, setQuizzes] = useState([]);
+    const [totals, setTotals] = useState(null);
+    const [weakestQuestions, setWeakestQuestions] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState('');
     const [searchTerm, setSearchTerm] = useState('');
@@ -18,8 +20,10 @@ function TeacherAnalyticsOverview() {
         setIsLoading(true);
         setError('');
         try {
-            const response = await getTeacherQuizzes();
-            setQuizzes(response.data || []);
+            const response = await getTeacherAnalyticsOverview();
+            setQuizzes(response.data?.quizzes || []);
+            setTotals(response.data?.totals || null);
+            setWeakestQuestions(response.data?.weakest_questions || []);
         } catch (err) {
             console.error("Error fetching quizzes for analytics:", err);
             setError(err.response?.data?.error || "Could not load your quizzes list.");
@@ -37,6 +41,8 @@ function TeacherAnalyticsOverview() {
         navigate(`/teacher/dashboard/quizzes/results/${quizId}`);
     };
 
+    const formatPercent = (value) => (value === null || value === undefined ? 'N/A' : `${(value * 100).toFixed(0)}%`);
+
     const filteredQuizzes = quizzes.filter(quiz =>
         quiz.title.toLowerCase().includes(searchTerm.toLowerCase())
     );
@@ -50,6 +56,40 @@ function TeacherAnalyticsOverview() {
 
             {error && <div className="message error-message global-message">{error}</div>}
 
+            {totals && (
+                <div className="analytics-summary-cards">
+                    <div className="summary-card">
+                        <FaChartBar className="summary-card-icon" />
+                        <div className="summary-card-value">{totals.quiz_count}</div>
+                        <div className="summary-card-label">Quizzes ({totals.published_count} published)</div>
+                    </div>
+                    <div className="summary-card">
+                        <FaUsers className="summary-card-icon" />
+                        <div className="summary-card-value">{totals.attempt_count}</div>
+                        <div className="summary-card-label">Total Attempts</div>
+                    </div>
+                    <div className="summary-card">
+                        <FaPercentage className="summary-card-icon" />
+                        <div className="summary-card-value">{totals.average_score !== null ? `${totals.average_score.toFixed(1)}%` : 'N/A'}</div>
+                        <div className="summary-card-label">Average Score</div>
+                    </div>
+                </div>
+            )}
+
+            {weakestQuestions.length > 0 && (
+                <div className="widget question-stats-widget">
+                    <h3><FaExclamationTriangle /> Weakest Questions</h3>
+                    <ul>
+                        {weakestQuestions.map(q => (
+                            <li key={q.question_id}>
+                                <strong>{q.question_text.length > 80 ? `${q.question_text.substring(0, 80)}...` : q.question_text}</strong>
+                                {' '}({q.quiz_title}) - Correct: {formatPercent(q.correct_rate)} of {q.answer_count} answers
+                            </li>
+                        ))}
+                    </ul>
+                </div>
+            )}
+
             <div className="widget">
                 <h3><FaSearch /> Select a Quiz to View Analytics</h3>
                 <div className="form-group" style={{ maxWidth: '400px', marginBottom: '1.5rem' }}>
@@ -76,7 +116,9 @@ function TeacherAnalyticsOverview() {
                                 <div className="quiz-info">
                                     <span className="quiz-title">{quiz.title}</span>
                                     <span className="quiz-meta">
-                                        {quiz.question_count || 0} Questions
+                                        {quiz.question_count || 0} Questions · {quiz.attempt_count} Attempts
+                                        {quiz.average_score !== null && ` · Avg ${quiz.average_score.toFixed(0)}%`}
+                                        {quiz.completion_rate !== null && ` · Completion ${formatPercent(quiz.completion_rate)}`}
                                         {quiz.is_published ? <span className="status published"><FaEye/> Published</span> : <span className="status draft"><FaEyeSlash/> Draft</span>}
                                     </span>
                                 </div>
@@ -30,6 +30,17 @@ function QuizResultStudent() {
       .finally(() => setIsLoading(false));
   }, [attemptId, showError]);
 
+  // Deferred feedback: poll until the background job has filled in every answer
+  useEffect(() => {
+    if (attemptDetails?.feedback_status !== 'pending') return undefined;
+    const timer = setTimeout(() => {
+      getStudentAttemptDetails(attemptId)
+        .then(response => setAttemptDetails(response.data))
+        .catch(err => console.error(err));
+    }, 3000);
+    return () => clearTimeout(timer);
+  }, [attemptId, attemptDetails]);
+
   const handleClose = () => { navigate('/student/dashboard'); };
 
   const scorePct = useMemo(() => {
@@ -99,6 +110,12 @@ function QuizResultStudent() {
                 <strong>Your Answer:</strong> {answer.answer_text || "Not answered"}
               </p>
 
+              {answer.is_correct === false && answer.feedback_status === 'pending' && (
+                <div className="ai-feedback-result">
+                  <p><FaSpinner className="spin" /> AI feedback is being generated...</p>
+                </div>
+              )}
+
               {answer.is_correct === false && answer.ai_feedback && (
                 <div className="ai-feedback-result">
                   <p><strong><FaLightbulb /> AI Feedback:</strong> {answer.ai_feedback}</p>
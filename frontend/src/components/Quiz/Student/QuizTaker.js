@@ -79,16 +79,10 @@ function QuizTaker() {
 
     setIsSubmitting(true); setError('');
 
-    // transform to expected payload: choice_text
+    // payload: { question_id: choice_id } (graded by id on the server)
     const payload = {};
     for (const question of quizData.questions) {
-      const selectedChoiceId = studentAnswers[question.id];
-      if (selectedChoiceId) {
-        const selectedChoice = question.choices.find(c => c.id === selectedChoiceId);
-        payload[question.id] = selectedChoice ? selectedChoice.choice_text : null;
-      } else {
-        payload[question.id] = null;
-      }
+      payload[question.id] = studentAnswers[question.id] || null;
     }
 
     try {
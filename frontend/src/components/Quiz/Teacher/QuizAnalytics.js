@@ -1,7 +1,7 @@
 // frontend/src/components/Quiz/Teacher/QuizAnalytics.js
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getTeacherQuizDetails, getTeacherQuizAttempts } from '../../../services/api';
+import { getTeacherQuizDetails, getTeacherQuizAttempts, getTeacherQuizAnalytics } from '../../../services/api';
 import { FaArrowLeft, FaChartBar, FaSpinner, FaUsers, FaCheckCircle, FaPercentage, FaQuestionCircle, FaRegListAlt } from 'react-icons/fa';
 import '../../../styles/QuizComponents.css'; // Styles for analytics
 import '../../../styles/TeacherDashboard.css'; // General dashboard styles
@@ -13,57 +13,6 @@ function QuizAnalytics() {
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState('');
 
-    // --- Helper to calculate overall and per-question stats ---
-    const calculateAnalytics = useCallback((quiz, studentAttempts) => {
-        if (!quiz || !quiz.questions || studentAttempts.length === 0) {
-            return {
-                averageScore: 0,
-                totalAttempts: studentAttempts.length,
-                completionRate: 0, // Needs total assigned students for true rate
-                questionStats: quiz?.questions?.map(q => ({ id: q.id, text: q.question_text, correctPercentage: 0, totalAnswers: 0, correctAnswers: 0 })) || []
-            };
-        }
-
-        let totalScoreSum = 0;
-        const questionStatsMap = {};
-        quiz.questions.forEach(q => {
-            questionStatsMap[q.id] = {
-                id: q.id,
-                text: q.question_text,
-                type: q.question_type,
-                correctPercentage: 0,
-                totalAnswers: 0, // Total students who answered this question
-                correctAnswers: 0, // Total students who answered this question correctly
-                // choices: q.choices // Could be used for most common wrong answers later
-            };
-        });
-
-        studentAttempts.forEach(attempt => {
-            if (attempt.score !== null) {
-                totalScoreSum += attempt.score;
-            }
-            // Assuming attempt.answers is an array of { question_id, is_correct, answer_text }
-            // This part depends on the structure returned by /api/teachers/quizzes/<quiz_id>/attempts
-            // For now, we'll assume the main attempt object has score, and we might need to fetch individual answer details if not directly available.
-            // Let's assume the backend `/api/teachers/quizzes/<quiz_id>/attempts` returns attempts with basic score,
-            // and we can't easily get per-question correctness without fetching each attempt's full details.
-            // So, per-question stats will be simplified for now.
-            // A more advanced version would fetch all StudentAnswer records for this quiz.
-        });
-
-        // For per-question stats, we'd ideally query StudentAnswer table aggregated by question_id for this quiz.
-        // This is a simplified placeholder if we don't have that endpoint yet.
-        // The current `getTeacherQuizAttempts` returns list of StudentQuizAttempt. We need details of their answers.
-        // This will be an area for future backend improvement. For now, focus on overall stats.
-
-        return {
-            averageScore: studentAttempts.length > 0 ? (totalScoreSum / studentAttempts.length) : 0,
-            totalAttempts: studentAttempts.length,
-            questionStats: Object.values(questionStatsMap) // Placeholder for now
-        };
-    }, []);
-
-
     const [analyticsData, setAnalyticsData] = useState(null);
 
     useEffect(() => {
@@ -77,20 +26,15 @@ function QuizAnalytics() {
             setIsLoading(true);
             setError('');
             try {
-                // Fetch quiz details (to get title, questions etc.)
-                const quizDetailsRes = await getTeacherQuizDetails(quizId);
+                // Statistics are aggregated on the server; the attempts list is only used for the table
+                const [quizDetailsRes, attemptsRes, analyticsRes] = await Promise.all([
+                    getTeacherQuizDetails(quizId),
+                    getTeacherQuizAttempts(quizId),
+                    getTeacherQuizAnalytics(quizId),
+                ]);
                 setQuizDetails(quizDetailsRes.data);
-                console.log("Quiz Details for Analytics:", quizDetailsRes.data);
-
-                // Fetch all student attempts for this quiz
-                const attemptsRes = await getTeacherQuizAttempts(quizId);
                 setAttempts(attemptsRes.data || []);
-                console.log("Quiz Attempts for Analytics:", attemptsRes.data);
-
-                // Calculate analytics once both are fetched
-                if (quizDetailsRes.data && attemptsRes.data) {
-                    setAnalyticsData(calculateAnalytics(quizDetailsRes.data, attemptsRes.data));
-                }
+                setAnalyticsData(analyticsRes.data);
 
             } catch (err) {
                 console.error("Error fetching quiz analytics data:", err);
@@ -100,9 +44,11 @@ function QuizAnalytics() {
             }
         };
         fetchData();
-    }, [quizId, calculateAnalytics]); // Add calculateAnalytics to dependencies
+    }, [quizId]);
 
 
+    const formatPercent = (value) => (value === null || value === undefined ? 'N/A' : `${(value * 100).toFixed(0)}%`);
+
     const formatDate = (dateString) => {
         if (!dateString) return 'N/A';
         try { return new Date(dateString).toLocaleString(); } // Full date and time
@@ -141,15 +87,19 @@ function QuizAnalytics() {
             <div className="analytics-summary-cards">
                 <div className="summary-card">
                     <FaUsers className="summary-card-icon" />
-                    <div className="summary-card-value">{analyticsData.totalAttempts}</div>
+                    <div className="summary-card-value">{analyticsData.summary.attempt_count}</div>
                     <div className="summary-card-label">Total Attempts</div>
                 </div>
                 <div className="summary-card">
                     <FaPercentage className="summary-card-icon" />
-                    <div className="summary-card-value">{analyticsData.averageScore.toFixed(1)}%</div>
+                    <div className="summary-card-value">{(analyticsData.summary.average ?? 0).toFixed(1)}%</div>
                     <div className="summary-card-label">Average Score</div>
                 </div>
-                {/* Add more summary cards: e.g., Pass Rate (if defined), Most Difficult Question (later) */}
+                <div className="summary-card">
+                    <FaCheckCircle className="summary-card-icon" />
+                    <div className="summary-card-value">{analyticsData.percentiles.p50 !== null ? `${analyticsData.percentiles.p50.toFixed(1)}%` : 'N/A'}</div>
+                    <div className="summary-card-label">Median Score</div>
+                </div>
             </div>
 
             {/* --- List of Student Attempts --- */}
@@ -193,22 +143,60 @@ function QuizAnalytics() {
                 )}
             </div>
 
-            {/* --- Per-Question Statistics (Simplified for now) --- */}
-            {/* This section will need more backend work to be truly useful (aggregating all StudentAnswer records) */}
-            {/* <div className="widget question-stats-widget">
-                <h3><FaQuestionCircle/> Question Performance (Overview)</h3>
-                {analyticsData.questionStats.length === 0 ? (
-                    <p>No question data available.</p>
-                ) : (
+            {/* --- Score Distribution --- */}
+            {analyticsData.summary.attempt_count > 0 && (
+                <div className="widget question-stats-widget">
+                    <h3><FaChartBar/> Score Distribution</h3>
+                    <p>
+                        P10: {analyticsData.percentiles.p10.toFixed(1)}% · P25: {analyticsData.percentiles.p25.toFixed(1)}% ·
+                        P75: {analyticsData.percentiles.p75.toFixed(1)}% · P90: {analyticsData.percentiles.p90.toFixed(1)}%
+                    </p>
                     <ul>
-                        {analyticsData.questionStats.map(qStat => (
-                            <li key={qStat.id}>
-                                <strong>Q: {qStat.text.substring(0,60)}...</strong> - Correct: {qStat.correctPercentage.toFixed(0)}%
-                            </li>
+                        {analyticsData.score_histogram.map(bucket => (
+                            <li key={bucket.from}>{bucket.from}–{bucket.to}%: <strong>{bucket.count}</strong></li>
                         ))}
                     </ul>
+                </div>
+            )}
+
+            {/* --- Per-Question Statistics --- */}
+            <div className="widget question-stats-widget">
+                <h3><FaQuestionCircle/> Question Performance</h3>
+                {analyticsData.questions.length === 0 ? (
+                    <p>No question data available.</p>
+                ) : (
+                    <div className="table-container">
+                        <table className="quiz-table analytics-table">
+                            <thead>
+                                <tr>
+                                    <th>Question</th>
+                                    <th>Correct</th>
+                                    <th>Discrimination</th>
+                                    <th>Answer Distribution</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                {analyticsData.questions.map(qStat => (
+                                    <tr key={qStat.id}>
+                                        <td data-label="Question">{qStat.question_text.length > 60 ? `${qStat.question_text.substring(0, 60)}...` : qStat.question_text}</td>
+                                        <td data-label="Correct">{formatPercent(qStat.correct_rate)} ({qStat.correct}/{qStat.answered})</td>
+                                        <td data-label="Discrimination">{qStat.discrimination_index !== null ? qStat.discrimination_index.toFixed(2) : 'N/A'}</td>
+                                        <td data-label="Answers">
+                                            {qStat.choices.map(choice => (
+                                                <div key={choice.id}>
+                                                    {choice.is_correct ? <strong>{choice.choice_text}</strong> : choice.choice_text}: {choice.count} ({formatPercent(choice.share)})
+                                                </div>
+                                            ))}
+                                            {qStat.unanswered > 0 && <div>No answer: {qStat.unanswered}</div>}
+                                            {qStat.other_answers > 0 && <div>Other: {qStat.other_answers}</div>}
+                                        </td>
+                                    </tr>
+                                ))}
+                            </tbody>
+                        </table>
+                    </div>
                 )}
-            </div> */}
+            </div>
         </div>
     );
 }
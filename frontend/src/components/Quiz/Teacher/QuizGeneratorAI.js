@@ -9,6 +9,7 @@ function QuizGeneratorAI({ onQuestionsGenerated, showLoading, hideLoading, showE
     const [customContext, setCustomContext] = useState('');
     const [numQuestions, setNumQuestions] = useState(5); // Default number of questions
     const [difficulty, setDifficulty] = useState('medium'); // Default difficulty
+    const [freshSample, setFreshSample] = useState(false); // Skip the server's response cache
     const [materials, setMaterials] = useState([]);
     const [isLoadingMaterials, setIsLoadingMaterials] = useState(false);
     const [isGenerating, setIsGenerating] = useState(false);
@@ -55,6 +56,7 @@ function QuizGeneratorAI({ onQuestionsGenerated, showLoading, hideLoading, showE
             ...contextPayload, // material_id OR context_text
             num_questions: numQuestions,
             difficulty: difficulty, // Add difficulty to payload
+            fresh: freshSample, // Same inputs normally return the cached question set
             question_types: ["mcq"] // You can make this dynamic later if needed
         };
 
@@ -150,6 +152,12 @@ function QuizGeneratorAI({ onQuestionsGenerated, showLoading, hideLoading, showE
                          <option value="hard">Hard</option>
                      </select>
                  </div>
+                <div className="form-group inline-group">
+                    <label htmlFor="quiz-gen-fresh">
+                        <input type="checkbox" id="quiz-gen-fresh" checked={freshSample} onChange={(e) => setFreshSample(e.target.checked)} disabled={isGenerating} />
+                        {' '}New variation (don't reuse previous results)
+                    </label>
+                </div>
 
                 <button onClick={handleGenerate} className="button primary-button" disabled={isGenerating || (contextType === 'material' && !selectedMaterialId) || (contextType==='text' && !customContext.trim())}>
                     {isGenerating ? <><FaSpinner className="spin" /> Generating...</> : <><FaMagic /> Generate AI Questions</>}
@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect, useMemo, useCallback } from 'react';
-import { askAssistant } from '../../services/api';
+import { askAssistantStream } from '../../services/api';
 import { FaPaperPlane, FaSpinner, FaArrowLeft } from 'react-icons/fa';
 import { createAvatar } from '@dicebear/core';
 import { adventurer, bottts } from '@dicebear/collection';
@@ -68,15 +68,28 @@ function ChatInterface({ promptId, promptName, promptDescription, assistantAvata
     setInputMessage('');
     setIsLoading(true);
 
+    let streamStarted = false;
     try {
-      const response = await askAssistant(promptId, content);
-      const assistantMessage = { role: 'assistant', content: response.data.response };
-      setMessages(prev => [...prev, assistantMessage]);
+      // Tokens are appended to the last (assistant) message as they arrive
+      await askAssistantStream(promptId, content, (text) => {
+        if (!streamStarted) {
+          streamStarted = true;
+          setIsLoading(false);
+          setMessages(prev => [...prev, { role: 'assistant', content: text }]);
+          return;
+        }
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+        });
+      });
     } catch (err) {
       console.error("Error asking assistant:", err);
       const errorMessage = err?.response?.data?.error || "Sorry, I couldn't get a response.";
       setError(errorMessage);
-      setMessages(prev => [...prev, { role: 'assistant', content: `Error: ${errorMessage}` }]);
+      setMessages(prev => (streamStarted
+        ? [...prev.slice(0, -1), { role: 'assistant', content: `Error: ${errorMessage}` }]
+        : [...prev, { role: 'assistant', content: `Error: ${errorMessage}` }]));
     } finally {
       setIsLoading(false);
     }
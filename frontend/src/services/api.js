@@ -39,6 +39,58 @@ api.interceptors.response.use(
 );
 
 
+// --- Streaming (Server-Sent Events) ---
+// axios buffers the whole response, so streamed endpoints are read with fetch.
+// onToken(text) is called for every delta; resolves with { response, usage } once the 'done' event arrives.
+const postStream = async (url, payload, onToken) => {
+  const token = localStorage.getItem('token');
+  const res = await fetch(`${api.defaults.baseURL}${url}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream', ...(token ? { Authorization: `Bearer ${token}` } : {}) },
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok || !res.body) {
+    const data = await res.json().catch(() => ({}));
+    const error = new Error(data.error || `Request failed with status ${res.status}`);
+    error.response = { status: res.status, data }; // Same shape as axios errors for existing handlers
+    throw error;
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let response = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const parsed = JSON.parse(data);
+      if (event === 'token') {
+        response += parsed.text;
+        if (onToken) onToken(parsed.text);
+      } else if (event === 'done') {
+        return { response, usage: parsed.usage };
+      } else if (event === 'error') {
+        const error = new Error(parsed.error);
+        error.response = { status: 502, data: parsed };
+        throw error;
+      }
+    }
+  }
+  throw new Error('Stream ended before the response was complete.');
+};
+
 // --- Auth Service Functions ---
 export const registerUser = (email, password, role = 'student') => api.post('/register', { email, password, role });
 
@@ -52,6 +104,7 @@ export const fetchUserInfo = () => api.get('/user');
 export const uploadMaterial = (formData) => api.post('/upload', formData, { headers: { 'Content-Type': 'multipart/form-data' } });
 export const getMaterials = () => api.get('/materials');
 export const deleteMaterial = (materialId) => api.delete(`/materials/${materialId}`);
+export const getMaterialStatus = (materialId) => api.get(`/materials/${materialId}/status`);
 
 // --- Teacher Prompt Service Functions ---
 export const savePrompt = (promptData) => api.post('/prompts', promptData);
@@ -62,6 +115,7 @@ export const deletePrompt = (promptId) => api.delete(`/prompts/${promptId}`);
 
 // --- Teacher AI Sandbox Function (MODIFIED) ---
 export const generateTestResponse = (payload) => api.post('/generate', payload);
+export const generateTestResponseStream = (payload, onToken) => postStream('/generate/stream', payload, onToken);
 
 // --- Teacher Quiz Generation Function ---
 export const generateQuizQuestionsAI = (data) => {
@@ -78,10 +132,13 @@ export const getTeacherQuizDetails = (quizId) => api.get(`/quizzes/${quizId}`);
 export const updateTeacherQuiz = (quizId, quizData) => api.put(`/quizzes/${quizId}`, quizData);
 export const deleteTeacherQuiz = (quizId) => api.delete(`/quizzes/${quizId}`);
 export const getTeacherQuizAttempts = (quizId) => api.get(`/teachers/quizzes/${quizId}/attempts`);
+export const getTeacherQuizAnalytics = (quizId) => api.get(`/teachers/quizzes/${quizId}/analytics`);
+export const getTeacherAnalyticsOverview = () => api.get('/teachers/analytics/overview');
 
 // --- Student Prompt/Assistant Functions ---
 export const getStudentPrompts = () => api.get('/student/prompts');
 export const askAssistant = (prompt_id, question) => api.post('/student/ask', { prompt_id, question });
+export const askAssistantStream = (prompt_id, question, onToken) => postStream('/student/ask/stream', { prompt_id, question }, onToken);
 
 // --- Student Quiz Functions ---
 export const getStudentQuizzes = () => api.get('/student/quizzes');